@@ -0,0 +1,276 @@
+from glob import glob
+from typing import List, Tuple
+import mmap
+import os
+import struct
+import numpy as np
+
+try:
+    from numeratedkb import (
+        BinaryMap, KbException, NumerationMap, encodeBinaryMap, iterateMapEntries, parseRelFilePath, writeRelFile
+    )
+except ImportError:
+    from common.numeratedkb import (
+        BinaryMap, KbException, NumerationMap, encodeBinaryMap, iterateMapEntries, parseRelFilePath, writeRelFile
+    )
+
+"""
+This file defines the single-file container of a numerated KB ('<KB name>.nkb') and the conversion between the container
+and the directory format. The layout of a container is (all integers are little-endian):
+    - Header:       magic 'NKB\\0', version, header size, reserved, #relations, directory offset, directory size, map
+                    offset, map size, max numeration, #mappings
+    - Directory:    one entry per relation: numeration (uint64), arity (uint16), integer width in bytes (uint16),
+                    #records (uint64), offset of the records (uint64), name size (uint32), followed by the UTF-8 name
+    - Relations:    the records of each relation, in the same layout as the '.rel' file, aligned to 64 bytes. Ids
+                    are 4 or 8 bytes wide, as in the '.rel' files, but 2-byte ids are widened to 4 bytes so that
+                    relations are read as int32 or int64 arrays without copying
+    - Map:          the numeration map in the binary map format ('encodeBinaryMap' in 'numeratedkb'), including the hash
+                    table for looking up names
+The container is opened by a single memory map, and relations and names are read as views on the map.
+"""
+
+CONTAINER_EXTENSION = ".nkb"
+
+_MAGIC = b"NKB\x00"
+_VERSION = 3
+_HEADER_FORMAT = '<4sIII7Q'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_ENTRY_FORMAT = '<QHHQQI'
+_ENTRY_SIZE = struct.calcsize(_ENTRY_FORMAT)
+_BLOCK_ALIGNMENT = 64
+_MAX_MAP_ENTRIES = 1000000
+
+def getContainerPath(kbName: str, basePath: str) -> str:
+    """
+    Return the path of the container of a KB.
+
+    Parameters:
+        kbName:     The name of the KB.
+        basePath:   The base path where the KB is located.
+
+    Returns:
+        The file path
+    """
+    return os.path.join(basePath, kbName + CONTAINER_EXTENSION)
+
+def _align(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+def _readMapNames(kbPath: str) -> List[bytes]:
+    """
+    Read the map of a KB into a list of UTF-8 names indexed by numeration. Unmapped numerations are 'None'.
+    """
+    names = [None]
+    for name, num in iterateMapEntries(kbPath):
+        if len(names) <= num:
+            names.extend([None] * (num + 1 - len(names)))
+        names[num] = name.encode()
+    return names
+
+def convertToContainer(kbPath: str, containerPath: str = None) -> str:
+    """
+    Convert a KB in the directory format to a container. The '.rel' files are copied as they are, except that 2-byte
+    ids are widened to 4 bytes. '.meta' files are not included.
+
+    Parameters:
+        kbPath:         The input KB path.
+        containerPath:  The output path of the container. Default: None, '<kbPath>.nkb'
+
+    Returns:
+        str:            The path of the container
+
+    Raises:
+        KbException:    A relation name is not mapped
+    """
+    if containerPath is None:
+        containerPath = os.path.normpath(kbPath) + CONTAINER_EXTENSION
+    names = _readMapNames(kbPath)
+    relations = sorted(
+        parseRelFilePath(rel_file_path, True) + (rel_file_path,) for rel_file_path in glob("%s/*.rel" % kbPath)
+    )
+    rel_names = set(rel_name.encode() for rel_name, _, _, _, _ in relations)
+    numerations = dict((names[num].decode(), num) for num in range(1, len(names)) if names[num] in rel_names)
+    mappings = sum(1 for name in names if name is not None)
+
+    # Directory
+    directory = []
+    offset = 0
+    for rel_name, arity, record_cnt, width, rel_file_path in relations:
+        num = numerations.get(rel_name)
+        if num is None:
+            raise KbException("Relation name is not mapped: %s" % rel_name)
+        directory.append((rel_name.encode(), num, arity, record_cnt, offset, rel_file_path, width))
+        offset = _align(offset + arity * record_cnt * max(width, 4), _BLOCK_ALIGNMENT)
+    directory_size = sum(_ENTRY_SIZE + len(entry[0]) for entry in directory)
+    block_start = _align(_HEADER_SIZE + directory_size, _BLOCK_ALIGNMENT)
+    map_section = encodeBinaryMap(names)
+    map_offset = block_start + offset
+
+    tmp_path = containerPath + ".tmp"
+    with open(tmp_path, 'wb') as ofd:
+        ofd.write(struct.pack(
+            _HEADER_FORMAT, _MAGIC, _VERSION, _HEADER_SIZE, 0, len(relations), _HEADER_SIZE, directory_size,
+            map_offset, len(map_section), len(names) - 1, mappings
+        ))
+        for rel_name, num, arity, record_cnt, rel_offset, _, width in directory:
+            ofd.write(struct.pack(
+                _ENTRY_FORMAT, num, arity, max(width, 4), record_cnt, block_start + rel_offset, len(rel_name)
+            ))
+            ofd.write(rel_name)
+        for rel_name, _, arity, record_cnt, rel_offset, rel_file_path, width in directory:
+            ofd.write(b'\x00' * (block_start + rel_offset - ofd.tell()))
+            with open(rel_file_path, 'rb') as ifd:
+                block = ifd.read()
+            if len(block) != arity * record_cnt * width:
+                raise KbException("Relation file size does not match: %s" % rel_name.decode())
+            if 2 == width:
+                block = np.frombuffer(block, dtype='<u2').astype('<i4').tobytes()
+            ofd.write(block)
+        ofd.write(b'\x00' * (map_offset - ofd.tell()))
+        ofd.write(map_section)
+    os.replace(tmp_path, containerPath)
+    return containerPath
+
+class KbContainer:
+    """
+    Class for reading a KB container. The file is opened by a single memory map, and the relations and the names are
+    read from the map without copying.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open a container.
+
+        Parameters:
+            path:       The path of the container
+
+        Raises:
+            KbException:    The file is not a container or is of an unsupported version
+        """
+        self._path = path
+        if os.path.getsize(path) < _HEADER_SIZE:
+            raise KbException("Not a KB container: %s" % path)
+        with open(path, 'rb') as ifd:
+            self._mmap = mmap.mmap(ifd.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size, _, relation_cnt, directory_offset, _, map_offset, _, max_num, mappings = \
+            struct.unpack_from(_HEADER_FORMAT, self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise KbException("Not a KB container of version %d: %s" % (_VERSION, path))
+        self._maxNumeration = max_num
+        self._mappings = mappings
+
+        # Relation directory: name -> (numeration, arity, width, #records, offset)
+        self._directory = dict()
+        offset = directory_offset
+        for _ in range(relation_cnt):
+            num, arity, width, record_cnt, rel_offset, name_size = struct.unpack_from(_ENTRY_FORMAT, self._mmap, offset)
+            offset += _ENTRY_SIZE
+            rel_name = self._mmap[offset:offset + name_size].decode()
+            offset += name_size
+            self._directory[rel_name] = (num, arity, width, record_cnt, rel_offset)
+
+        # Map section
+        self._map = BinaryMap(self._mmap, map_offset)
+
+    def close(self) -> None:
+        """
+        Close the memory map. Arrays returned by 'relationArray' should be released before.
+        """
+        self._map = None
+        self._mmap.close()
+
+    def __enter__(self) -> "KbContainer":
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
+
+    def name(self) -> str:
+        """
+        Return the name of the KB, i.e., the name of the container file without the extension.
+        """
+        file_name = os.path.basename(self._path)
+        if file_name.endswith(CONTAINER_EXTENSION):
+            return file_name[:-len(CONTAINER_EXTENSION)]
+        return file_name
+
+    def relations(self) -> List[Tuple[str, int, int, int]]:
+        """
+        Return the relations in the container.
+
+        Returns:
+            List[Tuple[str, int, int, int]]:    The name, numeration, arity and #records of each relation
+        """
+        return [
+            (rel_name, num, arity, record_cnt) for rel_name, (num, arity, _, record_cnt, _) in self._directory.items()
+        ]
+
+    def relationArray(self, relName: str) -> np.ndarray:
+        """
+        Return the records of a relation as a read-only (#records, arity) integer array on the memory map.
+
+        Parameters:
+            relName:    The name of the relation
+
+        Returns:
+            np.ndarray: The records. 'None' if the relation is not in the container.
+        """
+        entry = self._directory.get(relName)
+        if entry is None:
+            return None
+        _, arity, width, record_cnt, offset = entry
+        return np.frombuffer(
+            self._mmap, dtype='<i%d' % width, count=arity * record_cnt, offset=offset
+        ).reshape(record_cnt, arity)
+
+    def num2Name(self, num: int) -> str:
+        """
+        Get the mapped name for number 'num'.
+
+        Returns:
+            str:        The mapped name of the number, 'None' if the number is not mapped in the KB.
+        """
+        return self._map.num2Name(num)
+
+    def name2Num(self, name: str) -> int:
+        """
+        Get the mapped number for the name, by probing the hash table of the map.
+
+        Returns:
+            int:    The mapped number for the name. 'None' if the name is not mapped in the KB.
+        """
+        return self._map.name2Num(name)
+
+    def mappings(self):
+        """
+        Iterate over the mapping entries as (numeration, name) pairs, in the order of numerations.
+        """
+        return self._map.entries()
+
+    def maxNumeration(self) -> int:
+        return self._maxNumeration
+
+    def totalMappings(self) -> int:
+        return self._mappings
+
+def convertFromContainer(containerPath: str, basePath: str, maxEntries: int = _MAX_MAP_ENTRIES) -> str:
+    """
+    Convert a container to a KB in the directory format, named by the container file. The map is written by
+    'NumerationMap.dump', i.e., in shards of numeration ranges, each written to a temporary file first.
+
+    Parameters:
+        containerPath:  The path of the container
+        basePath:       The path where the KB directory will be created
+        maxEntries:     The maximum number of entries a map file contains (Default 1M)
+
+    Returns:
+        str:            The path of the KB directory
+    """
+    with KbContainer(containerPath) as container:
+        kbPath = os.path.join(basePath, container.name())
+        os.makedirs(kbPath, 0o755, exist_ok=True)
+        NumerationMap.fromBinaryMap(container._map).dump(kbPath, maxEntries=maxEntries)
+        for rel_name, _, _, _ in container.relations():
+            writeRelFile(kbPath, rel_name, container.relationArray(rel_name))
+    return kbPath
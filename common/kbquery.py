@@ -0,0 +1,466 @@
+from typing import Dict, List, NamedTuple, Tuple
+import argparse
+import math
+import os
+import re
+import time
+import numpy as np
+
+try:
+    from numeratedkb import KbException, KbRelation, NumeratedKb
+except ImportError:
+    from common.numeratedkb import KbException, KbRelation, NumeratedKb
+
+"""
+This file defines a planner of conjunctive queries over a numerated KB, e.g., rule bodies such as
+'linkTo(?L, ?P, ?Q), student(?Q), has(?W, ?P)'. Arguments beginning with '?' are variables, the others are constants,
+given by names or numerations.
+
+The cardinality of an atom is estimated from the profile of its relation: the number of records, and the degree table
+of each column, i.e., the distinct values and the number of records of each value. Joins are estimated by the
+distinct values of the join variables under the independence assumption. Plans are left-deep and found by dynamic
+programming over the subsets of the atoms (the Selinger algorithm), minimizing the total size of the intermediate
+results and avoiding cross products where possible. Each atom is joined by the cheapest algorithm by a cost model:
+    - index nested loop:    The join values are searched in the sorted runs or an index of the relation (see
+                            'KbRelation.match'). Cost: #outer rows x log(#records)
+    - hash join:            The atom is bucketed by its join value in an array indexed by numeration. Only for a single
+                            join variable. Cost: #outer rows + #records
+    - merge join:           Both sides are sorted by the join values, which are matched by binary search.
+                            Cost: #outer rows x log(#outer rows) + #records x log(#records)
+All joins are evaluated by vectorized operations on the columns of the intermediate result.
+"""
+
+INDEX_NESTED_LOOP = "index nested loop"
+HASH_JOIN = "hash join"
+MERGE_JOIN = "merge join"
+CROSS_PRODUCT = "cross product"
+SCAN = "scan"
+INDEX_SCAN = "index scan"
+
+_ATOM_PATTERN = re.compile(r"\s*([^\s(),]+)\s*\(([^)]*)\)\s*(?:,|$)")
+
+class Atom(NamedTuple):
+    relation: str       # Name of the relation
+    args: tuple         # Variables ('?X') or constants (names or numerations)
+
+    def __str__(self) -> str:
+        return "%s(%s)" % (self.relation, ", ".join(str(arg) for arg in self.args))
+
+def isVariable(arg) -> bool:
+    return isinstance(arg, str) and arg.startswith('?')
+
+def parseQuery(text: str) -> List[Atom]:
+    """
+    Parse a conjunctive query, e.g., 'linkTo(?L, ?P, ?Q), student(?Q)'.
+
+    Raises:
+        KbException:    The text is not a conjunction of atoms
+    """
+    atoms = []
+    end = 0
+    for match in _ATOM_PATTERN.finditer(text):
+        if match.start() != end:
+            break
+        args = tuple(arg.strip() for arg in match.group(2).split(',')) if match.group(2).strip() else ()
+        atoms.append(Atom(match.group(1), args))
+        end = match.end()
+    if 0 == len(atoms) or end != len(text):
+        raise KbException("Not a conjunctive query: %s" % text)
+    return atoms
+
+class RelationProfile:
+    """
+    Statistics of a relation for estimating cardinalities: the number of records and the degree table of each column,
+    i.e., the sorted distinct values and the number of records of each value.
+    """
+
+    def __init__(self, records: np.ndarray) -> None:
+        """
+        Parameters:
+            records:    The (#records, arity) integer array of the relation
+        """
+        self.records = len(records)
+        self.values = []
+        self.degrees = []
+        for column in records.T:
+            values, degrees = np.unique(column, return_counts=True)
+            self.values.append(values)
+            self.degrees.append(degrees)
+
+    def distinct(self, column: int) -> int:
+        return len(self.values[column])
+
+    def maxDegree(self, column: int) -> int:
+        return int(self.degrees[column].max()) if 0 < self.records else 0
+
+    def frequency(self, column: int, value: int) -> int:
+        """
+        Return the number of records with a value in a column.
+        """
+        idx = np.searchsorted(self.values[column], value)
+        if idx < len(self.values[column]) and self.values[column][idx] == value:
+            return int(self.degrees[column][idx])
+        return 0
+
+class PlanStep(NamedTuple):
+    atom: Atom
+    algorithm: str          # SCAN or INDEX_SCAN for the first atom, one of the join algorithms for the others
+    keys: Tuple[str, ...]   # The join variables
+    probeColumn: int        # The column searched by an index nested loop or an index scan. 'None' for the others.
+    estimate: float         # The estimated #rows after the step
+    cost: float             # The estimated cost of the step
+
+class _Bound(NamedTuple):
+    """
+    An atom resolved in the KB: its relation, the columns of its constants and of its variables.
+    """
+    relation: KbRelation
+    constants: Dict[int, int]       # column -> numeration
+    variables: Dict[str, List[int]] # variable -> columns
+
+def _expand(starts: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expand the ranges '[starts[i], starts[i] + counts[i])' into the index of their range and their positions.
+    """
+    total = int(counts.sum())
+    outer = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.cumsum(counts) - counts
+    positions = np.repeat(starts - offsets, counts) + np.arange(total)
+    return outer, positions
+
+class QueryPlan:
+    """
+    An evaluation plan of a conjunctive query: the order of the atoms and the algorithm joining each of them.
+    """
+
+    def __init__(self, kb: NumeratedKb, steps: List[PlanStep], bound: Dict[Atom, _Bound]) -> None:
+        self._kb = kb
+        self._steps = steps
+        self._bound = bound
+        self._actual = None     # #rows after each step in the last execution
+        self._seconds = None    # Time of each step in the last execution
+        self.variables = []
+        for step in steps:
+            for arg in step.atom.args:
+                if isVariable(arg) and arg not in self.variables:
+                    self.variables.append(arg)
+
+    def steps(self) -> List[PlanStep]:
+        return self._steps
+
+    def estimate(self) -> float:
+        """
+        Return the estimated #rows of the result.
+        """
+        return self._steps[-1].estimate if self._steps else 0
+
+    def explain(self) -> str:
+        """
+        Describe the plan: each step with its atom, its algorithm, the estimated #rows and, after 'execute', the
+        actual #rows and time.
+        """
+        lines = ["%-4s %-40s %-28s %12s %12s %10s" % ("step", "atom", "algorithm", "est. rows", "rows", "time (ms)")]
+        for i, step in enumerate(self._steps):
+            algorithm = step.algorithm
+            if step.keys:
+                algorithm += " on " + ",".join(step.keys)
+            if step.probeColumn is not None:
+                algorithm += " [col %d]" % step.probeColumn
+            lines.append("%-4d %-40s %-28s %12.0f %12s %10s" % (
+                i + 1, str(step.atom)[:40], algorithm, step.estimate,
+                "-" if self._actual is None else self._actual[i],
+                "-" if self._seconds is None else "%.3f" % (self._seconds[i] * 1000)
+            ))
+        return "\n".join(lines)
+
+    def execute(self) -> np.ndarray:
+        """
+        Evaluate the query.
+
+        Returns:
+            np.ndarray: The (#rows, #variables) array of the bindings of 'variables'
+        """
+        self._actual = []
+        self._seconds = []
+        columns = dict()
+        size = 0
+        for i, step in enumerate(self._steps):
+            start = time.perf_counter()
+            bound = self._bound[step.atom]
+            if 0 == i:
+                records = self.__atomRecords(bound, step.probeColumn)
+                columns = dict((var, records[:, cols[0]]) for var, cols in bound.variables.items())
+                size = len(records)
+            else:
+                columns, size = self.__join(columns, size, step, bound)
+            self._actual.append(size)
+            self._seconds.append(time.perf_counter() - start)
+        if not self.variables:
+            return np.empty((size, 0), dtype=np.int32)
+        return np.stack([columns[var] for var in self.variables], axis=1)
+
+    @staticmethod
+    def __atomRecords(bound: _Bound, probeColumn: int = None) -> np.ndarray:
+        """
+        Return the records of the relation matching the constants and the repeated variables of an atom.
+        """
+        pattern = [None] * bound.relation.getArity()
+        for column, value in bound.constants.items():
+            pattern[column] = value
+        records = bound.relation.match(tuple(pattern))
+        for cols in bound.variables.values():
+            for col in cols[1:]:
+                records = records[records[:, cols[0]] == records[:, col]]
+        return records
+
+    def __join(self, columns: Dict[str, np.ndarray], size: int, step: PlanStep, bound: _Bound) -> Tuple[dict, int]:
+        relation = bound.relation
+        keys = step.keys
+        if INDEX_NESTED_LOOP == step.algorithm:
+            inner = relation.sortedArray()
+            sorted_keys, order = relation.columnIndex(step.probeColumn)
+            probes = columns[keys[[bound.variables[key][0] for key in keys].index(step.probeColumn)]]
+            starts = np.searchsorted(sorted_keys, probes, 'left')
+            outer, positions = _expand(starts, np.searchsorted(sorted_keys, probes, 'right') - starts)
+            rows = positions if order is None else order[positions]
+        else:
+            inner = self.__atomRecords(bound)
+            if HASH_JOIN == step.algorithm:
+                probes = columns[keys[0]]
+                build = inner[:, bound.variables[keys[0]][0]]
+                length = int(max(build.max(initial=0), probes.max(initial=0))) + 1
+                counts = np.bincount(build, minlength=length)
+                starts = np.cumsum(counts) - counts
+                outer, positions = _expand(starts[probes], counts[probes])
+                rows = np.argsort(build, kind='stable')[positions]
+            elif MERGE_JOIN == step.algorithm:
+                left = np.stack([columns[key] for key in keys], axis=1)
+                right = inner[:, [bound.variables[key][0] for key in keys]]
+                if 1 == len(keys):
+                    left_codes, right_codes = left[:, 0], right[:, 0]
+                else:
+                    codes = np.unique(np.concatenate([left, right]), axis=0, return_inverse=True)[1].ravel()
+                    left_codes, right_codes = codes[:len(left)], codes[len(left):]
+                order = np.argsort(right_codes, kind='stable')
+                sorted_codes = right_codes[order]
+                starts = np.searchsorted(sorted_codes, left_codes, 'left')
+                outer, positions = _expand(starts, np.searchsorted(sorted_codes, left_codes, 'right') - starts)
+                rows = order[positions]
+            else:
+                outer = np.repeat(np.arange(size), len(inner))
+                rows = np.tile(np.arange(len(inner)), size)
+
+        # Check all join variables, constants and repeated variables on the joined rows
+        mask = np.ones(len(rows), dtype=bool)
+        for var, cols in bound.variables.items():
+            if var in columns:
+                mask &= columns[var][outer] == inner[rows, cols[0]]
+            for col in cols[1:]:
+                mask &= inner[rows, cols[0]] == inner[rows, col]
+        for col, value in bound.constants.items():
+            mask &= inner[rows, col] == value
+        outer = outer[mask]
+        rows = rows[mask]
+        joined = dict((var, values[outer]) for var, values in columns.items())
+        for var, cols in bound.variables.items():
+            if var not in joined:
+                joined[var] = inner[rows, cols[0]]
+        return joined, len(outer)
+
+class QueryPlanner:
+    """
+    Planner of conjunctive queries over a KB. The profiles of the relations are computed on demand and kept until the
+    records of the relations change.
+    """
+
+    def __init__(self, kb: NumeratedKb) -> None:
+        self._kb = kb
+        self._profiles = dict()     # relation numeration -> (sorted array, RelationProfile)
+
+    def profile(self, relation: KbRelation) -> RelationProfile:
+        """
+        Return the profile of a relation.
+        """
+        records = relation.sortedArray()
+        cached = self._profiles.get(relation.getNumeration())
+        if cached is None or cached[0] is not records:
+            cached = (records, RelationProfile(records))
+            self._profiles[relation.getNumeration()] = cached
+        return cached[1]
+
+    def __bind(self, atom: Atom) -> _Bound:
+        relation = self._kb.getRelationByName(atom.relation)
+        if relation is None:
+            raise KbException("Relation not in the KB: %s" % atom.relation)
+        if len(atom.args) != relation.getArity():
+            raise KbException("Atom arity (%d) does not match the relation (%d): %s" % (
+                len(atom.args), relation.getArity(), atom
+            ))
+        constants = dict()
+        variables = dict()
+        for col, arg in enumerate(atom.args):
+            if isVariable(arg):
+                variables.setdefault(arg, []).append(col)
+            else:
+                num = arg if isinstance(arg, (int, np.integer)) else self._kb.name2Num(arg)
+                constants[col] = -1 if num is None else int(num)   # Unmapped names match nothing
+        return _Bound(relation, constants, variables)
+
+    def __atomEstimate(self, bound: _Bound) -> Tuple[float, Dict[str, float]]:
+        """
+        Estimate the #records matching an atom and the #distinct values of its variables.
+        """
+        profile = self.profile(bound.relation)
+        estimate = float(profile.records)
+        for col, value in bound.constants.items():
+            estimate *= profile.frequency(col, value) / max(profile.records, 1)
+        for cols in bound.variables.values():
+            for col in cols[1:]:
+                estimate /= max(profile.distinct(cols[0]), profile.distinct(col), 1)
+        distinct = dict(
+            (var, min(float(min(profile.distinct(col) for col in cols)), estimate))
+            for var, cols in bound.variables.items()
+        )
+        return estimate, distinct
+
+    def __joinAlgorithm(
+        self, outerRows: float, bound: _Bound, keys: List[str]
+    ) -> Tuple[str, int, float]:
+        """
+        Choose the cheapest algorithm joining an atom to an intermediate result.
+
+        Returns:
+            str:    The algorithm
+            int:    The probed column of an index nested loop, otherwise 'None'
+            float:  The estimated cost
+        """
+        records = bound.relation.totalRecords()
+        if 0 == len(keys):
+            return CROSS_PRODUCT, None, outerRows * max(records, 1)
+        candidates = [(
+            outerRows * math.log2(outerRows + 2) + records * math.log2(records + 2), MERGE_JOIN, None
+        )]
+        if 1 == len(keys):
+            candidates.append((outerRows + records, HASH_JOIN, None))
+        indexed = bound.relation.indexedColumns()
+        for key in keys:
+            column = bound.variables[key][0]
+            if column in indexed:
+                candidates.append((outerRows * math.log2(records + 2), INDEX_NESTED_LOOP, column))
+        cost, algorithm, column = min(candidates, key=lambda candidate: candidate[0])
+        return algorithm, column, cost
+
+    def plan(self, query, reorder: bool = True) -> QueryPlan:
+        """
+        Plan the evaluation of a conjunctive query.
+
+        Parameters:
+            query:      The atoms of the query, or its text (see 'parseQuery')
+            reorder:    Whether the atoms are reordered. If False, they are joined in the given order and only the
+                        algorithms are chosen. Default: True
+
+        Returns:
+            QueryPlan:  The plan
+
+        Raises:
+            KbException:    A relation of the query is not in the KB or of another arity
+        """
+        atoms = parseQuery(query) if isinstance(query, str) else [Atom(atom[0], tuple(atom[1])) for atom in query]
+        bound = dict((atom, self.__bind(atom)) for atom in atoms)
+        estimates = dict((atom, self.__atomEstimate(bound[atom])) for atom in atoms)
+
+        # Best left-deep plan of each subset of the atoms: (total cost, #rows, distinct values, steps)
+        best = dict()
+        for idx, atom in enumerate(atoms):
+            if not reorder and 0 < idx:
+                continue
+            estimate, distinct = estimates[atom]
+            probe_column = None
+            if bound[atom].constants and min(bound[atom].constants) in bound[atom].relation.indexedColumns():
+                probe_column = min(bound[atom].constants)
+            step = PlanStep(atom, SCAN if probe_column is None else INDEX_SCAN, (), probe_column, estimate, estimate)
+            best[1 << idx] = (estimate, estimate, distinct, [step])
+        for _ in range(len(atoms) - 1):
+            extended = dict()
+            for subset, (cost, rows, distinct, steps) in best.items():
+                candidates = [idx for idx in range(len(atoms)) if not subset & (1 << idx)]
+                if not reorder:
+                    candidates = candidates[:1]
+                connected = [idx for idx in candidates if set(bound[atoms[idx]].variables) & set(distinct)]
+                for idx in connected if connected else candidates:
+                    atom = atoms[idx]
+                    atom_rows, atom_distinct = estimates[atom]
+                    keys = [var for var in bound[atom].variables if var in distinct]
+                    algorithm, column, join_cost = self.__joinAlgorithm(rows, bound[atom], keys)
+                    joined_rows = rows * atom_rows
+                    for key in keys:
+                        joined_rows /= max(distinct[key], atom_distinct[key], 1)
+                    joined_distinct = dict(
+                        (var, min(values, joined_rows)) for var, values in distinct.items()
+                    )
+                    for var, values in atom_distinct.items():
+                        joined_distinct[var] = min(joined_distinct.get(var, values), values, joined_rows)
+                    total = cost + join_cost + joined_rows
+                    key = subset | (1 << idx)
+                    if key not in extended or total < extended[key][0]:
+                        extended[key] = (total, joined_rows, joined_distinct, steps + [
+                            PlanStep(atom, algorithm, tuple(keys), column, joined_rows, join_cost)
+                        ])
+            best = extended
+        steps = min(best.values(), key=lambda entry: entry[0])[3] if best else []
+        return QueryPlan(self._kb, steps, bound)
+
+def benchmarkQueries(kb: NumeratedKb, queries: List[str], repeats: int = 3) -> List[Tuple[str, int, float, float]]:
+    """
+    Evaluate queries by the planned order and by the written order, and take the best time of several runs.
+
+    Returns:
+        List[Tuple[str, int, float, float]]:    The query, the #rows of the result and the times in seconds of the
+                                                planned and the written order
+    """
+    planner = QueryPlanner(kb)
+    results = []
+    for query in queries:
+        timings = []
+        rows = 0
+        for reorder in (True, False):
+            best_time = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                rows = len(planner.plan(query, reorder).execute())
+                best_time = min(best_time, time.perf_counter() - start)
+            timings.append(best_time)
+        results.append((query, rows, timings[0], timings[1]))
+    return results
+
+WEBKB_QUERIES = [
+    "has(?W, ?P), has(?W, ?Q), course(?P), faculty(?Q)",
+    "has(?W, ?P), linkTo(?L, ?P, ?Q), student(?Q)",
+    "hasAnchor(?W, ?L), linkTo(?L, ?P, ?Q), faculty(?P), student(?Q)",
+    "has(?W, ?Q), hasNeighborhood(?W, ?L), linkTo(?L, ?P, ?Q)",
+    "has(?W, ?P), has(?W, ?Q), linkTo(?L, ?Q, ?P), student(?P), faculty(?Q)",
+]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Plan and evaluate conjunctive queries on KBs and compare the planned order with the written one"
+    )
+    parser.add_argument('paths', nargs='+', help="paths of KBs in the numerated format")
+    parser.add_argument('--query', '-q', action='append', help="queries, e.g., 'linkTo(?L, ?P, ?Q), student(?Q)' "
+                        "(default: rule bodies over the webkb datasets)")
+    parser.add_argument('--repeats', '-r', type=int, default=3, help="runs of each query, the best is reported")
+    parser.add_argument('--explain', '-e', action='store_true', help="print the plans")
+    args = parser.parse_args()
+    queries = args.query if args.query else WEBKB_QUERIES
+    print("%-16s %-72s %10s %12s %12s" % ("KB", "query", "rows", "planned (ms)", "written (ms)"))
+    for kb_path in args.paths:
+        kb_path = os.path.normpath(kb_path)
+        kb = NumeratedKb(os.path.basename(kb_path), os.path.dirname(kb_path))
+        for query, rows, planned, written in benchmarkQueries(kb, queries, args.repeats):
+            print("%-16s %-72s %10d %12.2f %12.2f" % (
+                os.path.basename(kb_path)[:16], query[:72], rows, planned * 1000, written * 1000
+            ))
+            if args.explain:
+                plan = QueryPlanner(kb).plan(query)
+                plan.execute()
+                print(plan.explain())
@@ -0,0 +1,133 @@
+from typing import List, NamedTuple, Tuple
+import argparse
+import os
+import time
+import numpy as np
+
+try:
+    from numeratedkb import NumeratedKb
+    from relcodec import encodeRelation
+except ImportError:
+    from common.numeratedkb import NumeratedKb
+    from common.relcodec import encodeRelation
+
+"""
+This file renumbers numerated KBs by frequency ('NumeratedKb.renumberByDegree') and reports the effect: the sizes of the
+files before and after renumbering, and the timings of joins between relations. A join of relations 'A' and 'B' matches
+the last argument of 'A' with the first argument of 'B' by gathering from an array of the subject counts of 'B' indexed
+by numeration, so that its timing reflects the locality of the accesses to the array.
+"""
+
+class KbMeasurement(NamedTuple):
+    relBytes: int       # Total size of the '.rel' files
+    relzBytes: int      # Total size of the relations in the compressed encoding ('.relz')
+    mapBytes: int       # Total size of the map files in the text format
+    maxNumeration: int
+    joins: int          # Number of joined relation pairs
+    joinResults: int    # Total number of joined record pairs
+    joinSeconds: float  # Best time of all joins
+
+def joinPairs(kb: NumeratedKb, pairs: int) -> List[Tuple[int, int]]:
+    """
+    Pick the relation pairs to join: each of the largest relations of arity at least 2 is joined with the next one and
+    with itself.
+
+    Parameters:
+        kb:         The KB
+        pairs:      The number of the largest relations taken into account
+
+    Returns:
+        List[Tuple[int, int]]:  The numerations of the pairs of relations
+    """
+    relations = sorted(
+        (relation for relation in kb.getRelationSet() if 2 <= relation.getArity()),
+        key=lambda relation: (-relation.totalRecords(), relation.getName())
+    )[:pairs]
+    result = []
+    for i, relation in enumerate(relations):
+        result.append((relation.getNumeration(), relation.getNumeration()))
+        if i + 1 < len(relations):
+            result.append((relation.getNumeration(), relations[i + 1].getNumeration()))
+    return result
+
+def timeJoins(kb: NumeratedKb, pairs: List[Tuple[int, int]], repeats: int = 3) -> Tuple[int, float]:
+    """
+    Join pairs of relations and take the best time of several runs.
+
+    Returns:
+        int:    The total number of joined record pairs
+        float:  The best time of joining all pairs in seconds
+    """
+    arrays = dict((rel_num, kb.relationArray(rel_num)) for pair in pairs for rel_num in pair)
+    length = kb.getNumerationMap().maxNumeration() + 1
+    best_time = float("inf")
+    results = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = 0
+        for left, right in pairs:
+            subject_counts = np.bincount(arrays[right][:, 0], minlength=length)
+            results += int(subject_counts[arrays[left][:, -1]].sum())
+        best_time = min(best_time, time.perf_counter() - start)
+    return results, best_time
+
+def measureKb(kb: NumeratedKb, pairs: List[Tuple[int, int]], repeats: int = 3) -> KbMeasurement:
+    """
+    Measure the sizes of the files of a KB and the timings of joins, without writing any file.
+    """
+    rel_bytes = 0
+    relz_bytes = 0
+    for relation in kb.getRelationSet():
+        records = kb.relationArray(relation.getNumeration())
+        rel_bytes += records.nbytes
+        relz_bytes += len(encodeRelation(records))
+    map_bytes = sum(len(name.encode()) + len("%x" % kb.name2Num(name)) + 2 for name in kb.getNumerationMap())
+    join_results, join_time = timeJoins(kb, pairs, repeats)
+    return KbMeasurement(
+        rel_bytes, relz_bytes, map_bytes, kb.getNumerationMap().maxNumeration(), len(pairs), join_results, join_time
+    )
+
+def renumberKb(kbPath: str, write: bool = False, pairs: int = 8, repeats: int = 3) -> Tuple[KbMeasurement, KbMeasurement]:
+    """
+    Renumber a KB by frequency and measure it before and after.
+
+    Parameters:
+        kbPath:     The input KB path.
+        write:      Whether the renumbered KB is written back to 'kbPath'. Default: False
+        pairs:      The number of the largest relations joined
+        repeats:    The number of runs of the joins, of which the best time is taken
+
+    Returns:
+        KbMeasurement:  The measurement before renumbering
+        KbMeasurement:  The measurement after renumbering
+    """
+    kb_path = os.path.normpath(kbPath)
+    kb = NumeratedKb(os.path.basename(kb_path), os.path.dirname(kb_path))
+    join_pairs = joinPairs(kb, pairs)
+    before = measureKb(kb, join_pairs, repeats)
+    translation = kb.renumberByDegree()
+    join_pairs = [(int(translation[left]), int(translation[right])) for left, right in join_pairs]
+    after = measureKb(kb, join_pairs, repeats)
+    if write:
+        kb.dump(os.path.dirname(kb_path))
+    return before, after
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Renumber KBs by frequency and report the file sizes and join timings before and after"
+    )
+    parser.add_argument('paths', nargs='+', help="paths of KBs in the numerated format")
+    parser.add_argument('--write', '-w', action='store_true', help="write the renumbered KBs back")
+    parser.add_argument('--pairs', '-p', type=int, default=8, help="number of the largest relations joined")
+    parser.add_argument('--repeats', '-r', type=int, default=3, help="runs of the joins, the best is reported")
+    args = parser.parse_args()
+    print("%-24s %-6s %12s %12s %12s %10s %8s %12s %10s" % (
+        "KB", "order", "rel (B)", "relz (B)", "map (B)", "max num", "joins", "results", "join (ms)"
+    ))
+    for kb_path in args.paths:
+        for order, measurement in zip(("before", "after"), renumberKb(kb_path, args.write, args.pairs, args.repeats)):
+            print("%-24s %-6s %12d %12d %12d %10d %8d %12d %10.2f" % (
+                os.path.basename(os.path.normpath(kb_path))[:24], order, measurement.relBytes, measurement.relzBytes,
+                measurement.mapBytes, measurement.maxNumeration, measurement.joins, measurement.joinResults,
+                measurement.joinSeconds * 1000
+            ))
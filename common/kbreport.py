@@ -0,0 +1,256 @@
+from abc import ABC, abstractmethod
+import csv
+import json
+import os
+from typing import List, Sequence
+
+try:
+    from numeratedkb import KbException
+except ImportError:
+    from common.numeratedkb import KbException
+
+"""
+This file defines the sinks that statistics reports are written to. A report consists of sheets, each with a header row
+followed by rows that are written as soon as they are appended, so that no report is held in memory as a whole. The
+text sinks flush every row to the file, so that the rows written before a crash are kept. The sink is chosen by the
+extension of the output path:
+    - '.csv', '.tsv':   One delimited text file per sheet, named '<path without extension>_<sheet><extension>'
+    - '.jsonl':         One JSON object per line, keyed by the header and tagged by the sheet name
+    - '.xlsx':          An Excel workbook, streamed by 'openpyxl' in write-only mode
+    - '.xls':           A legacy Excel workbook, written by 'xlwt'. The workbook is held in memory until it is closed
+                        and a sheet is limited to 65,536 rows.
+The Excel libraries are only imported when an Excel report is opened.
+"""
+
+XLS_MAX_ROWS = 65536
+
+class ReportSheet(ABC):
+    """
+    A sheet in a report, to which rows are appended in order.
+    """
+
+    @abstractmethod
+    def append(self, row: Sequence) -> None:
+        """
+        Write a row to the sheet.
+        """
+
+class ReportSink(ABC):
+    """
+    Base class of report sinks. A sink should be closed after all rows are appended, e.g., by a 'with' statement.
+    """
+
+    @abstractmethod
+    def addSheet(self, name: str, header: Sequence[str]) -> ReportSheet:
+        """
+        Add a sheet to the report.
+
+        Parameters:
+            name:   The name of the sheet
+            header: The column names of the sheet
+
+        Returns:
+            ReportSheet: The sheet, to which the rows are appended
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Finish writing the report.
+        """
+
+    def __enter__(self) -> "ReportSink":
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
+
+def _plainValue(value):
+    """
+    Convert numpy scalars to Python values, which are written by their Python representation.
+    """
+    return value.item() if hasattr(value, "item") else value
+
+class _DelimitedSheet(ReportSheet):
+    def __init__(self, ofd, delimiter: str) -> None:
+        self._ofd = ofd
+        self._writer = csv.writer(ofd, delimiter=delimiter, lineterminator='\n')
+
+    def append(self, row: Sequence) -> None:
+        self._writer.writerow([_plainValue(value) for value in row])
+        self._ofd.flush()
+
+class DelimitedSink(ReportSink):
+    """
+    Report sink of delimited text files, one file per sheet.
+    """
+
+    def __init__(self, path: str, delimiter: str = ',', extension: str = None) -> None:
+        """
+        Parameters:
+            path:       The output path. The sheets are written to '<path without extension>_<sheet><extension>'.
+            delimiter:  The delimiter of columns. Default: ','
+            extension:  The extension of the sheet files. Default: None, the extension of 'path'
+        """
+        self._root, self._ext = os.path.splitext(path)
+        if extension is not None and self._ext.lower() != extension:
+            self._root, self._ext = path, extension
+        self._delimiter = delimiter
+        self._files = []
+
+    def sheetPath(self, name: str) -> str:
+        """
+        Return the path of the file that a sheet is written to.
+        """
+        return "%s_%s%s" % (self._root, name, self._ext)
+
+    def addSheet(self, name: str, header: Sequence[str]) -> ReportSheet:
+        ofd = open(self.sheetPath(name), 'w', newline='')
+        self._files.append(ofd)
+        sheet = _DelimitedSheet(ofd, self._delimiter)
+        sheet.append(header)
+        return sheet
+
+    def close(self) -> None:
+        for ofd in self._files:
+            ofd.close()
+        self._files = []
+
+class _JsonLinesSheet(ReportSheet):
+    def __init__(self, ofd, name: str, header: Sequence[str]) -> None:
+        self._ofd = ofd
+        self._name = name
+        self._header = list(header)
+
+    def append(self, row: Sequence) -> None:
+        record = {"sheet": self._name}
+        for column, value in zip(self._header, row):
+            record[column] = _plainValue(value)
+        self._ofd.write(json.dumps(record))
+        self._ofd.write('\n')
+        self._ofd.flush()
+
+class JsonLinesSink(ReportSink):
+    """
+    Report sink of a JSON-lines file. Every row is an object mapping the header of its sheet to the values, with the
+    sheet name under the key 'sheet'.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+            path:   The output path
+        """
+        self._ofd = open(path, 'w')
+
+    def addSheet(self, name: str, header: Sequence[str]) -> ReportSheet:
+        return _JsonLinesSheet(self._ofd, name, header)
+
+    def close(self) -> None:
+        self._ofd.close()
+
+class _ExcelSheet(ReportSheet):
+    def __init__(self, worksheet) -> None:
+        self._worksheet = worksheet
+
+    def append(self, row: Sequence) -> None:
+        self._worksheet.append([_plainValue(value) for value in row])
+
+class ExcelSink(ReportSink):
+    """
+    Report sink of an Excel workbook in the '.xlsx' format. The rows are streamed to temporary files by 'openpyxl' and
+    the workbook is assembled when the sink is closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+            path:   The output path
+        """
+        from openpyxl import Workbook   # Only needed for writing Excel reports
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+
+    def addSheet(self, name: str, header: Sequence[str]) -> ReportSheet:
+        sheet = _ExcelSheet(self._workbook.create_sheet(name))
+        sheet.append(header)
+        return sheet
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.save(self._path)
+            self._workbook = None
+
+class _XlsSheet(ReportSheet):
+    def __init__(self, worksheet, name: str) -> None:
+        self._worksheet = worksheet
+        self._name = name
+        self._rows = 0
+
+    def append(self, row: Sequence) -> None:
+        if XLS_MAX_ROWS <= self._rows:
+            raise KbException("Sheet '%s' exceeds %d rows of the '.xls' format, use another format" % (
+                self._name, XLS_MAX_ROWS
+            ))
+        for column, value in enumerate(row):
+            self._worksheet.write(self._rows, column, _plainValue(value))
+        self._rows += 1
+
+class XlsSink(ReportSink):
+    """
+    Report sink of a legacy Excel workbook in the '.xls' format. The workbook is held in memory until it is closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters:
+            path:   The output path
+        """
+        import xlwt     # Only needed for writing legacy Excel reports
+        self._path = path
+        self._workbook = xlwt.Workbook(encoding='utf-8')
+
+    def addSheet(self, name: str, header: Sequence[str]) -> ReportSheet:
+        sheet = _XlsSheet(self._workbook.add_sheet(name), name)
+        sheet.append(header)
+        return sheet
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.save(self._path)
+            self._workbook = None
+
+def reportFormats() -> List[str]:
+    """
+    Return the extensions of the supported report formats.
+    """
+    return [".csv", ".tsv", ".jsonl", ".xlsx", ".xls"]
+
+def openReport(path: str, format: str = None) -> ReportSink:
+    """
+    Open a report sink for an output path.
+
+    Parameters:
+        path:       The output path
+        format:     The extension of the format, e.g., '.csv'. Default: None, the extension of 'path'
+
+    Returns:
+        ReportSink: The sink
+
+    Raises:
+        KbException: The format is not supported
+    """
+    if format is None:
+        format = os.path.splitext(path)[1]
+    format = format.lower()
+    if ".csv" == format:
+        return DelimitedSink(path, ',', format)
+    if ".tsv" == format:
+        return DelimitedSink(path, '\t', format)
+    if ".jsonl" == format:
+        return JsonLinesSink(path)
+    if ".xlsx" == format:
+        return ExcelSink(path)
+    if ".xls" == format:
+        return XlsSink(path)
+    raise KbException("Unsupported report format '%s', use one of: %s" % (format, ", ".join(reportFormats())))
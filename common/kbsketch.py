@@ -0,0 +1,391 @@
+from glob import glob
+from typing import List, NamedTuple, Tuple
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+try:
+    from numeratedkb import NumeratedKb, parseRelFilePath, readRelFile
+    from kbstat import fileFingerprint
+except ImportError:
+    from common.numeratedkb import NumeratedKb, parseRelFilePath, readRelFile
+    from common.kbstat import fileFingerprint
+
+"""
+This file finds pairs of similar relations in a numerated KB without joining every pair. Each relation is summarized by
+MinHash signatures: one of its records, one of its inverse records if it is binary, and one of the value set of each
+column. The signatures are stored in 'sketches.meta' in the KB and are only recalculated for the relation files that
+changed.
+
+The signatures are indexed by locality-sensitive hashing (LSH): a signature of 'k' values is cut into bands of 'r'
+values, and two sets land in the same bucket of a band with probability 'J^r' for the Jaccard similarity 'J'. As a
+small set contained in a large one has a low Jaccard similarity, the index is partitioned by set size (as in LSH
+Ensemble): for a containment threshold 't' of a set 'A' in the sets of size at most 'u', the Jaccard similarity is at
+least 't|A| / (|A| + u - t|A|)', and the band width is chosen by this bound for each partition. The candidate pairs are
+finally filtered by the containment estimated from the signatures, so that the exact set algebra ('KbRelation.intersect')
+only runs on promising pairs.
+"""
+
+SKETCH_FILE_NAME = "sketches.meta"
+DEFAULT_PERMUTATIONS = 128
+_SKETCH_VERSION = 1
+_HASH_BLOCK_ELEMENTS = 1 << 20     # Hashed values held at a time by 'minHash'
+
+_GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+_MIX1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX2 = np.uint64(0x94d049bb133111eb)
+_EMPTY = np.iinfo(np.uint64).max    # Signature value of an empty set
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    The finalizer of SplitMix64, a bijective mix of 64-bit values.
+    """
+    values = (values ^ (values >> np.uint64(30))) * _MIX1
+    values = (values ^ (values >> np.uint64(27))) * _MIX2
+    return values ^ (values >> np.uint64(31))
+
+def hashValues(values: np.ndarray) -> np.ndarray:
+    """
+    Hash integer values into 64-bit keys.
+    """
+    return _mix(values.astype(np.uint64) + _GOLDEN)
+
+def hashRecords(records: np.ndarray) -> np.ndarray:
+    """
+    Hash the records of a (#records, arity) integer array into 64-bit keys. Equal records of relations of the same
+    arity have equal keys, so that keys of different relations are comparable.
+    """
+    keys = np.full(len(records), records.shape[1], dtype=np.uint64)
+    for column in records.T:
+        keys = _mix(keys * _GOLDEN + column.astype(np.uint64))
+    return keys
+
+def minHash(keys: np.ndarray, permutations: int = DEFAULT_PERMUTATIONS) -> np.ndarray:
+    """
+    Compute the MinHash signature of a set of 64-bit keys: the minimum of each of 'permutations' hash functions.
+
+    Returns:
+        np.ndarray: The uint64 signature. All values are the maximum of uint64 for an empty set.
+    """
+    seeds = _mix(np.arange(1, permutations + 1, dtype=np.uint64) * _GOLDEN)
+    signature = np.full(permutations, _EMPTY, dtype=np.uint64)
+    if 0 == len(keys):
+        return signature
+    block = max(1, _HASH_BLOCK_ELEMENTS // len(keys))
+    for start in range(0, permutations, block):
+        signature[start:start + block] = _mix(keys[None, :] ^ seeds[start:start + block, None]).min(axis=1)
+    return signature
+
+class RelationSketch(NamedTuple):
+    name: str
+    arity: int
+    records: int
+    recordSignature: np.ndarray     # MinHash of the records
+    inverseSignature: np.ndarray    # MinHash of the records with the columns reversed. 'None' unless binary
+    columnSizes: List[int]          # Number of distinct values of each column
+    columnSignatures: List[np.ndarray]  # MinHash of the value set of each column
+
+def sketchRelation(name: str, records: np.ndarray, permutations: int = DEFAULT_PERMUTATIONS) -> RelationSketch:
+    """
+    Sketch a relation given by its (#records, arity) integer array. The records are assumed to be distinct.
+    """
+    columns = [np.unique(column) for column in records.T]
+    return RelationSketch(
+        name, records.shape[1], len(records), minHash(hashRecords(records), permutations),
+        minHash(hashRecords(records[:, ::-1]), permutations) if 2 == records.shape[1] else None,
+        [len(values) for values in columns], [minHash(hashValues(values), permutations) for values in columns]
+    )
+
+def _encodeSignature(signature: np.ndarray) -> str:
+    return None if signature is None else signature.astype('<u8').tobytes().hex()
+
+def _decodeSignature(text: str) -> np.ndarray:
+    return None if text is None else np.frombuffer(bytes.fromhex(text), dtype='<u8').astype(np.uint64)
+
+def loadSketches(kbPath: str, permutations: int = DEFAULT_PERMUTATIONS, update: bool = True) -> List[RelationSketch]:
+    """
+    Load the sketches of all relations of a KB from 'sketches.meta'. The sketches of the relation files that are not
+    in the file or changed since are calculated.
+
+    Parameters:
+        kbPath:         The input KB path.
+        permutations:   The number of hash functions of the signatures. Sketches of another number are recalculated.
+        update:         Whether 'sketches.meta' is written if any sketch is calculated. Default: True
+
+    Returns:
+        List[RelationSketch]:   The sketches, in the order of the relation names
+    """
+    path = os.path.join(kbPath, SKETCH_FILE_NAME)
+    context = "%d:%d" % (_SKETCH_VERSION, permutations)
+    entries = dict()        # relation file name -> {"fingerprint": list, "sketch": dict}
+    if os.path.isfile(path):
+        with open(path, 'r') as ifd:
+            try:
+                cached = json.load(ifd)
+            except ValueError:
+                cached = dict()
+        if cached.get("context") == context:
+            entries = cached["relations"]
+
+    sketches = []
+    used = dict()
+    changed = False
+    for rel_file_path in glob("%s/*.rel" % kbPath):
+        file_name = os.path.basename(rel_file_path)
+        rel_name, arity, _ = parseRelFilePath(rel_file_path)
+        fingerprint = fileFingerprint(rel_file_path)
+        entry = entries.get(file_name)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            sketch = entry["sketch"]
+            sketch = RelationSketch(
+                rel_name, arity, sketch["records"], _decodeSignature(sketch["recordSignature"]),
+                _decodeSignature(sketch["inverseSignature"]), sketch["columnSizes"],
+                [_decodeSignature(signature) for signature in sketch["columnSignatures"]]
+            )
+        else:
+            sketch = sketchRelation(rel_name, readRelFile(rel_file_path), permutations)
+            entry = {"fingerprint": fingerprint, "sketch": {
+                "records": sketch.records, "recordSignature": _encodeSignature(sketch.recordSignature),
+                "inverseSignature": _encodeSignature(sketch.inverseSignature), "columnSizes": sketch.columnSizes,
+                "columnSignatures": [_encodeSignature(signature) for signature in sketch.columnSignatures]
+            }}
+            changed = True
+        used[file_name] = entry
+        sketches.append(sketch)
+    if update and (changed or len(used) != len(entries)):
+        with open(path + ".tmp", 'w') as ofd:
+            json.dump({"context": context, "relations": used}, ofd)
+        os.replace(path + ".tmp", path)
+    return sorted(sketches, key=lambda sketch: sketch.name)
+
+class SimilarPair(NamedTuple):
+    left: str
+    leftColumn: int             # The column of the value set of 'left'. 'None' for the records.
+    right: str
+    rightColumn: int            # The column of the value set of 'right'. 'None' for the records.
+    permutation: tuple          # The permutation of the columns of 'right' (see 'KbRelation.intersect'). 'None' for
+                                # value sets.
+    jaccard: float              # Estimated Jaccard similarity
+    containment: float          # Estimated proportion of 'left' in 'right'
+
+class _Entry(NamedTuple):
+    relation: str
+    column: int                 # 'None' for records
+    permutation: tuple          # 'None' for value sets
+    arity: int                  # Arity of the relation for records, 0 for value sets, as only sets of the same arity
+                                # are compared
+    size: int
+    signature: np.ndarray
+
+class SketchIndex:
+    """
+    LSH index of the sketches of the relations of a KB, partitioned by set size. The colliding pairs of a band width
+    are found when a query first needs them, by sorting the hashes of the bands of all sets.
+    """
+
+    def __init__(self, sketches: List[RelationSketch], partitions: int = 8) -> None:
+        """
+        Parameters:
+            sketches:       The sketches of the relations
+            partitions:     The maximum number of size partitions. The partitions are of about equal number of sets.
+        """
+        self._entries = []
+        for sketch in sketches:
+            self._entries.append(_Entry(
+                sketch.name, None, None, sketch.arity, sketch.records, sketch.recordSignature
+            ))
+            if sketch.inverseSignature is not None:
+                self._entries.append(_Entry(
+                    sketch.name, None, (1, 0), sketch.arity, sketch.records, sketch.inverseSignature
+                ))
+            for column, (size, signature) in enumerate(zip(sketch.columnSizes, sketch.columnSignatures)):
+                self._entries.append(_Entry(sketch.name, column, None, 0, size, signature))
+        self._permutations = len(self._entries[0].signature) if self._entries else DEFAULT_PERMUTATIONS
+        self._signatures = np.array([entry.signature for entry in self._entries], dtype=np.uint64).reshape(
+            len(self._entries), self._permutations
+        )
+        self._sizes = np.array([entry.size for entry in self._entries], dtype=np.int64)
+
+        # Partitions by size: the upper bounds of the sizes, and the partition of each set
+        sizes = np.sort(self._sizes)
+        if 0 == len(sizes):
+            self._bounds = np.zeros(0, dtype=np.int64)
+        else:
+            self._bounds = np.unique(sizes[np.linspace(0, len(sizes) - 1, max(1, partitions) + 1).astype(int)[1:]])
+        self._partitionOf = np.searchsorted(self._bounds, self._sizes)
+        self._collisions = dict()   # band width -> (#pairs, 2) array of the sets colliding in any band
+
+    def __bandWidths(self, jaccard: np.ndarray) -> np.ndarray:
+        """
+        Choose for each Jaccard similarity the widest band whose collision threshold '(1 / bands) ^ (1 / width)' is not
+        above it, so that the sets of that similarity collide in some band with high probability.
+        """
+        widths = np.ones(jaccard.shape, dtype=np.int64)
+        for width in range(2, self._permutations + 1):
+            if 0 == self._permutations % width:
+                widths[(width / self._permutations) ** (1 / width) <= jaccard] = width
+        return widths
+
+    def __collidingPairs(self, width: int) -> np.ndarray:
+        pairs = self._collisions.get(width)
+        if pairs is None:
+            bands = self._permutations // width
+            values = self._signatures.reshape(len(self._entries), bands, width)
+            hashes = np.broadcast_to(np.arange(bands, dtype=np.uint64), (len(self._entries), bands))
+            for column in range(width):
+                hashes = _mix(hashes * _GOLDEN + values[:, :, column])
+            hashes = hashes.ravel()
+            order = np.argsort(hashes, kind='stable')
+            hashes = hashes[order]
+            entries = order // bands
+
+            # Pair every set with the others in its group of equal hashes
+            starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+            counts = np.diff(np.append(starts, len(hashes)))
+            group_starts = np.repeat(starts, counts)
+            group_counts = np.repeat(counts, counts)
+            selected = 1 < group_counts
+            group_starts = group_starts[selected]
+            group_counts = group_counts[selected]
+            lefts = np.repeat(entries[selected], group_counts)
+            offsets = np.cumsum(group_counts) - group_counts
+            rights = entries[np.repeat(group_starts - offsets, group_counts) + np.arange(int(group_counts.sum()))]
+            codes = np.unique(lefts * len(self._entries) + rights)
+            pairs = np.stack([codes // len(self._entries), codes % len(self._entries)], axis=1)
+            pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+            self._collisions[width] = pairs
+        return pairs
+
+    def candidates(self, threshold: float = 0.8, slack: float = 0.1) -> List[SimilarPair]:
+        """
+        Find the pairs of sets where the first is estimated to be contained in the second by at least a threshold.
+        Records are paired with the records and the inverse records of relations of the same arity, and value sets
+        with value sets. A relation is paired with its own inverse (symmetry) and its own columns, but not with itself.
+
+        The containment of a set much smaller than the other (by more than the length of the signatures) is mostly
+        estimated as 0, as the Jaccard similarity is below the resolution of the signatures.
+
+        Parameters:
+            threshold:  The containment threshold, in (0, 1]
+            slack:      The margin below the threshold for the error of the estimates. Default: 0.1
+
+        Returns:
+            List[SimilarPair]:  The candidate pairs, by descending containment
+        """
+        if 0 == len(self._entries):
+            return []
+        threshold = max(threshold - slack, 1 / self._permutations)
+
+        # The band width of each set as the left side of a pair, for each partition of the right side
+        sizes = self._sizes[:, None].astype(float)
+        contained = threshold * sizes
+        widths = self.__bandWidths(contained / (sizes + self._bounds[None, :] - contained))
+        widths[contained > self._bounds[None, :]] = 0   # The sets of the partition are too small
+        queried = np.array([entry.permutation is None for entry in self._entries]) & (0 < self._sizes)
+        widths[~queried] = 0
+
+        pairs = []
+        for width in np.unique(widths[0 < widths]):
+            colliding = self.__collidingPairs(int(width))
+            pairs.append(colliding[widths[colliding[:, 0], self._partitionOf[colliding[:, 1]]] == width])
+        pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+        arities = np.array([entry.arity for entry in self._entries])
+        columns = np.array([-1 if entry.column is None else entry.column for entry in self._entries])
+        relations = np.unique([entry.relation for entry in self._entries], return_inverse=True)[1]
+        left, right = pairs[:, 0], pairs[:, 1]
+        itself = (relations[left] == relations[right]) & (columns[left] == columns[right]) & queried[right]
+        pairs = pairs[(arities[left] == arities[right]) & ~itself]
+
+        # Estimate the containment
+        left, right = pairs[:, 0], pairs[:, 1]
+        jaccard = (self._signatures[left] == self._signatures[right]).mean(axis=1)
+        containment = np.minimum(
+            1.0, jaccard * (self._sizes[left] + self._sizes[right]) / (1 + jaccard) / self._sizes[left]
+        )
+        selected = containment >= threshold
+        result = []
+        for left_idx, right_idx, pair_jaccard, pair_containment in zip(
+            left[selected].tolist(), right[selected].tolist(), jaccard[selected].tolist(),
+            containment[selected].tolist()
+        ):
+            entry = self._entries[left_idx]
+            other = self._entries[right_idx]
+            result.append(SimilarPair(
+                entry.relation, entry.column, other.relation, other.column, other.permutation, pair_jaccard,
+                pair_containment
+            ))
+        return sorted(result, key=lambda pair: (-pair.containment, pair.left, pair.right))
+
+def exactContainment(kb: NumeratedKb, pair: SimilarPair) -> float:
+    """
+    Calculate the exact proportion of the left set of a pair in the right set.
+    """
+    left = kb.getRelationByName(pair.left)
+    right = kb.getRelationByName(pair.right)
+    if pair.leftColumn is None:
+        return left.intersect(right, pair.permutation, count=True) / max(left.totalRecords(), 1)
+    left_values = np.unique(left.sortedArray()[:, pair.leftColumn])
+    right_values = np.unique(right.sortedArray()[:, pair.rightColumn])
+    return int(np.isin(left_values, right_values, assume_unique=True).sum()) / max(len(left_values), 1)
+
+def exhaustivePairs(kb: NumeratedKb, threshold: float = 0.8) -> List[Tuple]:
+    """
+    Find the pairs of record sets with containment of at least a threshold by counting the intersection of every pair
+    of relations of the same arity, and of every relation with the inverse of every binary relation.
+
+    Returns:
+        List[Tuple]:    (left, right, permutation) of the pairs
+    """
+    pairs = []
+    relations = sorted(kb.getRelationSet(), key=lambda relation: relation.getName())
+    for left in relations:
+        if 0 == left.totalRecords():
+            continue
+        for right in relations:
+            if right.getArity() != left.getArity():
+                continue
+            for permutation in ([None, (1, 0)] if 2 == left.getArity() else [None]):
+                if right is left and permutation is None:
+                    continue
+                if left.intersect(right, permutation, count=True) >= threshold * left.totalRecords():
+                    pairs.append((left.getName(), right.getName(), permutation))
+    return pairs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Find candidate pairs of similar relations of KBs by MinHash sketches and LSH"
+    )
+    parser.add_argument('paths', nargs='+', help="paths of KBs in the numerated format")
+    parser.add_argument('--threshold', '-t', type=float, default=0.8, help="containment threshold (default: 0.8)")
+    parser.add_argument('--permutations', '-k', type=int, default=DEFAULT_PERMUTATIONS, help="signature length")
+    parser.add_argument('--exact', '-e', action='store_true',
+                        help="check the candidates exactly and compare with counting all pairs of relations")
+    args = parser.parse_args()
+    for kb_path in args.paths:
+        kb_path = os.path.normpath(kb_path)
+        start = time.perf_counter()
+        sketches = loadSketches(kb_path, args.permutations)
+        sketched = time.perf_counter()
+        pairs = SketchIndex(sketches).candidates(args.threshold)
+        searched = time.perf_counter()
+        print("%s: %d relations sketched in %.2fs, %d candidate pairs found in %.2fs" % (
+            kb_path, len(sketches), sketched - start, len(pairs), searched - sketched
+        ))
+        kb = NumeratedKb(os.path.basename(kb_path), os.path.dirname(kb_path)) if args.exact else None
+        for pair in pairs:
+            print("  %s%s %s %s%s%s: jaccard %.2f, containment %.2f%s" % (
+                pair.left, "" if pair.leftColumn is None else "[%d]" % pair.leftColumn, "in", pair.right,
+                "" if pair.rightColumn is None else "[%d]" % pair.rightColumn,
+                "" if pair.permutation is None else " (inverse)", pair.jaccard, pair.containment,
+                "" if kb is None else " (exact %.2f)" % exactContainment(kb, pair)
+            ))
+        if kb is not None:
+            start = time.perf_counter()
+            exhaustive = exhaustivePairs(kb, args.threshold)
+            elapsed = time.perf_counter() - start
+            found = set((pair.left, pair.right, pair.permutation) for pair in pairs if pair.leftColumn is None)
+            print("%s: %d record pairs by counting all pairs in %.2fs, %d of them among the candidates" % (
+                kb_path, len(exhaustive), elapsed, len(found & set(exhaustive))
+            ))
@@ -1,18 +1,951 @@
-def dumpKbStatistics(kbPath):
+from glob import glob
+from time import strptime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import resource
+import time
+import unicodedata
+import numpy as np
+
+try:
+    from numeratedkb import (
+        BINARY_MAP_FILE_NAME, MAP_FILE_PATTERN, BinaryMap, KbException, encodeRecordKeys, findRelFilePath,
+        getBinaryMapFilePath, hasTextMap, iterateMapEntries, parseRelFilePath, readRelFile
+    )
+    from kbreport import openReport
+except ImportError:
+    from common.numeratedkb import (
+        BINARY_MAP_FILE_NAME, MAP_FILE_PATTERN, BinaryMap, KbException, encodeRecordKeys, findRelFilePath,
+        getBinaryMapFilePath, hasTextMap, iterateMapEntries, parseRelFilePath, readRelFile
+    )
+    from common.kbreport import openReport
+
+"""
+This file defines the statistics of the relations in a numerated KB. The statistics are calculated from the integer
+columns of the '.rel' files with vectorized operations.
+"""
+
+# Distinct values are counted with 'bincount' if the largest value is within this factor of the number of values.
+# Otherwise, the counting array would be too sparse and sorting ('unique') is used instead.
+_BINCOUNT_FACTOR = 8
+
+# A relation is flagged as a property (or reified) if more than this proportion of its records have a literal or a class
+# as the object (or have an index argument)
+_FLAG_RATIO = 0.5
+
+_DATE_FORMATS = ('%Y-%m-%d', '%y-%m-%d')
+_DATE_PATTERN = re.compile(r"[\d#]{2,4}-[\d#]{1,2}-[\d# ]{1,2}")    # Necessary condition of the date formats
+_NUMBER_PREFIX = re.compile(r"[\s\d#+\-.iInN]")  # Names not starting with these are neither numbers nor dates
+
+# Classification codes of numerations, as bit flags. An entity has no flag.
+CLASS_ENTITY = 0
+CLASS_DATE = 1
+CLASS_INTEGER = 2
+CLASS_FLOAT = 4
+CLASS_INDEX = 8         # A number that is an index id, set together with 'CLASS_INTEGER' or 'CLASS_FLOAT'
+CLASS_TYPE = 16         # An object of the type relation
+CLASS_RELATION = 32
+CLASS_UNMAPPED = 128    # A numeration that is not mapped to any name
+CLASS_LITERAL = CLASS_DATE | CLASS_INTEGER | CLASS_FLOAT
+
+_CLASSIFICATION_FILE_NAME = "classification.meta"
+_CLASSIFICATION_VERSION = 1
+
+# Working-set model of calculating the statistics of a relation, measured with tracemalloc on FB15K and webkb
+_TASK_OVERHEAD_BYTES = 1 << 20
+_BYTES_PER_ARGUMENT = 16        # The records, the sorted copy and the degree counts
+_BYTES_PER_RECORD = 48          # The encoded pairs and their sorted and reversed copies
+
+_CACHE_FILE_NAME = "kbstat.meta"
+_CACHE_VERSION = 1
+_HASH_CHUNK_SIZE = 1 << 20
+
+class RelationStatistics(NamedTuple):
+    """
+    Statistics of a single relation.
+    """
+    name: str               # The relation name
+    numeration: int         # The mapped numeration of the relation
+    arity: int              # The arity of the relation
+    records: int            # The number of records in the relation
+    entities: int           # The number of different entities in all arguments
+    subjects: int           # The number of different subjects (the first argument)
+    objects: int            # The number of different objects (the last argument). 0 for unary relations
+    functionality: float    # #subjects / #entities
+    symmetricPairs: int     # The number of records whose reversed (object, subject) pair is also in the relation
+    symmetricity: float     # #symmetric pairs / #records
+    propertyRatio: float    # The proportion of records whose object is a literal or a class
+    reifiedRatio: float     # The proportion of records that have an index argument
+
+    def isProperty(self) -> bool:
+        return self.propertyRatio > _FLAG_RATIO
+
+    def isReified(self) -> bool:
+        return self.reifiedRatio > _FLAG_RATIO
+
+class MapSummary(NamedTuple):
+    """
+    Summary of the numeration map of a KB, collected by streaming the map files.
+    """
+    mappings: int           # The number of mapping entries
+    maxNumeration: int      # The largest mapped numeration
+    classes: np.ndarray     # Classification codes indexed by numeration, see 'CLASS_*'
+    relations: Dict[str, int]   # Numerations of the requested relation names
+
+    @property
+    def literals(self) -> np.ndarray:
+        """
+        Boolean mask indexed by numeration, True for dates and numbers that are not indices
+        """
+        return ((self.classes & CLASS_LITERAL) != 0) & ((self.classes & (CLASS_INDEX | CLASS_UNMAPPED)) == 0)
+
+    @property
+    def indices(self) -> np.ndarray:
+        """
+        Boolean mask indexed by numeration, True for index ids
+        """
+        return ((self.classes & CLASS_INDEX) != 0) & ((self.classes & CLASS_UNMAPPED) == 0)
+
+    def propertyMask(self) -> np.ndarray:
+        """
+        Boolean mask indexed by numeration, True for the values of properties, i.e., literals and types
+        """
+        return self.literals | ((self.classes & (CLASS_TYPE | CLASS_UNMAPPED)) == CLASS_TYPE)
+
+    def countClasses(self, code: int) -> int:
+        """
+        Count the mapped numerations that have any of the flags in 'code'.
+        """
+        return int(np.count_nonzero(((self.classes & code) != 0) & ((self.classes & CLASS_UNMAPPED) == 0)))
+
+def isDate(name: str) -> bool:
+    """
+    Check if a name is a date in the format of 'YYYY-MM-DD' or 'YY-MM-DD'. '#' is a wildcard for a digit.
+    """
+    if _DATE_PATTERN.fullmatch(name) is None:
+        return False
+    name = name.replace('#', '1')
+    for date_format in _DATE_FORMATS:
+        try:
+            strptime(name, date_format)
+            return True
+        except ValueError:
+            continue
+    return False
+
+def isNumber(name: str) -> bool:
+    """
+    Check if a name is an integer or a float number, including single numeric unicode characters.
+    """
+    try:
+        float(name)
+        return True
+    except ValueError:
+        pass
+    if 1 == len(name):
+        try:
+            unicodedata.numeric(name)
+            return True
+        except ValueError:
+            pass
+    return False
+
+def classifyName(name: str, integers: Set[str] = None) -> int:
+    """
+    Classify a name into a code of 'CLASS_DATE', 'CLASS_INTEGER', 'CLASS_FLOAT' or 'CLASS_ENTITY'. A number is also
+    flagged by 'CLASS_INDEX' if it is not in 'integers'.
+
+    Parameters:
+        name:       The name
+        integers:   The integer names that are not indices. If not 'None', all other numbers are taken as index ids.
+
+    Returns:
+        int:        The classification code
+    """
+    if 1 < len(name) and _NUMBER_PREFIX.match(name) is None:
+        return CLASS_ENTITY
+    if isNumber(name):
+        try:
+            int(name)
+            code = CLASS_INTEGER
+        except ValueError:
+            code = CLASS_FLOAT
+        if integers is not None and name not in integers:
+            code |= CLASS_INDEX
+        return code
+    if isDate(name):
+        return CLASS_DATE
+    return CLASS_ENTITY
+
+def summarizeMap(kbPath: str, integers: Set[str] = None, relNames: Set[str] = set()) -> MapSummary:
+    """
+    Stream the map files of a KB once and classify the names. Only one byte of classification code is kept for each
+    numeration during the scan.
+
+    Parameters:
+        kbPath:     The input KB path.
+        integers:   The integer names that are not indices. If not 'None', all other numbers are taken as index ids.
+        relNames:   The relation names of which the numerations should be returned
+
+    Returns:
+        MapSummary: The summary of the map
+    """
+    codes = bytearray()
+    relations = dict()
+    mappings = 0
+    for name, num in iterateMapEntries(kbPath):
+        mappings += 1
+        if len(codes) <= num:
+            codes.extend(b'\x80' * (num + 1 - len(codes)))
+        if name in relNames:
+            relations[name] = num
+            codes[num] = CLASS_RELATION
+        else:
+            codes[num] = classifyName(name, integers)
+    if 0 == len(codes):
+        codes.append(CLASS_UNMAPPED)
+    return MapSummary(mappings, len(codes) - 1, np.frombuffer(codes, dtype=np.uint8), relations)
+
+def lookupNames(kbPath: str, nums: Iterable[int]) -> Dict[int, str]:
+    """
+    Stream the map files of a KB to find the names of a few numerations, without loading the whole map. The names are
+    looked up directly in a map of the binary format.
+
+    Parameters:
+        kbPath:     The input KB path.
+        nums:       The numerations
+
+    Returns:
+        Dict[int, str]: The names of the numerations that are mapped
+    """
+    nums = set(nums)
+    names = dict()
+    if not nums:
+        return names
+    if not hasTextMap(kbPath) and os.path.isfile(getBinaryMapFilePath(kbPath)):
+        binary_map = BinaryMap.open(getBinaryMapFilePath(kbPath))
+        for num in nums:
+            name = binary_map.num2Name(num)
+            if name is not None:
+                names[num] = name
+        return names
+    for name, num in iterateMapEntries(kbPath):
+        if num in nums:
+            names[num] = name
+    return names
+
+def markTypes(summary: MapSummary, typeRecords: np.ndarray) -> None:
+    """
+    Flag the objects of the type relation by 'CLASS_TYPE' in the summary.
+    """
+    if 1 < typeRecords.shape[1]:
+        summary.classes[np.unique(typeRecords[:, 1])] |= CLASS_TYPE
+
+def loadRelationArray(kbPath: str, relName: str, arity: int, records: int, mmap: bool = False) -> np.ndarray:
+    """
+    Read a '.rel' file of any id width into an integer array ('readRelFile' in 'numeratedkb').
+
+    Parameters:
+        kbPath:     The input KB path.
+        relName:    The name of the relation
+        arity:      The arity of the relation
+        records:    The number of the records in the relation
+        mmap:       Whether the file is memory-mapped instead of read. Default: False
+
+    Returns:
+        np.ndarray: An array of shape (records, arity). Each row is a record.
+    """
+    return readRelFile(findRelFilePath(kbPath, relName, arity, records), mmap)
+
+def countDistinct(values: np.ndarray) -> int:
+    """
+    Count the number of different values in an array of non-negative integers.
+
+    Parameters:
+        values:     The integer array
+
+    Returns:
+        int:        The number of different values
+    """
+    values = np.ravel(values)
+    if 0 == values.size:
+        return 0
+    upper = int(values.max()) + 1
+    if upper <= _BINCOUNT_FACTOR * values.size:
+        return int(np.count_nonzero(np.bincount(values, minlength=upper)))
+    return int(np.unique(values).size)
+
+def countValues(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count the occurrences of the values in an array of non-negative integers.
+
+    Parameters:
+        values:     The integer array
+
+    Returns:
+        np.ndarray: The different values, in ascending order
+        np.ndarray: The number of occurrences of each value
+    """
+    values = np.ravel(values)
+    if 0 == values.size:
+        return values.astype(np.int64), np.zeros(0, dtype=np.int64)
+    upper = int(values.max()) + 1
+    if upper <= _BINCOUNT_FACTOR * values.size:
+        counts = np.bincount(values, minlength=upper)
+        nums = np.flatnonzero(counts)
+        return nums, counts[nums]
+    return np.unique(values, return_counts=True)
+
+def encodePairs(subjects: np.ndarray, objects: np.ndarray) -> np.ndarray:
+    """
+    Encode (subject, object) pairs into 64-bit keys. The subject takes the higher 32 bits and the object the lower 32
+    bits, so numerations must be smaller than 2^32.
+
+    Parameters:
+        subjects:   The subject column
+        objects:    The object column
+
+    Returns:
+        np.ndarray: The encoded keys in 'uint64'
+
+    Raises:
+        KbException:    A numeration does not fit in 32 bits
+    """
+    for values in (subjects, objects):
+        if 0 < values.size and (values.min() < 0 or values.max() >= 1 << 32):
+            raise KbException("Numerations do not fit in 32 bits: %d" % values[(values < 0) | (values >= 1 << 32)][0])
+    return (subjects.astype(np.uint64) << np.uint64(32)) | objects.astype(np.uint64)
+
+def countInversePairs(records1: np.ndarray, records2: np.ndarray) -> int:
+    """
+    Count the pairs (s, o) in 'records1' where (o, s) is a pair in 'records2'. A pair consists of the first and the
+    last argument of a record. If a pair appears in multiple records (when arity > 2), it is counted by the product
+    of its multiplicities in the two relations. The pairs are encoded into keys by 'encodeRecordKeys', which holds
+    numerations of any width, and the keys are intersected by sort-merge, which takes O(n log n) time.
+
+    Parameters:
+        records1:   The records of the first relation, in an array of shape (#records, arity)
+        records2:   The records of the second relation, in an array of shape (#records, arity)
+
+    Returns:
+        int:        The number of inverse pairs
+    """
+    if 2 > records1.shape[1] or 2 > records2.shape[1] or 0 == len(records1) or 0 == len(records2):
+        return 0
+    pair_keys1, pair_keys2 = encodeRecordKeys([records1[:, [0, -1]], records2[:, [-1, 0]]])
+    keys1, cnts1 = np.unique(pair_keys1, return_counts=True)
+    keys2, cnts2 = np.unique(pair_keys2, return_counts=True)
+    _, idx1, idx2 = np.intersect1d(keys1, keys2, assume_unique=True, return_indices=True)
+    return int(np.dot(cnts1[idx1], cnts2[idx2]))
+
+def countSymmetricPairs(records: np.ndarray) -> int:
+    """
+    Count the pairs (s, o) in a relation where (o, s) is also a pair in the relation. See 'countInversePairs'.
+
+    Parameters:
+        records:    The records of the relation, in an array of shape (#records, arity)
+
+    Returns:
+        int:        The number of symmetric pairs
+    """
+    return countInversePairs(records, records)
+
+def relationStatistics(
+    name: str, numeration: int, records: np.ndarray, propertyMask: np.ndarray = None, indexMask: np.ndarray = None
+) -> RelationStatistics:
+    """
+    Calculate the statistics of a relation.
+
+    Parameters:
+        name:           The name of the relation
+        numeration:     The numeration of the relation
+        records:        The records of the relation, in an array of shape (#records, arity)
+        propertyMask:   Boolean mask indexed by numeration, True for property values (literals and classes).
+                        Default: None, the property ratio is 0
+        indexMask:      Boolean mask indexed by numeration, True for index ids. Default: None, the reified ratio is 0
+
+    Returns:
+        RelationStatistics: The statistics of the relation
+    """
+    record_cnt, arity = records.shape
+    entities = countDistinct(records)
+    subjects = countDistinct(records[:, 0]) if 0 < arity else 0
+    objects = countDistinct(records[:, -1]) if 1 < arity else 0
+    functionality = subjects / entities if 0 < entities else 0.0
+    symmetric_pairs = countSymmetricPairs(records)
+    symmetricity = symmetric_pairs / record_cnt if 0 < record_cnt else 0.0
+    property_ratio = 0.0
+    if propertyMask is not None and 1 < arity and 0 < record_cnt:
+        property_ratio = int(np.count_nonzero(propertyMask[records[:, -1]])) / record_cnt
+    reified_ratio = 0.0
+    if indexMask is not None and 0 < record_cnt:
+        reified_ratio = int(np.count_nonzero(indexMask[records].any(axis=1))) / record_cnt
+    return RelationStatistics(
+        name, numeration, arity, record_cnt, entities, subjects, objects, functionality, symmetric_pairs, symmetricity,
+        property_ratio, reified_ratio
+    )
+
+class RelationPartial(NamedTuple):
+    """
+    Partial result of a single relation that can be merged into the statistics of the entire KB.
+    """
+    statistics: RelationStatistics
+    degreeNums: np.ndarray      # The numerations that appear in the relation
+    degreeCounts: np.ndarray    # The number of appearances of the above numerations in all arguments
+
+def relationPartial(
+    name: str, numeration: int, records: np.ndarray, propertyMask: np.ndarray = None, indexMask: np.ndarray = None
+) -> RelationPartial:
+    """
+    Calculate the statistics and the entity degrees of a relation. The parameters are the same as
+    'relationStatistics'.
+
+    Returns:
+        RelationPartial:    The partial result of the relation
+    """
+    stats = relationStatistics(name, numeration, records, propertyMask, indexMask)
+    degree_nums, degree_cnts = countValues(records)
+    return RelationPartial(stats, degree_nums, degree_cnts)
+
+class EntityDegrees:
+    """
+    Degrees of entities in a KB, i.e., the number of arguments an entity occupies in all relations, accumulated into a
+    single 32-bit array indexed by numeration.
+    """
+
+    def __init__(self, maxNumeration: int) -> None:
+        """
+        Parameters:
+            maxNumeration:  The largest numeration in the KB
+        """
+        self.degrees = np.zeros(maxNumeration + 1, dtype=np.uint32)
+
+    def addCounts(self, nums: np.ndarray, counts: np.ndarray) -> None:
+        """
+        Add the degrees of entities counted in a relation.
+
+        Parameters:
+            nums:       The different numerations in the relation
+            counts:     The number of occurrences of each numeration
+        """
+        self.degrees[nums] += counts.astype(np.uint32)
+
+    def addRecords(self, records: np.ndarray) -> None:
+        """
+        Add the degrees of entities in the records of a relation.
+
+        Parameters:
+            records:    The (#records, arity) integer array of a relation
+        """
+        self.addCounts(*countValues(records))
+
+    def total(self) -> int:
+        return int(self.degrees.sum(dtype=np.int64))
+
+    def distribution(self, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculate the degree distribution of entities.
+
+        Parameters:
+            mask:       Boolean mask indexed by numeration, True for the numerations counted as entities.
+                        Default: None, all numerations
+
+        Returns:
+            np.ndarray: The different degrees, in ascending order
+            np.ndarray: The number of entities of each degree
+        """
+        degrees = self.degrees if mask is None else self.degrees[mask]
+        return countValues(degrees)
+
+    def topHubs(self, k: int, mask: np.ndarray = None) -> List[Tuple[int, int]]:
+        """
+        Find the entities of the largest degrees.
+
+        Parameters:
+            k:          The number of hubs
+            mask:       Boolean mask indexed by numeration, True for the numerations counted as entities.
+                        Default: None, all numerations
+
+        Returns:
+            List[Tuple[int, int]]:  The numerations and the degrees of at most 'k' hubs, by descending degree and then
+                                    ascending numeration
+        """
+        if k <= 0:
+            return []
+        nums = np.arange(self.degrees.size) if mask is None else np.flatnonzero(mask)
+        degrees = self.degrees[nums]
+        if k < nums.size:
+            candidates = np.argpartition(degrees, nums.size - k)[nums.size - k:]
+            threshold = degrees[candidates].min()
+            nums = nums[degrees >= threshold]
+            degrees = self.degrees[nums]
+        order = np.lexsort((nums, -degrees.astype(np.int64)))[:k]
+        return [(int(nums[i]), int(degrees[i])) for i in order]
+
+class KbPartial:
+    """
+    Statistics reduced from the partial results of relations.
+    """
+
+    def __init__(self, maxNumeration: int) -> None:
+        """
+        Parameters:
+            maxNumeration:  The largest numeration in the KB
+        """
+        self.relations = 0
+        self.records = 0
+        self.degreeTotal = 0
+        self.degrees = EntityDegrees(maxNumeration)
+
+    def add(self, partial: RelationPartial) -> None:
+        """
+        Merge the partial result of a relation. The entity degrees of the relation are skipped if the partial result
+        is restored from a cache and has no degrees.
+        """
+        self.relations += 1
+        self.records += partial.statistics.records
+        self.degreeTotal += partial.statistics.arity * partial.statistics.records
+        if partial.degreeNums is not None:
+            self.degrees.addCounts(partial.degreeNums, partial.degreeCounts)
+
+    def totalDegree(self) -> int:
+        return self.degreeTotal
+
+    def averageDegree(self, entities: int) -> float:
+        return self.totalDegree() / entities if 0 < entities else 0.0
+
+def estimateWorkingSet(arity: int, records: int) -> int:
+    """
+    Estimate the peak memory, in bytes, of calculating the partial result of a relation.
+
+    Parameters:
+        arity:      The arity of the relation
+        records:    The number of records in the relation
+
+    Returns:
+        int:        The estimated bytes
+    """
+    return _TASK_OVERHEAD_BYTES + records * (arity * _BYTES_PER_ARGUMENT + _BYTES_PER_RECORD)
+
+def availableMemory() -> int:
+    """
+    Return the physical memory, in bytes, that is currently available. 'None' if it cannot be determined.
+    """
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def scheduleRelations(sizes: List[int], memoryBudget: int, workers: int) -> List[List[int]]:
+    """
+    Pack relations into batches that run concurrently. Each batch has at most 'workers' relations and the total
+    estimated size of a batch is within 'memoryBudget'. Relations are packed from the largest by first-fit, so a
+    relation that takes most of the budget runs alone while small relations are run together. A relation larger than
+    the budget is put in a batch of its own.
+
+    Parameters:
+        sizes:          The estimated working-set sizes of the relations
+        memoryBudget:   The memory budget, in bytes
+        workers:        The maximum number of concurrent relations
+
+    Returns:
+        List[List[int]]:    The batches of relation indices, in the order of execution
+    """
+    batches = []
+    loads = []
+    for idx in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for i in range(len(batches)):
+            if len(batches[i]) < workers and loads[i] + sizes[idx] <= memoryBudget:
+                batches[i].append(idx)
+                loads[i] += sizes[idx]
+                break
+        else:
+            batches.append([idx])
+            loads.append(sizes[idx])
+    return batches
+
+def mapRelations(
+    function: Callable, relations: Iterable, workers: int = 1, initializer: Callable = None, initargs: tuple = (),
+    memoryBudget: int = None, estimate: Callable = None
+) -> Iterator:
+    """
+    Apply 'function' to each of the relations and yield the results in the order of the relations. If 'workers' is
+    larger than 1, the function is applied in a pool of worker processes, otherwise in the current process.
+
+    If 'memoryBudget' is given, relations are run in batches planned by 'scheduleRelations', so that the estimated
+    working sets of the concurrent relations fit in the budget. The results are still yielded in order.
+
+    Parameters:
+        function:       The function applied to each relation. It must be picklable if 'workers' > 1.
+        relations:      The arguments of 'function', one for each relation
+        workers:        The number of worker processes. 'None' for all cores. Default: 1
+        initializer:    The function initializing the context of the workers. Default: None
+        initargs:       The arguments of 'initializer'. Default: ()
+        memoryBudget:   The memory budget, in bytes, of the concurrent relations. Default: None, no limit
+        estimate:       The function estimating the working set, in bytes, of a relation argument. Required if
+                        'memoryBudget' is given.
+
+    Returns:
+        Iterator:       The results of 'function'
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    if 1 >= workers:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(function, relations)
+        return
+    with multiprocessing.Pool(workers, initializer, initargs) as pool:
+        if memoryBudget is None:
+            yield from pool.imap(function, relations)
+            return
+
+        relations = list(relations)
+        results = dict()
+        next_idx = 0
+        for batch in scheduleRelations([estimate(relation) for relation in relations], memoryBudget, workers):
+            results.update(zip(batch, pool.map(function, [relations[idx] for idx in batch], chunksize=1)))
+            while next_idx in results:
+                yield results.pop(next_idx)
+                next_idx += 1
+
+def fileFingerprint(path: str, contentHash: bool = False) -> list:
+    """
+    Return the fingerprint of a file: the size and the modification time, or the size and the hash of the content.
+
+    Parameters:
+        path:           The path to the file
+        contentHash:    Whether the content is hashed instead of taking the modification time. Default: False
+
+    Returns:
+        list:           The fingerprint
+    """
+    stat = os.stat(path)
+    if not contentHash:
+        return [stat.st_size, stat.st_mtime_ns]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as ifd:
+        for chunk in iter(lambda: ifd.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return [stat.st_size, digest.hexdigest()]
+
+class StatisticsCache:
+    """
+    Cache of relation statistics, stored in a '.meta' file of the KB. An entry is keyed by the name of
+    the relation file and is valid as long as the fingerprint of the file does not change. All entries are dropped if
+    the context, e.g., the map and the classification settings, differs from that of the cache.
+    """
+
+    def __init__(self, kbPath: str, context: str, contentHash: bool = False, fileName: str = _CACHE_FILE_NAME) -> None:
+        """
+        Load the cache of a KB. If there is no cache file, or the cache is of another context, the cache is empty.
+
+        Parameters:
+            kbPath:         The input KB path.
+            context:        The digest of everything other than the relation files that the statistics depend on
+            contentHash:    Whether relation files are fingerprinted by content hash. Default: False
+            fileName:       The name of the cache file in the KB, so that statistics of different settings do not
+                            overwrite each other. Default: 'kbstat.meta'
+        """
+        self._path = os.path.join(kbPath, fileName)
+        self._context = "%d:%s:%s:%s" % (_CACHE_VERSION, ",".join(RelationStatistics._fields), contentHash, context)
+        self._contentHash = contentHash
+        self._entries = dict()      # relation file name -> {"fingerprint": list, "statistics": dict}
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+        if os.path.isfile(self._path):
+            with open(self._path, 'r') as ifd:
+                try:
+                    cache = json.load(ifd)
+                except ValueError:
+                    return
+            if cache.get("context") == self._context:
+                self._entries = cache["relations"]
+
+    def get(self, relFilePath: str) -> RelationStatistics:
+        """
+        Return the cached statistics of a relation file. 'None' if the file is not cached or has changed.
+        """
+        file_name = os.path.basename(relFilePath)
+        self._used.add(file_name)
+        entry = self._entries.get(file_name)
+        if entry is not None and entry["fingerprint"] == fileFingerprint(relFilePath, self._contentHash):
+            self.hits += 1
+            return RelationStatistics(**entry["statistics"])
+        self.misses += 1
+        return None
+
+    def put(self, relFilePath: str, statistics: RelationStatistics) -> None:
+        """
+        Cache the statistics of a relation file.
+        """
+        file_name = os.path.basename(relFilePath)
+        self._used.add(file_name)
+        self._entries[file_name] = {
+            "fingerprint": fileFingerprint(relFilePath, self._contentHash), "statistics": statistics._asdict()
+        }
+
+    def dump(self) -> None:
+        """
+        Write the cache to the KB. Entries of files that are not queried since the cache was loaded are dropped.
+        """
+        entries = dict((file_name, entry) for file_name, entry in self._entries.items() if file_name in self._used)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, 'w') as ofd:
+            json.dump({"context": self._context, "relations": entries}, ofd)
+        os.replace(tmp_path, self._path)
+
+def contextDigest(kbPath: str, contentHash: bool, *settings) -> str:
+    """
+    Digest the map files of a KB and other settings into the context of a 'StatisticsCache'.
+
+    Parameters:
+        kbPath:         The input KB path.
+        contentHash:    Whether the map files are fingerprinted by content hash
+        settings:       Other settings that the statistics depend on. Each of them is converted by 'repr'.
+
+    Returns:
+        str:            The digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for fname in sorted(os.listdir(kbPath)):
+        if MAP_FILE_PATTERN.match(fname) or BINARY_MAP_FILE_NAME == fname:
+            digest.update(repr((fname, fileFingerprint(os.path.join(kbPath, fname), contentHash))).encode())
+    for setting in settings:
+        digest.update(repr(setting).encode())
+    return digest.hexdigest()
+
+def loadMapSummary(
+    kbPath: str, integers: Set[str] = None, relNames: Set[str] = set(), typeRelation: Tuple[str, int, int] = None,
+    useCache: bool = True, contentHash: bool = False
+) -> MapSummary:
+    """
+    Load the map summary of a KB, with the objects of the type relation flagged. The summary is cached in the '.meta'
+    file 'classification.meta' of the KB and is only recalculated if the map files, the type relation or the
+    parameters change.
+
+    Parameters:
+        kbPath:         The input KB path.
+        integers:       The integer names that are not indices. If not 'None', all other numbers are index ids.
+        relNames:       The relation names of which the numerations should be returned
+        typeRelation:   The name, arity and the number of records of the type relation. Default: None, no type
+        useCache:       Whether the summary is read from and written to the cache. Default: True
+        contentHash:    Whether files are fingerprinted by content hash instead of the modification time.
+                        Default: False
+
+    Returns:
+        MapSummary:     The summary of the map
+    """
+    cache_path = os.path.join(kbPath, _CLASSIFICATION_FILE_NAME)
+    type_fingerprint = None
+    if typeRelation is not None:
+        type_fingerprint = fileFingerprint(findRelFilePath(kbPath, *typeRelation), contentHash)
+    context = contextDigest(
+        kbPath, contentHash, _CLASSIFICATION_VERSION, None if integers is None else sorted(integers),
+        sorted(relNames), typeRelation, type_fingerprint
+    )
+    if useCache and os.path.isfile(cache_path):
+        with open(cache_path, 'rb') as ifd:
+            try:
+                header = json.loads(ifd.readline())
+            except ValueError:
+                header = dict()
+            if header.get("context") == context:
+                classes = np.frombuffer(bytearray(ifd.read()), dtype=np.uint8)
+                return MapSummary(header["mappings"], classes.size - 1, classes, header["relations"])
+
+    summary = summarizeMap(kbPath, integers, relNames)
+    if typeRelation is not None:
+        markTypes(summary, loadRelationArray(kbPath, *typeRelation, mmap=True))
+    if useCache:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'wb') as ofd:
+            ofd.write(json.dumps({
+                "context": context, "mappings": summary.mappings, "relations": summary.relations
+            }).encode() + b'\n')
+            ofd.write(summary.classes.tobytes())
+        os.replace(tmp_path, cache_path)
+    return summary
+
+def mapRelationsWithCache(
+    cache: StatisticsCache, relFilePaths: List[str], function: Callable, relations: List, workers: int = 1,
+    initializer: Callable = None, initargs: tuple = (), memoryBudget: int = None, estimate: Callable = None,
+    cached: List[RelationStatistics] = None
+) -> Iterator[RelationPartial]:
+    """
+    The same as 'mapRelations', except that 'function' returns 'RelationPartial' and is only applied to the relations
+    that are not in the cache. Computed statistics are put into the cache. Cached relations are yielded as partial
+    results without degrees.
+
+    Parameters:
+        cache:          The statistics cache. 'None' if no cache is used, then all relations are calculated
+        relFilePaths:   The '.rel' file paths of the relations, in the same order as 'relations'
+        cached:         The statistics already looked up in the cache, 'None' for misses. Default: None, looked up here
+        Others are the same as 'mapRelations'
+
+    Returns:
+        Iterator[RelationPartial]:  The partial results of the relations, in order
+    """
+    if cache is None:
+        yield from mapRelations(function, relations, workers, initializer, initargs, memoryBudget, estimate)
+        return
+    if cached is None:
+        cached = [cache.get(rel_file_path) for rel_file_path in relFilePaths]
+    computed = mapRelations(
+        function, [relation for relation, stats in zip(relations, cached) if stats is None], workers, initializer,
+        initargs, memoryBudget, estimate
+    )
+    for rel_file_path, stats in zip(relFilePaths, cached):
+        if stats is None:
+            partial = next(computed)
+            cache.put(rel_file_path, partial.statistics)
+            yield partial
+        else:
+            yield RelationPartial(stats, None, None)
+
+_worker_context = None      # (kbPath, numerations, propertyMask, indexMask) in worker processes
+
+def _initRelationWorker(kbPath: str, numerations: Dict[str, int], propertyMask: np.ndarray, indexMask: np.ndarray):
+    global _worker_context
+    _worker_context = (kbPath, numerations, propertyMask, indexMask)
+
+def _relationWorker(relation: Tuple[str, int, int]) -> RelationPartial:
+    kb_path, numerations, property_mask, index_mask = _worker_context
+    rel_name, arity, record_cnt = relation
+    records = loadRelationArray(kb_path, rel_name, arity, record_cnt, mmap=True)
+    return relationPartial(rel_name, numerations.get(rel_name), records, property_mask, index_mask)
+
+class KbAnalysis:
+    """
+    A streaming pass calculating the statistics of the relations of a KB, shared by the reports of the KB. The
+    relations are listed and the map is summarized when the pass is created; the relations are calculated by
+    'relationStatistics'.
+    """
+
+    def __init__(
+        self, kbPath: str, integers: Set[str] = None, typeRelation: str = "type", useCache: bool = True,
+        contentHash: bool = False
+    ) -> None:
+        """
+        Parameters:
+            kbPath:         The input KB path. KB is in the Numerated Format.
+            integers:       The integer names that are not indices. If not 'None', other numbers are index ids and
+                            reified relations are detected. Default: None
+            typeRelation:   The relation that assigns entities (1st argument) to classes (2nd argument).
+                            Default: "type"
+            useCache:       Whether relation statistics are cached in the KB, so that only the changed relations are
+                            calculated in later runs. Default: True
+            contentHash:    Whether files are fingerprinted by content hash instead of the modification time.
+                            Default: False
+        """
+        self.kbPath = kbPath
+
+        # Relation files are only parsed by name here. The type relation comes first, then by descending size.
+        rel_file_paths = dict(
+            (parseRelFilePath(rel_file_path), rel_file_path) for rel_file_path in glob("%s/*.rel" % kbPath)
+        )
+        self.relations = sorted(
+            rel_file_paths, key=lambda relation: (relation[0] != typeRelation, -relation[2], relation[0])
+        )
+        self.relFilePaths = [rel_file_paths[relation] for relation in self.relations]
+        self.totalRecords = sum(record_cnt for _, _, record_cnt in self.relations)
+
+        type_relation = None
+        if 0 < len(self.relations) and self.relations[0][0] == typeRelation:
+            type_relation = self.relations[0]
+        self.mapSummary = loadMapSummary(
+            kbPath, integers, set(rel_name for rel_name, _, _ in self.relations), type_relation, useCache,
+            contentHash
+        )
+        self._indexMask = self.mapSummary.indices if integers is not None else None
+        self.cache = None
+        if useCache:
+            self.cache = StatisticsCache(kbPath, contextDigest(
+                kbPath, contentHash, None if integers is None else sorted(integers), typeRelation,
+                None if type_relation is None else fileFingerprint(self.relFilePaths[0], contentHash)
+            ), contentHash)
+        self.kbPartial = KbPartial(self.mapSummary.maxNumeration)
+
+    def entities(self) -> int:
+        """
+        Return the number of entities, i.e., the mappings other than the relations and the index ids.
+        """
+        return self.mapSummary.mappings - len(self.relations) - self.mapSummary.countClasses(CLASS_INDEX)
+
+    def classes(self) -> int:
+        return self.mapSummary.countClasses(CLASS_TYPE)
+
+    def relationStatistics(self, workers: int = 1, memoryBudget: int = None) -> Iterator[RelationStatistics]:
+        """
+        Calculate the statistics of the relations, in the order of 'relations'. Every '.rel' file is memory-mapped and
+        visited once, and the partial results are reduced into 'kbPartial', which is complete when the iteration ends.
+        With the cache, unchanged relations are only visited to count their entity degrees, and the cache is written
+        back when the iteration ends.
+
+        Parameters:
+            workers:        The number of worker processes calculating relation statistics. 'None' for all cores.
+                            Default: 1
+            memoryBudget:   The memory budget, in bytes, of the relations calculated concurrently. Default: None, the
+                            currently available memory
+
+        Returns:
+            Iterator[RelationStatistics]:   The statistics of the relations
+        """
+        if memoryBudget is None:
+            memoryBudget = availableMemory()
+        partials = mapRelationsWithCache(
+            self.cache, self.relFilePaths, _relationWorker, self.relations, workers, _initRelationWorker,
+            (self.kbPath, self.mapSummary.relations, self.mapSummary.propertyMask(), self._indexMask), memoryBudget,
+            lambda relation: estimateWorkingSet(relation[1], relation[2])
+        )
+        for partial in partials:
+            stats = partial.statistics
+            self.kbPartial.add(partial)
+            if partial.degreeNums is None:
+                self.kbPartial.degrees.addRecords(
+                    loadRelationArray(self.kbPath, stats.name, stats.arity, stats.records, mmap=True)
+                )
+            yield stats
+        if self.cache is not None:
+            self.cache.dump()
+            print("%d relations calculated, %d from cache" % (self.cache.misses, self.cache.hits))
+
+def dumpKbStatistics(
+    kbPath: str, outputPath: str = None, integers: Set[str] = None, typeRelation: str = "type", workers: int = 1,
+    memoryBudget: int = None, useCache: bool = True, contentHash: bool = False, hubs: int = 10
+) -> None:
     """
     Function to calculate the statistics of a given KB.
 
     Parameters:
-        kbPath:     the input KB path. KB is in the Numerated Format.
-        outputPath: The output path for the statistics file, in Excel spreadsheet format.
-                    The file should be at the same path with the KB, and the name of the file
-                    should be: <KB name>_statistics.xlsx
+        kbPath:         the input KB path. KB is in the Numerated Format.
+        outputPath:     The output path for the statistics file. The format is chosen by the extension, see
+                        'kbreport.openReport'. Default: None
+                        The file should be at the same path with the KB, and the name of the file
+                        should be: <KB name>_statistics.xlsx
+        integers:       The integer names that are not indices. If not 'None', other numbers are index ids and
+                        reified relations are detected. Default: None
+        typeRelation:   The relation that assigns entities (1st argument) to classes (2nd argument). Default: "type"
+        workers:        The number of worker processes calculating relation statistics. 'None' for all cores.
+                        Default: 1
+        memoryBudget:   The memory budget, in bytes, of the relations calculated concurrently. Default: None, the
+                        currently available memory
+        useCache:       Whether relation statistics are cached in the KB, so that only the changed relations are
+                        calculated in later runs. Default: True
+        contentHash:    Whether files are fingerprinted by content hash instead of the modification time.
+                        Default: False
+        hubs:           The number of entities of the largest degrees listed in the spreadsheet. Default: 10
     
     Returns:
         None
 
-    An Excel file should be written in the directory 'kbPath'.
-    The Excel spreadsheet file should contain the following sheets:
+    An Excel file should be written in the directory 'kbPath' by default.
+    The report should contain the following sheets:
         - Overview:
             - 1st row, the title row:
                 - KB: the name of the KB
@@ -35,5 +968,69 @@ def dumpKbStatistics(kbPath):
                 - functionality: the functionality value of the relation, round to 2 decimal places
                 - symmetricity: the proportion of symmetric pairs in the relation, round to 2 decimal places
             - other rows are the statistics of each relation
+        - Degrees:
+            - 1st row, the title row:
+                - degree: the number of arguments an entity occupies in all relations
+                - #entities: the number of entities of the degree
+            - other rows are the degree distribution, by ascending degree
+        - Hubs:
+            - 1st row, the title row:
+                - entity: the entity name
+                - id: mapped numerical id of the entity
+                - degree: the degree of the entity
+            - other rows are the entities of the largest degrees, by descending degree
+
+    The statistics are calculated in a single streaming pass: every '.rel' file is memory-mapped and visited once,
+    and only the working set of one relation is held at a time in each worker. The names in the map are classified
+    beforehand, together with the classes in the type relation, into one code per numeration, so that properties and
+    reified relations are checked by array lookups. Workers return partial results of
+    relations, which are reduced to the overview here in the order of the relations. Entity degrees are accumulated
+    into one array indexed by numeration. With the cache, unchanged relations are only visited to count their entity
+    degrees, and their cached statistics are reduced to the overview.
     """
-    raise Exception("Not Implemented")
\ No newline at end of file
+    start_time = time.perf_counter()
+    kb_name = os.path.basename(os.path.normpath(kbPath))
+    if outputPath is None:
+        outputPath = os.path.join(kbPath, "%s_statistics.xlsx" % kb_name)
+    analysis = KbAnalysis(kbPath, integers, typeRelation, useCache, contentHash)
+    total_records = analysis.totalRecords
+    entities = analysis.entities()
+
+    report = openReport(outputPath)
+    overview_sheet = report.addSheet("Overview", ["KB", "#relations", "#entities", "#classes", "avg. degr."])
+    relation_sheet = report.addSheet("Relations", [
+        "relation", "id", "#instances", "prop. (%)", "property", "reified", "#entities", "#subjects", "#objects",
+        "functionality", "symmetricity"
+    ])
+
+    for stats in analysis.relationStatistics(workers, memoryBudget):
+        relation_sheet.append([
+            stats.name, stats.numeration, stats.records,
+            round(stats.records / total_records * 100, 2) if 0 < total_records else 0.0,
+            stats.isProperty(), stats.isReified(), stats.entities, stats.subjects, stats.objects,
+            round(stats.functionality, 2), round(stats.symmetricity, 2)
+        ])
+
+    kb_partial = analysis.kbPartial
+    overview_sheet.append([
+        kb_name, kb_partial.relations, entities, analysis.classes(), round(kb_partial.averageDegree(entities), 2)
+    ])
+    entity_mask = (analysis.mapSummary.classes & (CLASS_RELATION | CLASS_INDEX | CLASS_UNMAPPED)) == 0
+    degree_sheet = report.addSheet("Degrees", ["degree", "#entities"])
+    for degree, entity_cnt in zip(*kb_partial.degrees.distribution(entity_mask)):
+        degree_sheet.append([int(degree), int(entity_cnt)])
+    hub_sheet = report.addSheet("Hubs", ["entity", "id", "degree"])
+    top_hubs = kb_partial.degrees.topHubs(hubs, entity_mask)
+    hub_names = lookupNames(kbPath, [num for num, _ in top_hubs])
+    for num, degree in top_hubs:
+        hub_sheet.append([hub_names.get(num), num, degree])
+    report.close()
+
+    elapsed = time.perf_counter() - start_time
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_worker_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    bytes_read = sum(os.path.getsize(rel_file_path) for rel_file_path in analysis.relFilePaths)
+    print("%d relations, %d records in %.2fs: %.0f records/s, %.1f MB/s; peak memory: %.1f MB (workers: %.1f MB)" % (
+        len(analysis.relations), total_records, elapsed, total_records / elapsed, bytes_read / elapsed / 1048576,
+        peak_memory, peak_worker_memory
+    ))
@@ -0,0 +1,99 @@
+from glob import glob
+from typing import List, NamedTuple
+import argparse
+import os
+import sys
+import time
+
+try:
+    from numeratedkb import (
+        CHECKSUM_FILE_NAME, computeChecksums, listChecksumFiles, parseRelFilePath, readChecksums, updateChecksums
+    )
+except ImportError:
+    from common.numeratedkb import (
+        CHECKSUM_FILE_NAME, computeChecksums, listChecksumFiles, parseRelFilePath, readChecksums, updateChecksums
+    )
+
+"""
+This file verifies the integrity of numerated KBs on disk without loading them. The '.rel' files and the map files are
+checked against the per-block CRC32 checksums in 'checksums.meta' ('updateChecksums' in 'numeratedkb'), which are read
+and checksummed in parallel by a pool of threads, and the size of every '.rel' file is checked against the arity, the
+number of records and the id width in its name.
+"""
+
+class KbProblem(NamedTuple):
+    fileName: str       # Name of the file in the KB
+    block: int          # Index of the corrupted block. 'None' if the problem is not of a block.
+    message: str
+
+def verifyKb(kbPath: str, workers: int = None) -> List[KbProblem]:
+    """
+    Verify the files of a KB.
+
+    Parameters:
+        kbPath:     The input KB path.
+        workers:    The number of threads reading the files. Default: None, the number of cores
+
+    Returns:
+        List[KbProblem]:    The problems found. The KB is intact if it is empty.
+    """
+    problems = []
+    for rel_file_path in sorted(glob("%s/*.rel" % kbPath)):
+        _, arity, record_cnt, width = parseRelFilePath(rel_file_path, True)
+        size = os.path.getsize(rel_file_path)
+        if size != arity * record_cnt * width:
+            problems.append(KbProblem(os.path.basename(rel_file_path), None, "size %d, %d x %d x %d expected" % (
+                size, arity, record_cnt, width
+            )))
+
+    checksums = readChecksums(kbPath)
+    if checksums is None:
+        problems.append(KbProblem(CHECKSUM_FILE_NAME, None, "no checksums"))
+        return problems
+    files = checksums["files"]
+    present = set(listChecksumFiles(kbPath))
+    problems.extend(KbProblem(fname, None, "no checksums") for fname in sorted(present - set(files)))
+    names = []
+    for fname in sorted(files):
+        if fname not in present:
+            problems.append(KbProblem(fname, None, "missing"))
+        elif os.path.getsize(os.path.join(kbPath, fname)) != files[fname]["size"]:
+            problems.append(KbProblem(fname, None, "size %d, %d recorded" % (
+                os.path.getsize(os.path.join(kbPath, fname)), files[fname]["size"]
+            )))
+        else:
+            names.append(fname)
+    for fname, actual in zip(names, computeChecksums(
+        [os.path.join(kbPath, fname) for fname in names], checksums["blockSize"], workers
+    )):
+        for block, (expected, checksum) in enumerate(zip(files[fname]["checksums"], actual)):
+            if expected != checksum:
+                problems.append(KbProblem(fname, block, "checksum mismatch"))
+    return problems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Verify numerated KBs against their block checksums")
+    parser.add_argument('paths', nargs='+', help="paths of KBs in the numerated format")
+    parser.add_argument('--update', '-u', action='store_true', help="write the checksums of changed files instead")
+    parser.add_argument('--workers', '-w', type=int, default=None, help="threads reading the files (default: cores)")
+    args = parser.parse_args()
+    intact = True
+    for kb_path in args.paths:
+        start = time.perf_counter()
+        total_bytes = sum(os.path.getsize(os.path.join(kb_path, fname)) for fname in listChecksumFiles(kb_path))
+        if args.update:
+            updateChecksums(kb_path, workers=args.workers)
+            problems = []
+        else:
+            problems = verifyKb(kb_path, args.workers)
+        elapsed = time.perf_counter() - start
+        for problem in problems:
+            print("%s: %s%s: %s" % (
+                kb_path, problem.fileName, "" if problem.block is None else " block %d" % problem.block, problem.message
+            ))
+        print("%s: %s, %d bytes in %.2fs (%.1f MB/s)" % (
+            kb_path, "updated" if args.update else ("intact" if not problems else "%d problems" % len(problems)),
+            total_bytes, elapsed, total_bytes / max(elapsed, 1e-9) / 1048576
+        ))
+        intact = intact and not problems
+    sys.exit(0 if intact else 1)
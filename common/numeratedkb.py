@@ -1,9 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
+from itertools import accumulate, chain, repeat
+from typing import Iterable, Iterator, List, Sequence, Set, Tuple, Union
+import array
+import json
+import mmap
 import struct
-from typing import Iterable, Set, Tuple
+import sys
 import os
 import re
 import heapq
+import zlib
+import numpy as np
 
 """
 This file defines the classes and operations for the Relation, the NumerationMap, and the NumeratedKB.
@@ -16,37 +24,150 @@ class KbException(Exception):
     def __init__(self, msg: str) -> None:
         self.msg = msg
 
-def getRelFilePath(kbPath: str, relName: str, arity: int, records: int) -> str:
+DEFAULT_ID_WIDTH = 4
+
+# Width of the ids in '.rel' files in bytes -> (tag in the file name, dtype of the ids in the file)
+_ID_WIDTHS = {
+    2: (".u16", '<u2'),
+    4: ("", '<i4'),
+    8: (".u64", '<i8'),
+}
+_REL_FILE_PATTERN = re.compile(r"(.+)_([0-9]+)_([0-9]+)(\.u16|\.u64)?\.rel$")
+_INT32_MAX = 0x7FFFFFFF
+
+def getRelFilePath(kbPath: str, relName: str, arity: int, records: int, width: int = DEFAULT_ID_WIDTH) -> str:
     """
-    Return the path of a relation file
+    Return the path of a relation file. The width of the ids is tagged in the file name, except for the default width
+    of 4 bytes: '<name>_<arity>_<records>.rel' for 4 bytes, '<name>_<arity>_<records>.u16.rel' for 2 bytes and
+    '<name>_<arity>_<records>.u64.rel' for 8 bytes.
 
     Parameters:
         kbPath:     The input KB path.
         relName:    The name of the relation
         arity:      The arity of the relation
         records:    The number of the records in the relation
+        width:      The width of the ids in bytes: 2, 4 or 8. Default: DEFAULT_ID_WIDTH
     
     Returns:
         The file path
     """
-    return os.path.join(kbPath, "%s_%d_%d.rel" % (relName, arity, records))
+    return os.path.join(kbPath, "%s_%d_%d%s.rel" % (relName, arity, records, _ID_WIDTHS[width][0]))
 
-def parseRelFilePath(path: str) -> Tuple[str, int, int]:
+def parseRelFilePath(path: str, withWidth: bool = False) -> Tuple:
     """
     Parse an absolute path to three components: relation name, arity, and #records.
 
     Parameters:
         path:       The absolute path to a '.rel' file
+        withWidth:  Whether the width of the ids is also returned. Default: False
 
     Returns:
         str:        Relation name
         int:        arity
         int:        #records
+        int:        The width of the ids in bytes, only if 'withWidth' is True
     """
     file_name = path.split(os.path.sep)[-1]
-    relation_name, arity, record_cnt = re.findall("(.+)_([0-9]+)_([0-9]+).rel$", file_name)[0]
+    relation_name, arity, record_cnt, tag = _REL_FILE_PATTERN.findall(file_name)[0]
+    if withWidth:
+        width = next(width for width, (width_tag, _) in _ID_WIDTHS.items() if width_tag == tag)
+        return (relation_name, int(arity), int(record_cnt), width)
     return (relation_name, int(arity), int(record_cnt))
 
+def idWidth(maxId: int) -> int:
+    """
+    Return the narrowest width of ids in '.rel' files that holds the ids up to 'maxId': 2 bytes (unsigned) up to
+    65,535, 4 bytes (signed, as in files without a width tag) up to 2^31 - 1, and 8 bytes otherwise.
+    """
+    if maxId <= 0xFFFF:
+        return 2
+    if maxId <= _INT32_MAX:
+        return 4
+    return 8
+
+def idDtype(maxId: int) -> np.dtype:
+    """
+    Return the integer type that arrays of ids up to 'maxId' are read into: int32, or int64 if the ids do not fit.
+    """
+    return np.dtype(np.int32) if maxId <= _INT32_MAX else np.dtype(np.int64)
+
+def findRelFilePath(kbPath: str, relName: str, arity: int, records: int) -> str:
+    """
+    Return the path of the existing relation file of any id width. The path of the default width is returned if no
+    such file exists.
+    """
+    for width in _ID_WIDTHS:
+        path = getRelFilePath(kbPath, relName, arity, records, width)
+        if os.path.isfile(path):
+            return path
+    return getRelFilePath(kbPath, relName, arity, records)
+
+def readRelFile(path: str, mmap: bool = False) -> np.ndarray:
+    """
+    Read a '.rel' file into a (#records, arity) integer array. The ids are widened so that files of all widths are read
+    into the same type: int32 for the widths of 2 and 4 bytes, and int64 for 8 bytes.
+
+    Parameters:
+        path:       The path of the '.rel' file
+        mmap:       Whether the file is memory-mapped instead of read, if its ids need no widening. Default: False
+
+    Returns:
+        np.ndarray: An array of shape (records, arity). Each row is a record.
+    """
+    _, arity, records, width = parseRelFilePath(path, True)
+    dtype = _ID_WIDTHS[width][1]
+    if mmap and 0 < records and 2 != width:
+        return np.memmap(path, dtype=dtype, mode='r', shape=(records, arity))
+    values = np.fromfile(path, dtype=dtype, count=records * arity).reshape(records, arity)
+    return values.astype(np.int32) if 2 == width else values
+
+def writeRelFile(kbPath: str, relName: str, records: np.ndarray) -> str:
+    """
+    Write the records of a relation to a '.rel' file of the narrowest id width ('idWidth'). The records are written
+    to a temporary file first, which is then renamed to the '.rel' file.
+
+    Parameters:
+        kbPath:     The output KB path
+        relName:    The name of the relation
+        records:    The (#records, arity) integer array
+
+    Returns:
+        str:        The path of the '.rel' file
+    """
+    record_cnt, arity = records.shape
+    width = idWidth(int(records.max())) if 0 < records.size else 2
+    path = getRelFilePath(kbPath, relName, arity, record_cnt, width)
+    records.astype(_ID_WIDTHS[width][1]).tofile(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return path
+
+def encodeRecordKeys(arrays: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Encode the records of arrays of the same arity into int64 keys, one per record, such that equal records have equal
+    keys and the order of the keys is the lexicographic order of the records. The columns are combined in a mixed radix
+    if the keys fit into 63 bits, otherwise the records are coded by their rank among the distinct records of all arrays.
+
+    Parameters:
+        arrays:     The (#records, arity) integer arrays
+
+    Returns:
+        List[np.ndarray]:   The key arrays, in the order of 'arrays'
+    """
+    arity = arrays[0].shape[1]
+    low = min((int(values.min()) for values in arrays if 0 < values.size), default=0)
+    high = max((int(values.max()) for values in arrays if 0 < values.size), default=0)
+    radix = high - low + 1
+    if radix ** arity < 1 << 63:
+        keys = []
+        for values in arrays:
+            key = np.zeros(len(values), dtype=np.int64)
+            for column in range(arity):
+                key = key * radix + (values[:, column].astype(np.int64) - low)
+            keys.append(key)
+        return keys
+    codes = np.unique(np.concatenate(arrays), axis=0, return_inverse=True)[1].ravel().astype(np.int64)
+    return np.split(codes, np.cumsum([len(values) for values in arrays])[:-1])
+
 def getMapFilePath(kbPath: str, num: int) -> str:
     """
     Return the path of the 'num'-th map file
@@ -73,10 +194,534 @@ def getKbPath(kbName:str, basePath: str) -> str:
     """
     return os.path.join(basePath, kbName)
 
+MAP_FILE_PATTERN = re.compile("map[0-9]+.tsv$")
+BINARY_MAP_FILE_NAME = "map.bin"
+
+_BINARY_MAP_MAGIC = b"NMAP"
+_BINARY_MAP_VERSION = 1
+_BINARY_MAP_HEADER_FORMAT = '<4sIQQQQ'     # magic, version, #numerations, #mappings, blob size, hash table size
+_BINARY_MAP_HEADER_SIZE = struct.calcsize(_BINARY_MAP_HEADER_FORMAT)
+
+def getBinaryMapFilePath(kbPath: str) -> str:
+    """
+    Return the path of the binary map file
+
+    Parameters:
+        kbPath:     The input KB path.
+
+    Returns:
+        The file path
+    """
+    return os.path.join(kbPath, BINARY_MAP_FILE_NAME)
+
+def hasTextMap(kbPath: str) -> bool:
+    """
+    Check if there are map files of the text format ('map<N>.tsv') in the KB.
+    """
+    return any(MAP_FILE_PATTERN.match(fname) for fname in os.listdir(kbPath))
+
+def iterateMapEntries(kbPath: str) -> Iterator[Tuple[str, int]]:
+    """
+    Iterate over the mapping entries of a KB without loading the whole map. The map files of the text format are read
+    if there are any, otherwise the binary map file.
+
+    Parameters:
+        kbPath:     The input KB path.
+
+    Returns:
+        Iterator[Tuple[str, int]]:  The name and the numeration of each entry
+    """
+    if hasTextMap(kbPath) or not os.path.isfile(getBinaryMapFilePath(kbPath)):
+        for fname in os.listdir(kbPath):
+            fpath = os.path.join(kbPath, fname)
+            if os.path.isfile(fpath) and MAP_FILE_PATTERN.match(fname):
+                with open(fpath, 'r') as map_file:
+                    for line in map_file:
+                        name, num = line.strip().split('\t')
+                        yield (name, int(num, 16))
+    else:
+        binary_map = BinaryMap.open(getBinaryMapFilePath(kbPath))
+        yield from ((name, num) for num, name in binary_map.entries())
+
+def _writeAtomically(path: str, content: bytes) -> None:
+    """
+    Write a file through a temporary file that is renamed to 'path', so that the file is either completely written or
+    not changed at all.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as ofd:
+        ofd.write(content)
+    os.replace(tmp_path, path)
+
+def _hashName(name: bytes) -> int:
+    return zlib.crc32(name)
+
+def _littleEndian(values: array.array) -> bytes:
+    if 'big' == sys.byteorder:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def encodeBinaryMap(names: List[bytes], hashTable: bool = True) -> bytes:
+    """
+    Encode a numeration map into the binary format. The layout is (all integers are little-endian):
+        - Header:       magic 'NMAP', version (uint32), #numerations N (= max numeration + 1), #mappings, blob size and
+                        hash table size T (uint64 each)
+        - Flags:        N bytes, 1 for mapped numerations, padded to 8 bytes
+        - Offsets:      N + 1 offsets into the blob (uint64). The name of numeration 'i' is 'blob[offsets[i]:offsets[i+1]]'
+        - Hash table:   T numerations (uint32), 0 for empty slots. A name is hashed by CRC32 into slot 'crc & (T - 1)'
+                        and collisions are resolved by linear probing. T is 0 if there is no hash table.
+        - Blob:         UTF-8 names in the order of numerations, padded to 8 bytes
+
+    Parameters:
+        names:      The UTF-8 names indexed by numeration. Unmapped numerations are 'None'.
+        hashTable:  Whether the hash table for 'name2Num' is included. Default: True
+
+    Returns:
+        bytes:      The encoded map
+
+    Raises:
+        KbException:    The numerations do not fit in the uint32 slots of the hash table
+    """
+    if hashTable and 0xFFFFFFFF < len(names) - 1:
+        raise KbException("Numerations beyond 32 bits are not supported by the hash table of the binary map")
+    flags = bytes(0 if name is None else 1 for name in names)
+    flags += b'\x00' * (-len(flags) % 8)
+    offsets = array.array('Q', [0])
+    offsets.extend(accumulate(0 if name is None else len(name) for name in names))
+    blob = b''.join(name for name in names if name is not None)
+    mappings = sum(1 for name in names if name is not None)
+    table = array.array('I')
+    if hashTable and 0 < mappings:
+        table_size = 1
+        while table_size < 2 * mappings:
+            table_size <<= 1
+        table = array.array('I', bytes(4 * table_size))
+        mask = table_size - 1
+        for num, name in enumerate(names):
+            if name is None:
+                continue
+            slot = _hashName(name) & mask
+            while 0 != table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = num
+    return b''.join((
+        struct.pack(
+            _BINARY_MAP_HEADER_FORMAT, _BINARY_MAP_MAGIC, _BINARY_MAP_VERSION, len(names), mappings, len(blob),
+            len(table)
+        ),
+        flags, _littleEndian(offsets), _littleEndian(table), b'\x00' * (-len(table) * 4 % 8), blob,
+        b'\x00' * (-len(blob) % 8)
+    ))
+
+class BinaryMap:
+    """
+    Class for reading a numeration map of the binary format from a buffer, e.g., a memory map, without parsing.
+    """
+
+    def __init__(self, buffer, offset: int = 0) -> None:
+        """
+        Parameters:
+            buffer:     The buffer, e.g., a memory map, containing the encoded map
+            offset:     The offset of the encoded map in the buffer. Default: 0
+
+        Raises:
+            KbException:    The buffer does not contain a binary map of the supported version
+        """
+        if len(buffer) < offset + _BINARY_MAP_HEADER_SIZE:
+            raise KbException("Not a binary map")
+        magic, version, num_cnt, self._mappings, blob_size, self._tableSize = \
+            struct.unpack_from(_BINARY_MAP_HEADER_FORMAT, buffer, offset)
+        if magic != _BINARY_MAP_MAGIC or version != _BINARY_MAP_VERSION:
+            raise KbException("Not a binary map of version %d" % _BINARY_MAP_VERSION)
+        self._buffer = buffer
+        self._numerations = num_cnt
+        self._flagsOffset = offset + _BINARY_MAP_HEADER_SIZE
+        self._offsetsOffset = self._flagsOffset + num_cnt + (-num_cnt % 8)
+        self._tableOffset = self._offsetsOffset + 8 * (num_cnt + 1)
+        self._blobOffset = self._tableOffset + 4 * self._tableSize + (-self._tableSize * 4 % 8)
+
+    @staticmethod
+    def open(path: str) -> "BinaryMap":
+        """
+        Open a binary map file by a memory map.
+        """
+        with open(path, 'rb') as ifd:
+            return BinaryMap(mmap.mmap(ifd.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def size(self) -> int:
+        """
+        Return the size of the encoded map in bytes.
+        """
+        return self._blobOffset + struct.unpack_from('<Q', self._buffer, self._offsetsOffset + 8 * self._numerations)[0]
+
+    def num2Name(self, num: int) -> str:
+        if 0 < num < self._numerations and self._buffer[self._flagsOffset + num]:
+            start, end = struct.unpack_from('<QQ', self._buffer, self._offsetsOffset + 8 * num)
+            return bytes(self._buffer[self._blobOffset + start:self._blobOffset + end]).decode()
+        return None
+
+    def name2Num(self, name: str) -> int:
+        """
+        Look up the numeration of a name. With the hash table, this is a probe of the slot of the name, followed by
+        linear probing on collisions. Without the hash table, all names are scanned.
+        """
+        encoded = name.encode()
+        if 0 == self._tableSize:
+            for num, mapped_name in self.entries():
+                if mapped_name == name:
+                    return num
+            return None
+        mask = self._tableSize - 1
+        slot = _hashName(encoded) & mask
+        while True:
+            num, = struct.unpack_from('<I', self._buffer, self._tableOffset + 4 * slot)
+            if 0 == num:
+                return None
+            start, end = struct.unpack_from('<QQ', self._buffer, self._offsetsOffset + 8 * num)
+            if self._buffer[self._blobOffset + start:self._blobOffset + end] == encoded:
+                return num
+            slot = (slot + 1) & mask
+
+    def entries(self) -> Iterator[Tuple[int, str]]:
+        """
+        Iterate over the mapping entries as (numeration, name) pairs, in the order of numerations.
+        """
+        flags = self._buffer[self._flagsOffset:self._flagsOffset + self._numerations]
+        offsets = struct.unpack_from('<%dQ' % (self._numerations + 1), self._buffer, self._offsetsOffset)
+        for num in range(1, self._numerations):
+            if flags[num]:
+                yield (num, bytes(self._buffer[self._blobOffset + offsets[num]:self._blobOffset + offsets[num + 1]]).decode())
+
+    def mappedFlags(self) -> memoryview:
+        """
+        Return the flags of the numerations, 1 for the mapped ones, indexed by numeration.
+        """
+        return memoryview(self._buffer)[self._flagsOffset:self._flagsOffset + self._numerations]
+
+    def maxNumeration(self) -> int:
+        return max(self._numerations - 1, 0)
+
+    def totalMappings(self) -> int:
+        return self._mappings
+
+    def hasHashTable(self) -> bool:
+        return 0 < self._tableSize
+
+JOURNAL_FILE_NAME = "journal.wal"
+
+_JOURNAL_MAGIC = b"NKBJ"
+_JOURNAL_VERSION = 2
+_JOURNAL_HEADER_FORMAT = '<4sI'
+_JOURNAL_HEADER_SIZE = struct.calcsize(_JOURNAL_HEADER_FORMAT)
+_JOURNAL_ENTRY_FORMAT = '<IIB'              # payload size, CRC32 of the operation and the payload, operation
+_JOURNAL_ENTRY_SIZE = struct.calcsize(_JOURNAL_ENTRY_FORMAT)
+
+# Operations in the journal
+JOURNAL_MAP = 1                 # numeration (int64), UTF-8 name
+JOURNAL_UNMAP = 2               # numeration (int64)
+JOURNAL_CREATE_RELATION = 3     # relation numeration (int64), arity (uint16)
+JOURNAL_DELETE_RELATION = 4     # relation numeration (int64)
+JOURNAL_ADD_RECORDS = 5         # relation numeration (int64), arity (uint16), arity * #records numerations (int64)
+JOURNAL_REMOVE_RECORDS = 6      # relation numeration (int64), arity (uint16), arity * #records numerations (int64)
+
+def getJournalFilePath(kbPath: str) -> str:
+    """
+    Return the path of the journal file
+
+    Parameters:
+        kbPath:     The input KB path.
+
+    Returns:
+        The file path
+    """
+    return os.path.join(kbPath, JOURNAL_FILE_NAME)
+
+def readJournal(path: str) -> Tuple[List[Tuple], int]:
+    """
+    Read the entries of a journal file. Reading stops at the first incomplete or corrupted entry, which is left by an
+    interrupted write.
+
+    Parameters:
+        path:       The path of the journal file
+
+    Returns:
+        List[Tuple]:    The entries, each of which is an operation followed by its arguments:
+                            (JOURNAL_MAP, num, name), (JOURNAL_UNMAP, num),
+                            (JOURNAL_CREATE_RELATION, relNum, arity), (JOURNAL_DELETE_RELATION, relNum),
+                            (JOURNAL_ADD_RECORDS, relNum, records), (JOURNAL_REMOVE_RECORDS, relNum, records)
+                        where 'records' is a list of tuples
+        int:            The size of the valid part of the file
+
+    Raises:
+        KbException:    The file is not a journal of the supported version
+    """
+    with open(path, 'rb') as ifd:
+        content = ifd.read()
+    if len(content) < _JOURNAL_HEADER_SIZE or \
+            (_JOURNAL_MAGIC, _JOURNAL_VERSION) != struct.unpack_from(_JOURNAL_HEADER_FORMAT, content, 0):
+        raise KbException("Not a KB journal of version %d: %s" % (_JOURNAL_VERSION, path))
+    entries = []
+    offset = _JOURNAL_HEADER_SIZE
+    while offset + _JOURNAL_ENTRY_SIZE <= len(content):
+        size, crc, op = struct.unpack_from(_JOURNAL_ENTRY_FORMAT, content, offset)
+        payload = content[offset + _JOURNAL_ENTRY_SIZE:offset + _JOURNAL_ENTRY_SIZE + size]
+        if len(payload) < size or crc != zlib.crc32(payload, zlib.crc32(bytes((op,)))):
+            break
+        offset += _JOURNAL_ENTRY_SIZE + size
+        if JOURNAL_MAP == op:
+            entries.append((op, struct.unpack_from('<q', payload)[0], payload[8:].decode()))
+        elif JOURNAL_CREATE_RELATION == op:
+            entries.append((op,) + struct.unpack_from('<qH', payload))
+        elif op in (JOURNAL_ADD_RECORDS, JOURNAL_REMOVE_RECORDS):
+            rel_num, arity = struct.unpack_from('<qH', payload)
+            values = array.array('q', payload[10:])
+            if 'big' == sys.byteorder:
+                values.byteswap()
+            entries.append((op, rel_num, list(zip(*[iter(values)] * arity))))
+        else:
+            entries.append((op, struct.unpack_from('<q', payload)[0]))
+    return entries, offset
+
+class KbJournal:
+    """
+    Append-only journal of the changes to a KB since its files were written. Changes are buffered in memory and
+    appended to the journal file by 'commit'. Each entry is written with its size and a CRC32 checksum, so that an
+    entry torn by an interrupted write is detected and dropped when the journal is read.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open a journal file for appending. The file is created if it does not exist, and a torn entry at its end is
+        truncated.
+
+        Parameters:
+            path:       The path of the journal file
+
+        Raises:
+            KbException:    The file is not a journal of the supported version
+        """
+        self._path = path
+        self._buffer = bytearray()
+        if os.path.isfile(path):
+            _, valid_size = readJournal(path)
+            if valid_size < os.path.getsize(path):
+                os.truncate(path, valid_size)
+        else:
+            _writeAtomically(path, struct.pack(_JOURNAL_HEADER_FORMAT, _JOURNAL_MAGIC, _JOURNAL_VERSION))
+
+    def __log(self, op: int, payload: bytes) -> None:
+        self._buffer += struct.pack(_JOURNAL_ENTRY_FORMAT, len(payload), zlib.crc32(payload, zlib.crc32(bytes((op,)))), op)
+        self._buffer += payload
+
+    def logMap(self, num: int, name: str) -> None:
+        self.__log(JOURNAL_MAP, struct.pack('<q', num) + name.encode())
+
+    def logUnmap(self, num: int) -> None:
+        self.__log(JOURNAL_UNMAP, struct.pack('<q', num))
+
+    def logCreateRelation(self, relNum: int, arity: int) -> None:
+        self.__log(JOURNAL_CREATE_RELATION, struct.pack('<qH', relNum, arity))
+
+    def logDeleteRelation(self, relNum: int) -> None:
+        self.__log(JOURNAL_DELETE_RELATION, struct.pack('<q', relNum))
+
+    def logRecords(self, op: int, relNum: int, arity: int, records: Iterable[tuple]) -> None:
+        """
+        Log the records added to or removed from a relation.
+
+        Parameters:
+            op:         JOURNAL_ADD_RECORDS or JOURNAL_REMOVE_RECORDS
+            relNum:     The numeration of the relation
+            arity:      The arity of the relation
+            records:    The records, or a (#records, arity) integer array
+        """
+        if isinstance(records, np.ndarray):
+            payload = records.astype('<i8').tobytes()
+        else:
+            values = array.array('q')
+            for record in records:
+                values.extend(record)
+            payload = _littleEndian(values)
+        self.__log(op, struct.pack('<qH', relNum, arity) + payload)
+
+    def pendingBytes(self) -> int:
+        """
+        Return the size of the changes that have not been committed.
+        """
+        return len(self._buffer)
+
+    def commit(self, sync: bool = True) -> None:
+        """
+        Append the buffered changes to the journal file.
+
+        Parameters:
+            sync:   Whether the file is flushed to the disk before returning. Default: True
+        """
+        if 0 == len(self._buffer):
+            return
+        with open(self._path, 'ab') as ofd:
+            ofd.write(self._buffer)
+            if sync:
+                ofd.flush()
+                os.fsync(ofd.fileno())
+        self._buffer = bytearray()
+
+    def discard(self) -> None:
+        """
+        Drop the buffered changes, e.g., after they have been written to the KB files.
+        """
+        self._buffer = bytearray()
+
+    def truncate(self) -> None:
+        """
+        Remove all entries from the journal file and drop the buffered changes. The file and its directory are flushed
+        to the disk before returning, so that the removed entries are not replayed after a crash.
+        """
+        with open(self._path, 'wb') as ofd:
+            ofd.write(struct.pack(_JOURNAL_HEADER_FORMAT, _JOURNAL_MAGIC, _JOURNAL_VERSION))
+            ofd.flush()
+            os.fsync(ofd.fileno())
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._buffer = bytearray()
+
+    def getPath(self) -> str:
+        return self._path
+
+CHECKSUM_FILE_NAME = "checksums.meta"
+CHECKSUM_BLOCK_SIZE = 1 << 22   # 4 MiB
+
+_CHECKSUM_VERSION = 1
+_CHECKSUM_TASK_BLOCKS = 16      # Blocks checksummed by one task of the thread pool
+
+def getChecksumFilePath(kbPath: str) -> str:
+    """
+    Return the path of the checksum file
+
+    Parameters:
+        kbPath:     The input KB path.
+
+    Returns:
+        The file path
+    """
+    return os.path.join(kbPath, CHECKSUM_FILE_NAME)
+
+def listChecksumFiles(kbPath: str) -> List[str]:
+    """
+    Return the names of the files of a KB that are covered by checksums: the '.rel' files and the map files of both
+    formats.
+    """
+    return sorted(
+        fname for fname in os.listdir(kbPath)
+        if fname.endswith(".rel") or MAP_FILE_PATTERN.match(fname) or BINARY_MAP_FILE_NAME == fname
+    )
+
+def _checksumBlocks(path: str, size: int, start: int, count: int, blockSize: int) -> List[int]:
+    buffer = bytearray(min(blockSize, size - start * blockSize))
+    view = memoryview(buffer)
+    checksums = []
+    with open(path, 'rb', buffering=0) as ifd:
+        ifd.seek(start * blockSize)
+        for _ in range(count):
+            size = ifd.readinto(buffer)
+            if 0 == size:
+                break
+            checksums.append(zlib.crc32(view[:size]))
+    return checksums
+
+def computeChecksums(paths: List[str], blockSize: int = CHECKSUM_BLOCK_SIZE, workers: int = None) -> List[List[int]]:
+    """
+    Compute the CRC32 checksums of the blocks of files. The blocks of all files are checksummed in a pool of threads,
+    as reading the files and 'zlib.crc32' run without the interpreter lock.
+
+    Parameters:
+        paths:      The paths of the files
+        blockSize:  The size of a block in bytes. Default: CHECKSUM_BLOCK_SIZE
+        workers:    The number of threads. Default: None, the number of cores
+
+    Returns:
+        List[List[int]]:    The checksums of the blocks of each file, in the order of the blocks
+    """
+    tasks = []
+    for idx, path in enumerate(paths):
+        size = os.path.getsize(path)
+        blocks = (size + blockSize - 1) // blockSize
+        tasks.extend((idx, path, size, start) for start in range(0, blocks, _CHECKSUM_TASK_BLOCKS))
+    checksums = [[] for _ in paths]
+    with ThreadPoolExecutor(workers if workers is not None else os.cpu_count()) as pool:
+        results = pool.map(
+            lambda task: _checksumBlocks(task[1], task[2], task[3], _CHECKSUM_TASK_BLOCKS, blockSize), tasks
+        )
+        for task, result in zip(tasks, results):
+            checksums[task[0]].extend(result)
+    return checksums
+
+def readChecksums(kbPath: str) -> dict:
+    """
+    Read the checksum file of a KB.
+
+    Returns:
+        dict:   'blockSize' and 'files', which maps the name of each file to its 'size', 'mtime' (in nanoseconds) and the
+                'checksums' of its blocks. 'None' if there is no checksum file of the supported version.
+    """
+    path = getChecksumFilePath(kbPath)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as ifd:
+        try:
+            checksums = json.load(ifd)
+        except ValueError:
+            return None
+    return checksums if _CHECKSUM_VERSION == checksums.get("version") else None
+
+def updateChecksums(kbPath: str, blockSize: int = CHECKSUM_BLOCK_SIZE, workers: int = None) -> dict:
+    """
+    Write the checksum file of a KB ('checksums.meta'). Only the files whose size or modification time changed since
+    the checksum file was written are checksummed again, and removed files are dropped.
+
+    Parameters:
+        kbPath:     The input KB path.
+        blockSize:  The size of a block in bytes. Default: CHECKSUM_BLOCK_SIZE
+        workers:    The number of threads. Default: None, the number of cores
+
+    Returns:
+        dict:       The checksums as returned by 'readChecksums'
+    """
+    previous = readChecksums(kbPath)
+    previous_files = previous["files"] if previous is not None and previous["blockSize"] == blockSize else dict()
+    files = dict()
+    changed = []
+    for fname in listChecksumFiles(kbPath):
+        stat = os.stat(os.path.join(kbPath, fname))
+        entry = previous_files.get(fname)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            files[fname] = entry
+        else:
+            files[fname] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            changed.append(fname)
+    for fname, checksums in zip(changed, computeChecksums(
+        [os.path.join(kbPath, fname) for fname in changed], blockSize, workers
+    )):
+        files[fname]["checksums"] = checksums
+    checksums = {"version": _CHECKSUM_VERSION, "blockSize": blockSize, "files": files}
+    _writeAtomically(getChecksumFilePath(kbPath), json.dumps(checksums).encode())
+    return checksums
+
 class NumerationMap:
     """
     Class for the numeration map, from name strings to numerations. Map entries can be iterated over a NumerationMap
     instance.
+
+    A map is read from the text format ('map<N>.tsv') or the binary format ('map.bin'). A map of the binary format is
+    looked up directly on the memory-mapped file and is only loaded into memory when it is modified.
+
+    The text format is written in shards of numeration ranges, i.e., map file 'startMapNum + i' contains the
+    numerations in '[i * maxEntries + 1, (i + 1) * maxEntries]'. The numerations changed since the map was read or
+    written are tracked, so that dumping the map to the same place again only rewrites the shards that changed.
     """
 
     _MAP_FILE_NUMERATION_START = 1
@@ -84,11 +729,19 @@ class NumerationMap:
 
     def __init__(self, kbPath: str = None):
         """
-        Read the numeration mapping files of the KB. If no path is given, initialize an empty map.
+        Read the numeration mapping files of the KB. If no path is given, initialize an empty map. The text format is
+        read if there are any map files of it in the KB, otherwise the binary map file.
 
         Parameters:
             kbPath:     The input KB path. KB is in the Numerated Format.
         """
+        self._binaryMap = None          # BinaryMap, the memory-mapped binary map before the map is modified
+        self._dirtyNums = set()         # numerations changed since the map was read or written
+        self._layout = None             # (path, startMapNum, maxEntries, binary) of the map files as they are on disk
+        self._journal = None            # KbJournal, where the changes are logged
+        self._mapped = None             # bool[], the mapped numerations, updated as the map changes. It may be longer
+                                        # than the numerations, so that it grows in amortized constant time.
+
         # Initialize an empty map
         if kbPath is None:
             
@@ -96,33 +749,80 @@ class NumerationMap:
             self._numArray = [None]     # str[]
             self._freeNums = []         # int[], numerations that are not associated with names, 
                                         # organized in minimum heap
+            self._mapped = np.zeros(1, dtype=bool)
+            return
+
+        # Look up the binary map in place
+        if not hasTextMap(kbPath) and os.path.isfile(getBinaryMapFilePath(kbPath)):
+            self._binaryMap = BinaryMap.open(getBinaryMapFilePath(kbPath))
+            self._layout = (os.path.abspath(kbPath), None, None, True)
             return
         
         # Create the map structure, from name string to numeration number
         self._numMap = dict() # int -> str
         max_num = 0
-        regex = re.compile("map[0-9]+.tsv$")
+        sharded = True      # Whether the map files are shards of numeration ranges of the default size
         for fname in os.listdir(kbPath):
             fpath = os.path.join(kbPath, fname)
-            if os.path.isfile(fpath) and regex.match(fname):
+            if os.path.isfile(fpath) and MAP_FILE_PATTERN.match(fname):
+                shard = int(fname[3:-4]) - self._MAP_FILE_NUMERATION_START
                 map_file = open(fpath, 'r')
                 for line in map_file.readlines():
                     name, num = line.strip().split('\t')
                     num = int(num, 16)
                     self._numMap[name] = num
                     max_num = max(max_num, num)
+                    sharded = sharded and (num - 1) // self._MAX_MAP_ENTRIES == shard
                 map_file.close()
-        
+        self.__createArrays(max_num)
+        if sharded:
+            self._layout = (os.path.abspath(kbPath), self._MAP_FILE_NUMERATION_START, self._MAX_MAP_ENTRIES, False)
+
+    @staticmethod
+    def fromBinaryMap(binaryMap: "BinaryMap") -> "NumerationMap":
+        """
+        Create a numeration map that looks up a binary map in place, e.g., the map section of a KB container, until
+        the map is modified.
+
+        Parameters:
+            binaryMap:  The binary map
+
+        Returns:
+            NumerationMap:  The numeration map
+        """
+        num_map = NumerationMap()
+        num_map._binaryMap = binaryMap
+        num_map._mapped = None
+        return num_map
+
+    def __createArrays(self, maxNum: int) -> None:
         # Create a string array, where the indices are the numeration numbers
-        self._numArray = [None] * (max_num+1)
+        self._numArray = [None] * (maxNum+1)
         for name, num in self._numMap.items():
             self._numArray[num] = name
 
-        # Create a numeration set for unused numbers
-        self._freeNums = []
-        for num in range(1, max_num+1):
-            if self._numArray[num] is None:
-                heapq.heappush(self._freeNums, num)
+        # Create the mask of mapped numbers and the numeration set for unused numbers
+        self._mapped = np.zeros(maxNum+1, dtype=bool)
+        self._mapped[np.fromiter(self._numMap.values(), dtype=np.int64, count=len(self._numMap))] = True
+        self._freeNums = (np.flatnonzero(~self._mapped[1:]) + 1).tolist()
+
+    def __setMapped(self, start: int, end: int, mapped: bool) -> None:
+        # Mark numerations [start, end) in the mask of mapped numbers, doubling its capacity if it is too short
+        if self._mapped.size < end:
+            mask = np.zeros(max(end, 2 * self._mapped.size), dtype=bool)
+            mask[:self._mapped.size] = self._mapped
+            self._mapped = mask
+        self._mapped[start:end] = mapped
+
+    def __load(self) -> None:
+        """
+        Load the binary map into memory before it is modified.
+        """
+        if self._binaryMap is None:
+            return
+        self._numMap = {name: num for num, name in self._binaryMap.entries()}
+        self.__createArrays(self._binaryMap.maxNumeration())
+        self._binaryMap = None
 
     def mapName(self, name: str) -> int:
         """
@@ -135,6 +835,7 @@ class NumerationMap:
         Returns:
             int:        The numeration for the name
         """
+        self.__load()
         num = self._numMap.get(name, None)
         if num is not None:
             return num
@@ -147,9 +848,77 @@ class NumerationMap:
             # No free numeration is available, create a new number
             num = len(self._numArray)
             self._numArray.append(name)
+        self.__setMapped(num, num + 1, True)
         self._numMap[name] = num
+        self._dirtyNums.add(num)
+        if self._journal is not None:
+            self._journal.logMap(num, name)
         return num
 
+    def mappedMask(self) -> np.ndarray:
+        """
+        Return a boolean array indexed by numeration (0 to 'maxNumeration()'), where the mapped numerations are True.
+        The mask is kept up to date as the map changes, so this takes constant time. The returned array is read-only
+        and shared with the map: copy it if it should not follow later changes.
+        """
+        if self._binaryMap is not None:
+            if self._mapped is None:
+                self._mapped = np.zeros(self._binaryMap.maxNumeration() + 1, dtype=bool)
+                flags = np.frombuffer(self._binaryMap.mappedFlags(), dtype=np.uint8)
+                self._mapped[:flags.size] = flags[:self._mapped.size] != 0
+            mask = self._mapped[:self._binaryMap.maxNumeration() + 1]
+        else:
+            mask = self._mapped[:len(self._numArray)]
+        mask.flags.writeable = False
+        return mask
+
+    def renumber(self, translation: np.ndarray) -> None:
+        """
+        Change the numerations of the mapped names by a translation array. Names whose new numeration is 0 are
+        unmapped. The whole map is rewritten by the next dump.
+
+        Parameters:
+            translation:    The new numeration of each old numeration, indexed by the old numerations. The non-zero new
+                            numerations should be distinct.
+
+        Raises:
+            KbException:    The new numerations are not distinct
+        """
+        self.__load()
+        num_map = dict()
+        for name, num in self._numMap.items():
+            new_num = int(translation[num]) if num < len(translation) else 0
+            if 0 != new_num:
+                num_map[name] = new_num
+        if len(set(num_map.values())) != len(num_map):
+            raise KbException("Numerations are not translated to distinct numerations")
+        self._numMap = num_map
+        self.__createArrays(max(num_map.values(), default=0))
+        self._layout = None
+        self._dirtyNums = set()
+
+    def _setMapping(self, name: str, num: int) -> None:
+        """
+        Map a name to a given numeration, replacing the mappings of both the name and the numeration. This is used for
+        replaying a journal, so that replaying a mapping again is idempotent.
+        """
+        self.__load()
+        if self._numMap.get(name, None) == num:
+            return
+        self.unmapName(name)
+        self.unmapNumeration(num)
+        if len(self._numArray) <= num:
+            for free_num in range(len(self._numArray), num):
+                heapq.heappush(self._freeNums, free_num)
+            self._numArray.extend([None] * (num + 1 - len(self._numArray)))
+        else:
+            self._freeNums.remove(num)
+            heapq.heapify(self._freeNums)
+        self._numArray[num] = name
+        self.__setMapped(num, num + 1, True)
+        self._numMap[name] = num
+        self._dirtyNums.add(num)
+
     def unmapName(self, name: str) -> int:
         """
         Remove the mapping of a name string in the map.
@@ -160,10 +929,15 @@ class NumerationMap:
         Returns:
             int:        The number for the name. 'None' if the name is not mapped in the map.
         """
+        self.__load()
         num = self._numMap.pop(name, None)
         if num is not None:
             self._numArray[num] = None
+            self._mapped[num] = False
             heapq.heappush(self._freeNums, num)
+            self._dirtyNums.add(num)
+            if self._journal is not None:
+                self._journal.logUnmap(num)
         return num
 
     def unmapNumeration(self, num: int) -> str:
@@ -176,11 +950,16 @@ class NumerationMap:
         Returns:
             str:        The mapped name of the number, 'None' if the number is not mapped in the map.
         """
+        self.__load()
         if 0 < num < len(self._numArray) and self._numArray[num] is not None:
             name = self._numArray[num]
             self._numArray[num] = None
+            self._mapped[num] = False
             self._numMap.pop(name)
             heapq.heappush(self._freeNums, num)
+            self._dirtyNums.add(num)
+            if self._journal is not None:
+                self._journal.logUnmap(num)
             return name
         return None
 
@@ -194,6 +973,8 @@ class NumerationMap:
         Returns:
             str:        The mapped name of the number, 'None' if the number is not mapped in the KB.
         """
+        if self._binaryMap is not None:
+            return self._binaryMap.num2Name(num)
         if 0 < num < len(self._numArray):
             return self._numArray[num]
         return None
@@ -208,32 +989,160 @@ class NumerationMap:
         Returns:
             int:    The mapped number for the name. 'None' if the name is not mapped in the KB.
         """
+        if self._binaryMap is not None:
+            return self._binaryMap.name2Num(name)
         return self._numMap.get(name, None)
 
-    def dump(self, kbPath: str, startMapNum: int = _MAP_FILE_NUMERATION_START, maxEntries: int = _MAX_MAP_ENTRIES) -> None:
+    def names2Nums(self, names: Sequence[str], create: bool = True) -> np.ndarray:
         """
-        Write the numeration map to 'kbPath'.
+        Translate a batch of names into numerations. The names that are not mapped are added to the map if 'create' is
+        True, in the order of their first occurrences: free numerations are assigned first, as by 'mapName', and the
+        rest are assigned in one block after the maximum numeration.
+
+        Parameters:
+            names:      The names
+            create:     Whether the names not in the map are mapped. Default: True
+
+        Returns:
+            np.ndarray: The numerations of the names. 0 for the names not mapped if 'create' is False.
+        """
+        if not isinstance(names, list):
+            names = list(names)
+        if self._binaryMap is not None:
+            nums = np.fromiter(
+                (num or 0 for num in map(self._binaryMap.name2Num, names)), dtype=np.int64, count=len(names)
+            )
+            if not create or nums.all():
+                return nums.astype(idDtype(self.maxNumeration()), copy=False)
+            self.__load()
+        nums = np.fromiter(map(self._numMap.get, names, repeat(0)), dtype=np.int64, count=len(names))
+        missing = np.flatnonzero(0 == nums)
+        if create and 0 < missing.size:
+            missing_names = names if missing.size == len(names) else list(map(names.__getitem__, missing.tolist()))
+            new_names = list(dict.fromkeys(missing_names))
+            reused = min(len(self._freeNums), len(new_names))
+            for name in new_names[:reused]:
+                num = heapq.heappop(self._freeNums)
+                self._numArray[num] = name
+                self._mapped[num] = True
+                self._numMap[name] = num
+            start = len(self._numArray)
+            self._numArray.extend(new_names[reused:])
+            self.__setMapped(start, len(self._numArray), True)
+            self._numMap.update(zip(new_names[reused:], range(start, len(self._numArray))))
+            new_nums = [self._numMap[name] for name in new_names]
+            self._dirtyNums.update(new_nums)
+            if self._journal is not None:
+                for name, num in zip(new_names, new_nums):
+                    self._journal.logMap(num, name)
+            nums[missing] = np.fromiter(map(self._numMap.__getitem__, missing_names), dtype=np.int64, count=missing.size)
+        return nums.astype(idDtype(self.maxNumeration()), copy=False)
+
+    def nums2Names(self, nums: np.ndarray) -> List:
+        """
+        Translate numerations into names.
+
+        Parameters:
+            nums:       A 1-D array of numerations, or a (#records, arity) array of records
+
+        Returns:
+            List:       The names, 'None' for the numerations not mapped. For an array of records, the records of names
+                        as tuples.
+        """
+        nums = np.asarray(nums)
+        if 2 == nums.ndim:
+            return list(zip(*(self.nums2Names(column) for column in nums.T)))
+        if self._binaryMap is not None:
+            return list(map(self._binaryMap.num2Name, nums.tolist()))
+        nums = np.where((0 < nums) & (nums < len(self._numArray)), nums, 0)
+        return list(map(self._numArray.__getitem__, nums.tolist()))
+
+    def dump(
+        self, kbPath: str, startMapNum: int = _MAP_FILE_NUMERATION_START, maxEntries: int = _MAX_MAP_ENTRIES,
+        binary: bool = False, hashTable: bool = True
+    ) -> None:
+        """
+        Write the numeration map to 'kbPath'. Map files of the other format are removed from 'kbPath', so that the KB
+        contains one map only. If the map was read from or written to 'kbPath' in the same layout, only the shards
+        containing changed numerations are rewritten. Every file is written to a temporary file first and then renamed,
+        so that an interrupted dump leaves no partially written file.
 
         Parameters:
             kbPath:         The input KB path.
             startMapNum:    The start number of the map files (Default _MAP_FILE_NUMERATION_START)
             maxEntries:     The maximum number of entries a map file contains (Default _MAX_MAP_ENTRIES)
+            binary:         Whether the map is written in the binary format (Default False)
+            hashTable:      Whether the binary map contains the hash table for 'name2Num' (Default True)
 
         Returns:
             None
         """
-        map_num = startMapNum
-        map_file = open(getMapFilePath(kbPath, map_num), 'w')
-        records_cnt = 0
-        for name, num in self._numMap.items():
-            if records_cnt >= maxEntries:
-                map_file.close()
-                records_cnt = 0
-                map_num += 1
-                map_file = open(getMapFilePath(kbPath, map_num), 'w')
-            map_file.write("%s\t%x\n" % (name, num))
-            records_cnt += 1
-        map_file.close()
+        if binary:
+            layout = (os.path.abspath(kbPath), None, None, True)
+            if layout != self._layout or self._dirtyNums:
+                names = [None] * (self.maxNumeration() + 1)
+                for name, num in self.__entries():
+                    names[num] = name.encode()
+                _writeAtomically(getBinaryMapFilePath(kbPath), encodeBinaryMap(names, hashTable))
+            for fname in os.listdir(kbPath):
+                if MAP_FILE_PATTERN.match(fname):
+                    os.remove(os.path.join(kbPath, fname))
+        else:
+            layout = (os.path.abspath(kbPath), startMapNum, maxEntries, False)
+            total_shards = max(1, (self.maxNumeration() + maxEntries - 1) // maxEntries)
+            if layout == self._layout:
+                shards = sorted(set((num - 1) // maxEntries for num in self._dirtyNums if 0 < num))
+            else:
+                shards = range(total_shards)
+            # Shards are written in order, and shards without any entry are written as empty files
+            entries = self.__entries(shards, maxEntries)
+            entry = next(entries, None)
+            for shard in shards:
+                map_path = getMapFilePath(kbPath, startMapNum + shard)
+                with open(map_path + ".tmp", 'w') as map_file:
+                    while entry is not None and (entry[1] - 1) // maxEntries == shard:
+                        map_file.write("%s\t%x\n" % entry)
+                        entry = next(entries, None)
+                os.replace(map_path + ".tmp", map_path)
+            for fname in os.listdir(kbPath):
+                if MAP_FILE_PATTERN.match(fname) and not 0 <= int(fname[3:-4]) - startMapNum < total_shards:
+                    os.remove(os.path.join(kbPath, fname))
+            if os.path.isfile(getBinaryMapFilePath(kbPath)):
+                os.remove(getBinaryMapFilePath(kbPath))
+        self._layout = layout
+        self._dirtyNums = set()
+
+    def __entries(self, shards: Iterable[int] = None, maxEntries: int = None) -> Iterator[Tuple[str, int]]:
+        """
+        Iterate over the mapping entries in the order of numerations, only within 'shards' if they are given.
+        """
+        if self._binaryMap is not None:
+            entries = ((name, num) for num, name in self._binaryMap.entries())
+            if shards is None:
+                return entries
+            shards = set(shards)
+            return ((name, num) for name, num in entries if (num - 1) // maxEntries in shards)
+        if shards is None:
+            shards, maxEntries = [0], len(self._numArray)
+        return (
+            (self._numArray[num], num) for shard in shards
+            for num in range(shard * maxEntries + 1, min((shard + 1) * maxEntries + 1, len(self._numArray)))
+            if self._numArray[num] is not None
+        )
+
+    def maxNumeration(self) -> int:
+        """
+        Return the largest numeration that has been assigned, including those freed by unmapping.
+
+        Parameters:
+            None
+
+        Returns:
+            int:        0 if no numeration has been assigned.
+        """
+        if self._binaryMap is not None:
+            return self._binaryMap.maxNumeration()
+        return len(self._numArray) - 1
 
     def totalMappings(self):
         """
@@ -244,9 +1153,13 @@ class NumerationMap:
 
         Returns:
         """
+        if self._binaryMap is not None:
+            return self._binaryMap.totalMappings()
         return len(self._numMap)
     
     def __iter__(self):
+        if self._binaryMap is not None:
+            return (name for _, name in self._binaryMap.entries())
         return iter(self._numMap)
 
     @property
@@ -254,12 +1167,28 @@ class NumerationMap:
         return self._MAX_MAP_ENTRIES
 
 
+def convertMapFormat(kbPath: str, binary: bool = True, hashTable: bool = True) -> None:
+    """
+    Convert the numeration map of a KB between the text and the binary formats in place.
+
+    Parameters:
+        kbPath:     The input KB path.
+        binary:     Whether the map is converted to the binary format, otherwise to the text format. Default: True
+        hashTable:  Whether the binary map contains the hash table for 'name2Num'. Default: True
+    """
+    NumerationMap(kbPath).dump(kbPath, binary=binary, hashTable=hashTable)
+
 class KbRelation:
     """
     Class for a single relation in a KB. Records can be iterated over a KbRelation instance.
+
+    Records are matched against patterns ('match') on an array of the records sorted by the columns in order, so that
+    the first column is searched by binary search in its sorted runs. Other columns are searched by their indexes if
+    created ('createIndex') and scanned otherwise. The array and the indexes are built on demand and dropped when the
+    records change.
     """
 
-    __INT_SIZE = struct.calcsize('i')
+    __MATCH_BATCH_SIZE = 4096       # Records filtered at a time by 'iterMatch'
 
     def __init__(self, name: str, numeration: int, arity: int, records: int = 0, kbPath: str = None, numMap: dict = None) -> None:
         """
@@ -281,29 +1210,26 @@ class KbRelation:
         self._numeration = numeration
         self._arity = arity
         self._records = set()
+        self._dirty = kbPath is None    # Whether the records changed since the relation was read or written
+        self._journal = None            # KbJournal, where the changes are logged
+        self._sortedArray = None        # The records sorted by the columns in order, built on demand
+        self._indexes = dict()          # column: int -> (sorted keys, order in '_sortedArray'), built on demand
+        self._indexedColumns = set()    # The columns of the indexes created by 'createIndex'
 
         # Initialize empty relation
         if kbPath is None:
             return
         
         # Read relation from file
-        with open(getRelFilePath(kbPath, name, arity, records), 'rb') as ifd:
-            buffer_size = KbRelation.__INT_SIZE * arity
-            format_str = self.__getRecordFormatString(arity)
-            i = 0
-            if numMap is not None:
-                while i < records:
-                    record = struct.unpack(format_str, ifd.read(buffer_size))
-                    for num in record:
-                        if numMap.num2Name(num) is None:
-                            raise KbException("Loaded numeration is not mapped: %d" % num)
-                    self._records.add(record)
-                    i += 1
-            else:
-                while i < records:
-                    record = struct.unpack(format_str, ifd.read(buffer_size))
-                    self._records.add(record)
-                    i += 1
+        values = readRelFile(findRelFilePath(kbPath, name, arity, records))
+        if numMap is not None and 0 < values.size:
+            mapped = numMap.mappedMask()
+            unmapped = values[(values >= len(mapped)) | (values < 1)]
+            if 0 == unmapped.size:
+                unmapped = values[~mapped[values]]
+            if 0 < unmapped.size:
+                raise KbException("Loaded numeration is not mapped: %d" % unmapped[0])
+        self._records = set(zip(*values.T.tolist()))
 
     def addRecord(self, record: tuple) -> None:
         """
@@ -320,7 +1246,11 @@ class KbRelation:
         """
         if len(record) != self._arity:
             raise KbException("Record arity (%d) does not match the relation (%d): %s" % (len(record), self._arity, record))
-        self._records.add(record)
+        if record not in self._records:
+            self._records.add(record)
+            self._changed()
+            if self._journal is not None:
+                self._journal.logRecords(JOURNAL_ADD_RECORDS, self._numeration, self._arity, (record,))
 
     def addRecords(self, records: Iterable[tuple]) -> None:
         """
@@ -335,10 +1265,57 @@ class KbRelation:
         Raises:
             KbException:    The arity of the record does not match that of the relation.
         """
+        records = list(records)     # The records are iterated more than once
         for record in records:
             if len(record) != self._arity:
                 raise KbException("Record arity (%d) does not match the relation (%d): %s" % (len(record), self._arity, record))
+        total_records = len(self._records)
         self._records.update(records)
+        if total_records != len(self._records):
+            self._changed()
+            if self._journal is not None:
+                self._journal.logRecords(JOURNAL_ADD_RECORDS, self._numeration, self._arity, records)
+
+    def addArray(self, records: np.ndarray) -> int:
+        """
+        Add a batch of records given as an integer array. Duplicates in the batch are dropped by sorting the keys of
+        the records ('encodeRecordKeys') before the records are added. The sorted batch is kept as 'sortedArray' if
+        the relation was empty.
+
+        Parameters:
+            records:    The (#records, arity) integer array
+
+        Returns:
+            int:        The number of records that were not in the relation
+
+        Raises:
+            KbException:    The arity of the array does not match that of the relation.
+        """
+        records = np.asarray(records)
+        if 2 != records.ndim or records.shape[1] != self._arity:
+            raise KbException("Record arity (%s) does not match the relation (%d)" % (
+                records.shape[1] if 2 == records.ndim else "scalar", self._arity
+            ))
+        if 0 == len(records):
+            return 0
+        keys = encodeRecordKeys([records])[0]
+        order = np.argsort(keys)
+        keys = keys[order]
+        first = np.empty(len(keys), dtype=bool)
+        first[0] = True
+        np.not_equal(keys[1:], keys[:-1], out=first[1:])
+        records = records[order[first]]
+        total_records = len(self._records)
+        self._records.update(zip(*records.T.tolist()))
+        added = len(self._records) - total_records
+        if 0 < added:
+            self._changed()
+            if 0 == total_records:
+                self._sortedArray = records.astype(np.promote_types(np.int32, idDtype(int(records.max()))))
+                self._sortedArray.flags.writeable = False
+            if self._journal is not None:
+                self._journal.logRecords(JOURNAL_ADD_RECORDS, self._numeration, self._arity, records)
+        return added
 
     def removeRecord(self, record: tuple) -> None:
         """
@@ -350,42 +1327,348 @@ class KbRelation:
         Returns:
             None
         """
-        self._records.discard(record)
+        if record in self._records:
+            self._records.remove(record)
+            self._changed()
+            if self._journal is not None:
+                self._journal.logRecords(JOURNAL_REMOVE_RECORDS, self._numeration, self._arity, (record,))
 
-    def dump(self, kbPath: str) -> None:
+    def dump(self, kbPath: str) -> str:
         """
-        Write a KbRelation object to a '.rel' file.
+        Write a KbRelation object to a '.rel' file of the narrowest id width that holds its ids. The records are
+        written to a temporary file first, which is then renamed to the '.rel' file.
 
         Parameters:
             kbPath:     The input KB path.
-            kbRel:      A KbRelation object.
 
         Returns:
-            None
+            str:        The path of the '.rel' file
+        """
+        path = writeRelFile(kbPath, self._name, self.toArray())
+        self._dirty = False
+        return path
 
-        Files are written in the file system and nothing is returned.
+    def isDirty(self) -> bool:
+        """
+        Check whether the records have been changed by the methods of the relation since it was read or written.
+        """
+        return self._dirty
+
+    def _changed(self) -> None:
+        """
+        Mark the records as changed, which drops the sorted array and the indexes.
         """
-        ofd = open(getRelFilePath(kbPath, self._name, self._arity, len(self._records)), 'wb')
-        format_str = self.__getRecordFormatString(self._arity)
-        for record in self._records:
-            ofd.write(struct.pack(format_str, *record))
-        ofd.close()
+        self._dirty = True
+        self._sortedArray = None
+        self._indexes = dict()
 
     def hasRecord(self, record: tuple) -> bool:
         return record in self._records
 
+    def hasRecords(self, records: np.ndarray) -> np.ndarray:
+        """
+        Check a batch of records given as an integer array by binary search in 'sortedArray'.
+
+        Parameters:
+            records:    The (#records, arity) integer array
+
+        Returns:
+            np.ndarray: The boolean mask of the records in the relation
+
+        Raises:
+            KbException:    The arity of the array does not match that of the relation.
+        """
+        records = np.asarray(records)
+        if 2 != records.ndim or records.shape[1] != self._arity:
+            raise KbException("Record arity (%s) does not match the relation (%d)" % (
+                records.shape[1] if 2 == records.ndim else "scalar", self._arity
+            ))
+        values = self.sortedArray()
+        if 0 == len(values) or 0 == len(records):
+            return np.zeros(len(records), dtype=bool)
+        keys, probes = encodeRecordKeys([values, records])
+        order = np.argsort(probes)     # Sorted probes search the keys with far fewer cache misses
+        probes = probes[order]
+        mask = np.empty(len(probes), dtype=bool)
+        mask[order] = keys[np.minimum(np.searchsorted(keys, probes), len(keys) - 1)] == probes
+        return mask
+
     def __iter__(self):
         return iter(self._records)
 
-    def __getRecordFormatString(self, arity: int) -> str:
-        return '<' + 'i' * arity
+    def toArray(self, dtype: np.dtype = np.int32) -> np.ndarray:
+        """
+        Return the records as a (#records, arity) integer array.
+
+        Parameters:
+            dtype:      The integer type of the array. It is widened to int64 if the ids do not fit. Default: int32
+
+        Returns:
+            np.ndarray: The records
+        """
+        values = np.fromiter(chain.from_iterable(self._records), dtype=np.int64, count=len(self._records) * self._arity)
+        if 0 < values.size:
+            values = values.astype(np.promote_types(dtype, idDtype(int(values.max()))), copy=False)
+        return values.reshape(len(self._records), self._arity)
+
+    def sortedArray(self) -> np.ndarray:
+        """
+        Return the records as a read-only (#records, arity) integer array sorted by the columns in order. The array is
+        kept until the records change.
+        """
+        if self._sortedArray is None:
+            values = self.toArray()
+            if 0 < values.size:
+                values = values[np.argsort(encodeRecordKeys([values])[0])]
+            values.flags.writeable = False
+            self._sortedArray = values
+        return self._sortedArray
+
+    def createIndex(self, column: int) -> None:
+        """
+        Create an index of a column, which is used by 'match' for the patterns binding the column. The index is the
+        order of the records by the column and is rebuilt on demand after the records change. The first column needs no
+        index as the records are sorted by it.
+
+        Parameters:
+            column:     The index of the column, from 0
+
+        Raises:
+            KbException:    The relation has no such column
+        """
+        if not 0 <= column < self._arity:
+            raise KbException("Column %d is out of the arity (%d) of the relation" % (column, self._arity))
+        self._indexedColumns.add(column)
+
+    def dropIndex(self, column: int) -> None:
+        """
+        Remove the index of a column.
+        """
+        self._indexedColumns.discard(column)
+        self._indexes.pop(column, None)
+
+    def indexedColumns(self) -> Set[int]:
+        """
+        Return the columns that are searched without a scan: the first column and the columns with indexes.
+        """
+        return set([0]) | self._indexedColumns
+
+    def columnIndex(self, column: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the index of a column in 'indexedColumns': the sorted keys of the column and the order of the records of
+        'sortedArray' by the column. The order is 'None' for the first column, by which the sorted array is ordered.
+
+        Raises:
+            KbException:    The column has no index
+        """
+        if column not in self.indexedColumns():
+            raise KbException("Column %d of relation '%s' has no index" % (column, self._name))
+        values = self.sortedArray()
+        if 0 == column:
+            return values[:, 0], None
+        index = self._indexes.get(column)
+        if index is None:
+            order = np.argsort(values[:, column], kind='stable')
+            index = (values[order, column], order)
+            self._indexes[column] = index
+        return index
+
+    def __candidates(self, pattern: tuple) -> Tuple[np.ndarray, int, int, np.ndarray, List[Tuple[int, object]]]:
+        """
+        Select the candidate records of a pattern by an indexed column bound in the pattern, preferring a point to a
+        range.
+
+        Returns:
+            np.ndarray:     The sorted array
+            int:            The start of the candidates
+            int:            The end of the candidates
+            np.ndarray:     The order of the candidates in the sorted array. 'None' if they are '[start:end]' of it.
+            List[Tuple[int, object]]:   The other bound columns and their values, which the candidates are filtered by
+        """
+        if len(pattern) != self._arity:
+            raise KbException("Pattern arity (%d) does not match the relation (%d): %s" % (
+                len(pattern), self._arity, pattern
+            ))
+        values = self.sortedArray()
+        bound = [(col, value) for col, value in enumerate(pattern) if value is not None]
+        indexed = [(isinstance(value, slice), col) for col, value in bound if col in self.indexedColumns()]
+        if 0 == len(indexed):
+            return values, 0, len(values), None, bound
+        column = min(indexed)[1]
+        keys, order = self.columnIndex(column)
+        value = pattern[column]
+        if isinstance(value, slice):
+            start = 0 if value.start is None else int(np.searchsorted(keys, value.start, 'left'))
+            end = len(keys) if value.stop is None else int(np.searchsorted(keys, value.stop, 'left'))
+        else:
+            start = int(np.searchsorted(keys, value, 'left'))
+            end = int(np.searchsorted(keys, value, 'right'))
+        return values, start, max(start, end), order, [(col, value) for col, value in bound if col != column]
+
+    @staticmethod
+    def __filter(records: np.ndarray, bound: List[Tuple[int, object]]) -> np.ndarray:
+        if 0 == len(bound):
+            return records
+        mask = np.ones(len(records), dtype=bool)
+        for col, value in bound:
+            if isinstance(value, slice):
+                if value.start is not None:
+                    mask &= records[:, col] >= value.start
+                if value.stop is not None:
+                    mask &= records[:, col] < value.stop
+            else:
+                mask &= records[:, col] == value
+        return records[mask]
+
+    def match(self, pattern: tuple) -> np.ndarray:
+        """
+        Find the records matching a pattern.
+
+        Parameters:
+            pattern:    One value for each argument: a numeration, a 'slice' of numerations '[start, stop)', whose ends
+                        may be 'None', or 'None' for any numeration. E.g., '(s, None, o)'.
+
+        Returns:
+            np.ndarray: The matched records as a (#records, arity) integer array in the order of 'sortedArray'. It may
+                        be a read-only view of the sorted array.
+
+        Raises:
+            KbException:    The arity of the pattern does not match that of the relation.
+        """
+        values, start, end, order, bound = self.__candidates(pattern)
+        return self.__filter(values[start:end] if order is None else values[order[start:end]], bound)
+
+    def iterMatch(self, pattern: tuple) -> Iterator[tuple]:
+        """
+        Iterate over the records matching a pattern (see 'match'). The candidate records are gathered and filtered
+        in batches as the iteration proceeds.
+
+        Returns:
+            Iterator[tuple]:    The matched records
+
+        Raises:
+            KbException:    The arity of the pattern does not match that of the relation.
+        """
+        return self.__iterCandidates(*self.__candidates(pattern))
+
+    def __iterCandidates(
+        self, values: np.ndarray, start: int, end: int, order: np.ndarray, bound: List[Tuple[int, object]]
+    ) -> Iterator[tuple]:
+        for batch_start in range(start, end, KbRelation.__MATCH_BATCH_SIZE):
+            batch_end = min(end, batch_start + KbRelation.__MATCH_BATCH_SIZE)
+            records = values[batch_start:batch_end] if order is None else values[order[batch_start:batch_end]]
+            yield from map(tuple, self.__filter(records, bound).tolist())
 
     def getName(self) -> str:
         return self._name
 
     def getArity(self) -> int:
         return self._arity
-        
+
+    def __operands(self, other: "KbRelation", permutation: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Encode the records of the relation and of another one, with the columns of the other permuted, into keys.
+
+        Returns:
+            np.ndarray: The records of the relation, sorted
+            np.ndarray: The keys of the records of the relation, sorted
+            np.ndarray: The records of the other relation, permuted and sorted
+            np.ndarray: The keys of the records of the other relation, sorted
+
+        Raises:
+            KbException:    The arities do not match; 'permutation' is not a permutation of the columns
+        """
+        if other.getArity() != self._arity:
+            raise KbException("Relation arity (%d) does not match the relation (%d): %s" % (
+                other.getArity(), self._arity, other.getName()
+            ))
+        records = self.sortedArray()
+        other_records = other.sortedArray()
+        if permutation is not None:
+            if sorted(permutation) != list(range(self._arity)):
+                raise KbException("Not a permutation of %d columns: %s" % (self._arity, permutation))
+            other_records = other_records[:, list(permutation)]
+        keys, other_keys = encodeRecordKeys([records, other_records])
+        if permutation is not None and list(permutation) != list(range(self._arity)):
+            order = np.argsort(other_keys)
+            other_records = other_records[order]
+            other_keys = other_keys[order]
+        return records, keys, other_records, other_keys
+
+    @staticmethod
+    def __contained(keys: np.ndarray, otherKeys: np.ndarray) -> np.ndarray:
+        """
+        Return the mask of the sorted keys that are in the other sorted keys, by a merge of binary searches.
+        """
+        if 0 == len(otherKeys):
+            return np.zeros(len(keys), dtype=bool)
+        return otherKeys[np.minimum(np.searchsorted(otherKeys, keys), len(otherKeys) - 1)] == keys
+
+    def __result(self, records: np.ndarray, name: str) -> "KbRelation":
+        relation = KbRelation(self._name if name is None else name, self._numeration, self._arity)
+        relation.addArray(records)
+        return relation
+
+    def union(
+        self, other: "KbRelation", permutation: Sequence[int] = None, count: bool = False, name: str = None
+    ) -> Union["KbRelation", int]:
+        """
+        Compute the union of the records of the relation and of another relation. The records are compared as int64
+        keys ('encodeRecordKeys') by binary search in sorted arrays.
+
+        Parameters:
+            other:          The other relation, of the same arity
+            permutation:    The order in which the columns of 'other' are taken, e.g., '(1, 0)' for the inverse of a
+                            binary relation. Default: None, the columns in order
+            count:          Whether only the number of records is returned. Default: False
+            name:           The name of the result relation. Default: None, the name of this relation
+
+        Returns:
+            KbRelation:     A new relation of the records, which is not in any KB, or the number of the records if 'count'
+                            is True
+
+        Raises:
+            KbException:    The arities do not match; 'permutation' is not a permutation of the columns
+        """
+        records, keys, other_records, other_keys = self.__operands(other, permutation)
+        new = ~self.__contained(other_keys, keys)
+        if count:
+            return len(records) + int(new.sum())
+        return self.__result(np.concatenate([records, other_records[new]]), name)
+
+    def intersect(
+        self, other: "KbRelation", permutation: Sequence[int] = None, count: bool = False, name: str = None
+    ) -> Union["KbRelation", int]:
+        """
+        Compute the intersection of the records of the relation and of another relation (see 'union').
+        """
+        records, keys, _, other_keys = self.__operands(other, permutation)
+        shared = self.__contained(keys, other_keys)
+        if count:
+            return int(shared.sum())
+        return self.__result(records[shared], name)
+
+    def difference(
+        self, other: "KbRelation", permutation: Sequence[int] = None, count: bool = False, name: str = None
+    ) -> Union["KbRelation", int]:
+        """
+        Compute the records of the relation that are not in another relation (see 'union').
+        """
+        records, keys, _, other_keys = self.__operands(other, permutation)
+        remaining = ~self.__contained(keys, other_keys)
+        if count:
+            return int(remaining.sum())
+        return self.__result(records[remaining], name)
+
+    def issubset(self, other: "KbRelation", permutation: Sequence[int] = None) -> bool:
+        """
+        Check whether all records of the relation are in another relation (see 'union').
+        """
+        if self.totalRecords() > other.totalRecords() and other.getArity() == self._arity:
+            return False
+        _, keys, _, other_keys = self.__operands(other, permutation)
+        return bool(self.__contained(keys, other_keys).all())
+
     def getRecordSet(self) -> set:
         return self._records
 
@@ -398,6 +1681,11 @@ class KbRelation:
 class NumeratedKb:
     """
     Class for a single knowledge base.
+
+    Changes to a KB can be persisted without rewriting its files by an append-only journal ('journal.wal' in the KB
+    directory): after 'openJournal', all changes to the map and the relations are logged, and 'commit' appends them
+    to the journal. The journal is replayed over the files when the KB is loaded, and 'compact' writes the changes
+    into the files and removes the journal.
     """
 
     def __init__(self, name: str, basePath: str = None, check: bool = False) -> None:
@@ -414,6 +1702,9 @@ class NumeratedKb:
         """
         self._name = name
         self._relations = dict()        # relation numeration: int -> relation object: KbRelation
+        self._kbPath = None             # The KB path that the KB was read from or written to
+        self._relFiles = dict()         # relation numeration: int -> path of the '.rel' file in '_kbPath'
+        self._journal = None            # KbJournal, where the changes are logged
 
         # Create Empty Kb
         if basePath is None:
@@ -426,8 +1717,14 @@ class NumeratedKb:
         # Load Maps
         self._numMap = NumerationMap(kbPath)
 
-        # Load Relations
+        # Load Relations. If a dump was interrupted before a superseded file was removed, the latest file is loaded.
+        rel_files = dict()
         for rel_file_path in glob("%s/*.rel" % kbPath):
+            rel_name = parseRelFilePath(rel_file_path)[0]
+            if rel_name not in rel_files or \
+                    os.stat(rel_files[rel_name]).st_mtime_ns < os.stat(rel_file_path).st_mtime_ns:
+                rel_files[rel_name] = rel_file_path
+        for rel_file_path in rel_files.values():
             rel_name, arity, record_cnt = parseRelFilePath(rel_file_path)
             num = self._numMap.name2Num(rel_name)
             if check:
@@ -435,13 +1732,109 @@ class NumeratedKb:
             else:
                 relation = KbRelation(rel_name, num, arity, record_cnt, kbPath)
             self._relations[num] = relation
+            self._relFiles[num] = os.path.abspath(rel_file_path)
+        self._kbPath = os.path.abspath(kbPath)
+
+        # Replay the journal
+        if os.path.isfile(getJournalFilePath(kbPath)):
+            self.__replay(readJournal(getJournalFilePath(kbPath))[0])
+
+    def __replay(self, entries: List[Tuple]) -> None:
+        """
+        Apply the entries of a journal. Every entry sets the state it logged, so replaying the entries over files that
+        already contain some of the changes, e.g., after an interrupted 'compact', results in the same KB. The files
+        may lack relations that the journal changes, as deleted and empty relations are not dumped: such a relation is
+        recreated by adding records, and removing records from it is skipped.
+        """
+        for entry in entries:
+            op = entry[0]
+            if JOURNAL_MAP == op:
+                self._numMap._setMapping(entry[2], entry[1])
+            elif JOURNAL_UNMAP == op:
+                self._numMap.unmapNumeration(entry[1])
+            elif JOURNAL_CREATE_RELATION == op:
+                rel_num, arity = entry[1:]
+                if rel_num not in self._relations:
+                    # The relation may have been dumped before the journal was compacted
+                    self._relations[rel_num] = KbRelation(self._numMap.num2Name(rel_num), rel_num, arity)
+            elif JOURNAL_DELETE_RELATION == op:
+                self._relations.pop(entry[1], None)
+            elif JOURNAL_ADD_RECORDS == op:
+                rel_num, records = entry[1:]
+                if 0 == len(records):
+                    continue
+                if rel_num not in self._relations:
+                    self._relations[rel_num] = KbRelation(self._numMap.num2Name(rel_num), rel_num, len(records[0]))
+                self._relations[rel_num].addRecords(records)
+            elif JOURNAL_REMOVE_RECORDS == op:
+                relation = self._relations.get(entry[1], None)
+                if relation is not None:
+                    for record in entry[2]:
+                        relation.removeRecord(record)
+            else:
+                raise KbException("Unknown journal operation: %d" % op)
+
+    def openJournal(self) -> None:
+        """
+        Start logging the changes to the KB in the journal of the path that the KB was read from or written to.
+
+        Raises:
+            KbException:    The KB has not been read or written
+        """
+        if self._kbPath is None:
+            raise KbException("The KB has no path for the journal, dump it first")
+        self.__attachJournal(KbJournal(getJournalFilePath(self._kbPath)))
+
+    def __attachJournal(self, journal: KbJournal) -> None:
+        self._journal = journal
+        self._numMap._journal = journal
+        for relation in self._relations.values():
+            relation._journal = journal
+
+    def commit(self, sync: bool = True) -> None:
+        """
+        Append the changes logged since the last commit to the journal.
+
+        Parameters:
+            sync:   Whether the journal is flushed to the disk before returning. Default: True
+
+        Raises:
+            KbException:    The journal is not open
+        """
+        if self._journal is None:
+            raise KbException("The journal is not open")
+        self._journal.commit(sync)
 
-    def dump(self, basePath: str) -> None:
+    def compact(self) -> None:
+        """
+        Write the changes in the journal into the files of the KB and remove the journal. Only the changed files are
+        rewritten (see 'dump'). The map is kept in the format it has in the files. The journal stays open if it was
+        open.
+
+        Raises:
+            KbException:    The KB has not been read or written
+        """
+        if self._kbPath is None:
+            raise KbException("The KB has not been read or written")
+        binary_map = not hasTextMap(self._kbPath) and os.path.isfile(getBinaryMapFilePath(self._kbPath))
+        self.dump(os.path.dirname(self._kbPath), binary_map)
+
+    def dump(self, basePath: str, binaryMap: bool = False) -> None:
         """
         Dump a KB to the file system. If the path does not exist, it will be created.
 
+        If the KB was read from or written to the same path, only the relations and the map shards that changed are
+        rewritten. Each relation is written with the narrowest id width that holds its ids ('idWidth'). '.rel' files
+        that do not belong to the KB any more, e.g., those superseded by a changed number of records or id width or of
+        deleted relations, are removed. Every file is written to a temporary file that is then renamed,
+        so an interrupted dump leaves no partially written file. The map is written before the relations, and the
+        superseded files are removed last. If the path has a checksum file ('updateChecksums'), the checksums of the
+        rewritten files are updated. As the files then contain all changes, the journal in the path is removed, and an
+        open journal continues in the path.
+
         Parameters:
             basePath:   The path where the KB will be stored.
+            binaryMap:  Whether the numeration map is written in the binary format. Default: False
 
         Returns:
             None
@@ -458,10 +1851,35 @@ class NumeratedKb:
             os.makedirs(kbPath, 0o755)
 
         # Dump
-        self._numMap.dump(kbPath)
-        for relation in self._relations.values():
-            if 0 < relation.totalRecords():  # Dump only non-empty relations
-                relation.dump(kbPath)
+        incremental = os.path.abspath(kbPath) == self._kbPath
+        self._numMap.dump(kbPath, binary=binaryMap)
+        rel_files = dict()
+        for num, relation in self._relations.items():
+            if 0 == relation.totalRecords():  # Dump only non-empty relations
+                continue
+            rel_file_path = self._relFiles.get(num)
+            if not (incremental and not relation.isDirty() and rel_file_path is not None and
+                    parseRelFilePath(rel_file_path) == (relation.getName(), relation.getArity(), relation.totalRecords())):
+                rel_file_path = os.path.abspath(relation.dump(kbPath))
+            rel_files[num] = rel_file_path
+
+        # Remove superseded files
+        current_files = set(rel_files.values())
+        for rel_file_path in glob("%s/*.rel" % kbPath):
+            if os.path.abspath(rel_file_path) not in current_files:
+                os.remove(rel_file_path)
+        self._kbPath = os.path.abspath(kbPath)
+        self._relFiles = rel_files
+
+        # Checksums are kept up to date for the rewritten files
+        if os.path.isfile(getChecksumFilePath(kbPath)):
+            updateChecksums(kbPath)
+
+        # Restart the journal
+        if os.path.isfile(getJournalFilePath(kbPath)):
+            os.remove(getJournalFilePath(kbPath))
+        if self._journal is not None:
+            self.__attachJournal(KbJournal(getJournalFilePath(kbPath)))
 
     def createRelation(self, relName: str, arity: int) -> KbRelation:
         """
@@ -485,6 +1903,9 @@ class NumeratedKb:
             num = self._numMap.mapName(relName)
         relation = KbRelation(relName, num, arity, 0)
         self._relations[num] = relation
+        if self._journal is not None:
+            self._journal.logCreateRelation(num, arity)
+            relation._journal = self._journal
         return relation
 
     def loadRelation(self, relBasePath: str, relName: str, arity: int, records: int, check: bool = False) -> KbRelation:
@@ -517,6 +1938,10 @@ class NumeratedKb:
         else:
             relation = KbRelation(relName, num, arity, records, relBasePath)
         self._relations[num] = relation
+        if self._journal is not None:
+            self._journal.logCreateRelation(num, arity)
+            self._journal.logRecords(JOURNAL_ADD_RECORDS, num, arity, relation)
+            relation._journal = self._journal
         return relation
 
     def deleteRelation(self, relNum: int) -> KbRelation:
@@ -529,7 +1954,11 @@ class NumeratedKb:
         Returns:
             KbRelation: The removed relation. 'None' if there is no such relation in the KB.
         """
-        return self._relations.pop(relNum, None)
+        relation = self._relations.pop(relNum, None)
+        if relation is not None and self._journal is not None:
+            self._journal.logDeleteRelation(relNum)
+            relation._journal = None
+        return relation
 
     def getRelationByName(self, relName: str) -> KbRelation:
         """
@@ -738,30 +2167,31 @@ class NumeratedKb:
         Raises:
             - KbException:  Record arity does not match the relation.
         """
+        if not isinstance(records, list):
+            records = list(records)
         if 0 == len(records):
             return
 
         relation = self.getRelationByName(relName)
         if relation is None:
-            try:
-                relation = self.createRelation(relName, len(next(iter(records))))
-            except StopIteration:
-                # If no record is in 'records', simply return
-                return
-        
-        arity = relation.getArity()
-        for record in records:
-            if len(record) != arity:
-                raise KbException("Record arity (%d) does not match the relation (%d): %s" % (len(record), arity, record))
+            # The relation is only created if all records are of the same arity
+            arity = len(records[0])
+            self.__checkArities(records, arity)
+            relation = self.createRelation(relName, arity)
+        self.__addNamedRecords(relation, records)
 
-            num_record = [0] * arity
-            for i in range(arity):
-                num = self._numMap.name2Num(record[i])
-                if num is None:
-                    num = self._numMap.mapName(record[i])
-                num_record[i] = num
-            
-            relation.addRecord(tuple(num_record))
+    def __addNamedRecords(self, relation: KbRelation, records: Iterable[tuple]) -> None:
+        """
+        Add records of names to a relation, translating all names at once by 'names2Nums'. No name is mapped if the
+        arity of any record does not match the relation.
+        """
+        if not isinstance(records, list):
+            records = list(records)
+        arity = relation.getArity()
+        self.__checkArities(records, arity)
+        if 0 < len(records):
+            nums = self._numMap.names2Nums(list(chain.from_iterable(records)))
+            relation.addArray(nums.reshape(len(records), arity))
 
     def addNamedRecords2RelationByNumeration(self, relNum: int, records: Iterable[tuple]) -> None:
         """
@@ -782,20 +2212,7 @@ class NumeratedKb:
         relation = self.getRelationByNumeration(relNum)
         if relation is None:
             raise KbException("Relation is not in the KB: %d" % relNum)
-        
-        arity = relation.getArity()
-        for record in records:
-            if len(record) != arity:
-                raise KbException("Record arity (%d) does not match the relation (%d): %s" % (len(record), arity, record))
-
-            num_record = [0] * arity
-            for i in range(arity):
-                num = self._numMap.name2Num(record[i])
-                if num is None:
-                    num = self._numMap.mapName(record[i])
-                num_record[i] = num
-            
-            relation.addRecord(tuple(num_record))
+        self.__addNamedRecords(relation, records)
 
     def addNumeratedRecords2RelationByName(self, relName: str, records: Iterable[tuple]) -> None:
         """
@@ -994,6 +2411,142 @@ class NumeratedKb:
             return relation.hasRecord(record)
         return False
 
+    @staticmethod
+    def __checkArities(records: List[tuple], arity: int) -> None:
+        if set(map(len, records)) - {arity}:
+            record = next(record for record in records if len(record) != arity)
+            raise KbException("Record arity (%d) does not match the relation (%d): %s" % (len(record), arity, record))
+
+    def hasNamedRecords(self, rel, records: Iterable[tuple]) -> np.ndarray:
+        """
+        Check a batch of records where arguments are name strings, translating all names at once by 'names2Nums'.
+
+        Parameters:
+            rel:        The relation name or numeration
+            records:    The records, arguments are name strings
+
+        Returns:
+            np.ndarray: The boolean mask of the records in the relation, all False if the KB has no such relation
+
+        Raises:
+            KbException:    Record arity does not match the relation
+        """
+        if not isinstance(records, list):
+            records = list(records)
+        relation = self.getRelationByName(rel) if isinstance(rel, str) else self.getRelationByNumeration(rel)
+        if relation is None or 0 == len(records):
+            return np.zeros(len(records), dtype=bool)
+        arity = relation.getArity()
+        self.__checkArities(records, arity)
+        nums = self._numMap.names2Nums(list(chain.from_iterable(records)), False).reshape(len(records), arity)
+        return relation.hasRecords(nums) & (0 != nums).all(axis=1)
+
+    def addNumeratedRecordArray(self, rel, records: np.ndarray) -> int:
+        """
+        Add a batch of records where arguments are numbers, given as a (#records, arity) integer array. All numerations
+        are checked against the map at once, and nothing is added if any of them is not mapped. A new KbRelation will
+        be created if the relation is given by name and does not exist in the KB.
+
+        Parameters:
+            rel:        The relation name or numeration
+            records:    The (#records, arity) integer array
+
+        Returns:
+            int:        The number of records that were not in the relation
+
+        Raises:
+            KbException:    The relation numeration is not in the KB; Record arity does not match the relation;
+                            Number is not mapped to any string
+        """
+        records = np.asarray(records)
+        if 2 != records.ndim:
+            raise KbException("Records are not a (#records, arity) array: %s" % (records.shape,))
+        if isinstance(rel, str) and self.getRelationByName(rel) is None:
+            if 0 == len(records):
+                return 0
+            self.__checkNumerations(records)
+            return self.createRelation(rel, records.shape[1]).addArray(records)
+        relation = self.__matchedRelation(rel)
+        if records.shape[1] == relation.getArity():
+            self.__checkNumerations(records)
+        return relation.addArray(records)
+
+    def __checkNumerations(self, records: np.ndarray) -> None:
+        if 0 == records.size:
+            return
+        mapped = self._numMap.mappedMask()
+        unmapped = records[(records < 1) | (records >= len(mapped))]
+        if 0 == unmapped.size:
+            unmapped = records[~mapped[records]]
+        if 0 < unmapped.size:
+            raise KbException("Numeration not mapped in the KB: %d" % unmapped[0])
+
+    def hasNumeratedRecordArray(self, rel, records: np.ndarray) -> np.ndarray:
+        """
+        Check a batch of records where arguments are numbers, given as a (#records, arity) integer array.
+
+        Parameters:
+            rel:        The relation name or numeration
+            records:    The (#records, arity) integer array
+
+        Returns:
+            np.ndarray: The boolean mask of the records in the relation, all False if the KB has no such relation
+
+        Raises:
+            KbException:    Record arity does not match the relation
+        """
+        relation = self.getRelationByName(rel) if isinstance(rel, str) else self.getRelationByNumeration(rel)
+        if relation is None:
+            return np.zeros(len(records), dtype=bool)
+        return relation.hasRecords(records)
+
+    def __matchedRelation(self, rel) -> KbRelation:
+        relation = self.getRelationByName(rel) if isinstance(rel, str) else self.getRelationByNumeration(rel)
+        if relation is None:
+            raise KbException("Relation not in the KB: %s" % rel)
+        return relation
+
+    def match(self, rel, pattern: tuple) -> np.ndarray:
+        """
+        Find the records of a relation matching a pattern, e.g., 'kb.match(rel, (s, None, o))'. The bound first
+        argument and bound arguments with indexes ('createIndex') are searched by binary search, and the other bound
+        arguments are filtered by vectorized comparisons (see 'KbRelation.match').
+
+        Parameters:
+            rel:        The name or the numeration of the relation
+            pattern:    One value for each argument: a numeration, a 'slice' of numerations '[start, stop)', or 'None'
+                        for any numeration
+
+        Returns:
+            np.ndarray: The matched records as a (#records, arity) integer array
+
+        Raises:
+            KbException:    The relation is not in the KB; the arity of the pattern does not match the relation.
+        """
+        return self.__matchedRelation(rel).match(pattern)
+
+    def iterMatch(self, rel, pattern: tuple) -> Iterator[tuple]:
+        """
+        Iterate lazily over the records of a relation matching a pattern (see 'match').
+
+        Raises:
+            KbException:    The relation is not in the KB; the arity of the pattern does not match the relation.
+        """
+        return self.__matchedRelation(rel).iterMatch(pattern)
+
+    def createIndex(self, rel, column: int) -> None:
+        """
+        Create an index of a column of a relation for 'match' (see 'KbRelation.createIndex').
+
+        Parameters:
+            rel:        The name or the numeration of the relation
+            column:     The index of the column, from 0
+
+        Raises:
+            KbException:    The relation is not in the KB or has no such column
+        """
+        self.__matchedRelation(rel).createIndex(column)
+
     def mapName(self, name: str) -> int:
         """
         Add a name string into the KB and assign the name a unique number.
@@ -1054,6 +2607,18 @@ class NumeratedKb:
         """
         return self._numMap.name2Num(name)
 
+    def names2Nums(self, names: Sequence[str], create: bool = True) -> np.ndarray:
+        """
+        Translate a batch of names into numerations (see 'NumerationMap.names2Nums').
+        """
+        return self._numMap.names2Nums(names, create)
+
+    def nums2Names(self, nums: np.ndarray) -> List:
+        """
+        Translate numerations into names (see 'NumerationMap.nums2Names').
+        """
+        return self._numMap.nums2Names(nums)
+
     def getName(self) -> str:
         return self._name
 
@@ -1075,7 +2640,125 @@ class NumeratedKb:
             cnt += relation.totalRecords()
         return cnt
 
-    # Todo: Tidy up the mapping and records because there may be many mappings that are not used due to removal
-    #       of relations and records.
-    def tidyUp(self) -> None:
-        raise KbException("Not Implemented")
\ No newline at end of file
+    def relationArray(self, relNum: int) -> np.ndarray:
+        """
+        Return the records of a relation as a (#records, arity) integer array. The ids of all relations are of the
+        same type, int32, or int64 if the numerations of the KB do not fit ('idDtype').
+
+        Parameters:
+            relNum:     The numeration of the relation
+
+        Returns:
+            np.ndarray: The records. 'None' if there is no such relation in the KB.
+        """
+        relation = self._relations.get(relNum, None)
+        if relation is None:
+            return None
+        return relation.toArray(idDtype(self._numMap.maxNumeration()))
+
+    def renumber(self, translation: np.ndarray) -> None:
+        """
+        Change the numerations in the map and in all relations by a translation array. The columns of each relation
+        are translated by one vectorized gather. The whole KB is rewritten by the next dump, and if the journal is
+        open, the KB is compacted immediately, as the journal cannot log a renumbering: the pending changes are
+        compacted and the journal is emptied before the renumbered files are written.
+
+        Parameters:
+            translation:    The new numeration of each old numeration, indexed by the old numerations. Names whose new
+                            numeration is 0 are unmapped. The non-zero new numerations should be distinct.
+
+        Raises:
+            KbException:    The new numerations are not distinct; a numeration in the records is translated to 0
+        """
+        translation = np.asarray(translation)
+        max_num = max(self._numMap.maxNumeration(), int(translation.max(initial=0)))
+        self.__renumber(translation.astype(idDtype(max_num), copy=False), dict(
+            (rel_num, self.relationArray(rel_num)) for rel_num in self._relations
+        ))
+
+    def __renumber(self, translation: np.ndarray, arrays: dict) -> None:
+        relations = dict()
+        for rel_num, relation in self._relations.items():
+            records = translation[arrays[rel_num]]
+            if not records.all() or 0 == translation[rel_num]:
+                raise KbException("Numerations in relation '%s' are translated to 0" % relation.getName())
+            relations[int(translation[rel_num])] = (relation, records)
+        if self._journal is not None:
+            # The journal is in the old numerations and must not be replayed over renumbered files. Its changes are
+            # written into the files first, and it is emptied durably before any renumbered file is written.
+            self.compact()
+            self._journal.truncate()
+        self._numMap.renumber(translation)
+        self._relations = dict()
+        for rel_num, (relation, records) in relations.items():
+            relation._numeration = rel_num
+            relation._records = set(zip(*records.T.tolist()))
+            relation._changed()
+            self._relations[rel_num] = relation
+        self._relFiles = dict()
+        if self._journal is not None:
+            self.compact()
+
+    def renumberByDegree(self) -> np.ndarray:
+        """
+        Renumber the KB so that frequent numerations get small ids: relations get the smallest ids, in descending order
+        of their number of records, followed by the other names in descending order of their degrees, i.e., the
+        number of their occurrences in all records. Names that occur nowhere get the largest ids. Ties keep the
+        original order. Small ids for hubs make delta and varint encodings smaller and arrays indexed by ids denser
+        where they are accessed most.
+
+        Returns:
+            np.ndarray: The translation array from the old numerations (indices) to the new numerations
+
+        Raises:
+            KbException:    A numeration in the records is not mapped
+        """
+        max_num = self._numMap.maxNumeration()
+        mapped = self._numMap.mappedMask()
+        arrays = dict((rel_num, self.relationArray(rel_num)) for rel_num in self._relations)
+        degrees = np.zeros(max_num + 1, dtype=np.int64)
+        for rel_num, records in arrays.items():
+            if records.size and (records.max() > max_num or records.min() < 1 or not mapped[records.ravel()].all()):
+                raise KbException("Numerations in relation '%s' are not mapped" % self._relations[rel_num].getName())
+            degrees += np.bincount(records.ravel(), minlength=max_num + 1)
+        is_relation = np.zeros(max_num + 1, dtype=bool)
+        is_relation[list(self._relations)] = True
+        degrees[is_relation] = [self._relations[rel_num].totalRecords() for rel_num in np.flatnonzero(is_relation)]
+        nums = np.flatnonzero(mapped)
+        order = nums[np.lexsort((nums, -degrees[nums], ~is_relation[nums]))]
+        translation = np.zeros(max_num + 1, dtype=idDtype(max_num))
+        translation[order] = np.arange(1, order.size + 1)
+        self.__renumber(translation, arrays)
+        return translation
+
+    def tidyUp(self) -> np.ndarray:
+        """
+        Compact the numerations. Mappings that are not used by any relation or record any more, e.g., due to the
+        removal of relations and records, are removed, and the remaining numerations are renumbered densely from 1 in
+        their original order, so that arrays indexed by numerations get smaller.
+
+        Returns:
+            np.ndarray: The translation array from the old numerations (indices) to the new numerations. Removed
+                        numerations are translated to 0.
+
+        Raises:
+            KbException:    A numeration in the records is not mapped
+        """
+        max_num = self._numMap.maxNumeration()
+        used = np.zeros(max_num + 1, dtype=bool)
+        arrays = dict()
+        for rel_num, relation in self._relations.items():
+            records = self.relationArray(rel_num)
+            arrays[rel_num] = records
+            if records.size and (records.max() > max_num or records.min() < 1):
+                raise KbException("Numerations in relation '%s' are not mapped" % relation.getName())
+            used[rel_num] = True
+            used[records.ravel()] = True
+        unmapped = used & ~self._numMap.mappedMask()
+        if unmapped.any():
+            raise KbException("Numeration in records is not mapped: %d" % np.flatnonzero(unmapped)[0])
+        used_nums = np.flatnonzero(used)
+        translation = np.zeros(max_num + 1, dtype=idDtype(max_num))
+        translation[used_nums] = np.arange(1, used_nums.size + 1)
+        self.__renumber(translation, arrays)
+        return translation
\ No newline at end of file
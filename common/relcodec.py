@@ -0,0 +1,365 @@
+from glob import glob
+from typing import Iterator, Tuple
+import argparse
+import mmap
+import os
+import re
+import struct
+import time
+import numpy as np
+
+try:
+    from numeratedkb import KbException, findRelFilePath, parseRelFilePath, readRelFile, writeRelFile
+except ImportError:
+    from common.numeratedkb import KbException, findRelFilePath, parseRelFilePath, readRelFile, writeRelFile
+
+"""
+This file defines the compressed encoding of relations ('<relation name>_<arity>_<#records>.relz'). Records are sorted
+in lexicographical order and split into blocks of a fixed number of records. In a block, every column is encoded as the
+differences between consecutive values, zigzag-mapped to non-negative integers and written as varints (7 bits per byte,
+the highest bit set in all bytes but the last of a value). The layout of a file is (all integers are little-endian):
+    - Header:   magic 'RELZ', version (uint16), arity (uint16), #records (uint64), block size (uint32), #blocks (uint32)
+    - Index:    the first subject of each block (int32 x #blocks), the offset of each block and the end of the last
+                block (uint64 x (#blocks + 1))
+    - Blocks:   the sizes in bytes of the encoded columns (uint32 x arity), followed by the encoded columns
+The index allows a relation to be streamed block by block, or a range of subjects to be read by decoding only the blocks
+that overlap the range. Encoding and decoding are vectorized over whole blocks.
+"""
+
+COMPRESSED_EXTENSION = ".relz"
+DEFAULT_BLOCK_SIZE = 4096
+
+_MAGIC = b"RELZ"
+_VERSION = 1
+_HEADER_FORMAT = '<4sHHQII'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_MAX_VARINT_BYTES = 10      # 64-bit values
+
+def getCompressedRelFilePath(kbPath: str, relName: str, arity: int, records: int) -> str:
+    """
+    Return the path of a compressed relation file
+
+    Parameters:
+        kbPath:     The input KB path.
+        relName:    The name of the relation
+        arity:      The arity of the relation
+        records:    The number of the records in the relation
+
+    Returns:
+        The file path
+    """
+    return os.path.join(kbPath, "%s_%d_%d%s" % (relName, arity, records, COMPRESSED_EXTENSION))
+
+def parseCompressedRelFilePath(path: str) -> Tuple[str, int, int]:
+    """
+    Parse a path to a '.relz' file to three components: relation name, arity, and #records.
+    """
+    file_name = os.path.basename(path)
+    relation_name, arity, record_cnt = re.findall("(.+)_([0-9]+)_([0-9]+).relz$", file_name)[0]
+    return (relation_name, int(arity), int(record_cnt))
+
+def encodeVarints(values: np.ndarray) -> np.ndarray:
+    """
+    Encode non-negative integers as varints.
+
+    Parameters:
+        values:     The uint64 array of values
+
+    Returns:
+        np.ndarray: The uint8 array of the encoded bytes
+    """
+    values = values.astype(np.uint64)
+    lengths = np.ones(values.size, dtype=np.int64)
+    for k in range(1, _MAX_VARINT_BYTES):
+        lengths += values >= np.uint64(1 << (7 * k))
+    starts = np.zeros(values.size, dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max()) if 0 < values.size else 0):
+        idx = np.flatnonzero(lengths > k)
+        byte = (values[idx] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= np.where(lengths[idx] > k + 1, np.uint64(0x80), np.uint64(0))
+        encoded[starts[idx] + k] = byte
+    return encoded
+
+def decodeVarints(encoded: np.ndarray) -> np.ndarray:
+    """
+    Decode varints.
+
+    Parameters:
+        encoded:    The uint8 array of the encoded bytes
+
+    Returns:
+        np.ndarray: The uint64 array of values
+
+    Raises:
+        KbException:    The last value is not terminated
+    """
+    ends = np.flatnonzero(encoded < 0x80)
+    if ends.size == 0 and encoded.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    if ends.size == 0 or ends[-1] != encoded.size - 1:
+        raise KbException("Truncated varint encoding")
+    starts = np.empty(ends.size, dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    values = np.zeros(ends.size, dtype=np.uint64)
+    for k in range(int(lengths.max())):
+        idx = np.flatnonzero(lengths > k)
+        values[idx] |= (encoded[starts[idx] + k].astype(np.uint64) & np.uint64(0x7f)) << np.uint64(7 * k)
+    return values
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+def sortRecords(records: np.ndarray) -> np.ndarray:
+    """
+    Sort the records of a relation in lexicographical order of the columns.
+    """
+    if 0 == records.shape[0]:
+        return records
+    return records[np.lexsort(records.T[::-1])]
+
+def encodeBlock(records: np.ndarray) -> bytes:
+    """
+    Encode a block of sorted records.
+
+    Parameters:
+        records:    The (#records, arity) integer array
+
+    Returns:
+        bytes:      The encoded block
+    """
+    columns = []
+    for column in records.T.astype(np.int64):
+        deltas = np.diff(column, prepend=0)
+        columns.append(encodeVarints(_zigzag(deltas)).tobytes())
+    return struct.pack('<%dI' % len(columns), *(len(column) for column in columns)) + b''.join(columns)
+
+def decodeBlock(block: memoryview, arity: int, records: int) -> np.ndarray:
+    """
+    Decode a block of records.
+
+    Parameters:
+        block:      The encoded block
+        arity:      The arity of the relation
+        records:    The number of records in the block
+
+    Returns:
+        np.ndarray: The (#records, arity) int32 array
+    """
+    sizes = struct.unpack_from('<%dI' % arity, block, 0)
+    decoded = np.empty((records, arity), dtype='<i4')
+    offset = 4 * arity
+    for col, size in enumerate(sizes):
+        encoded = np.frombuffer(block, dtype=np.uint8, count=size, offset=offset)
+        deltas = _unzigzag(decodeVarints(encoded))
+        if deltas.size != records:
+            raise KbException("Block column has %d values, %d expected" % (deltas.size, records))
+        decoded[:, col] = np.cumsum(deltas)
+        offset += size
+    return decoded
+
+def encodeRelation(records: np.ndarray, blockSize: int = DEFAULT_BLOCK_SIZE) -> bytes:
+    """
+    Encode the records of a relation into the compressed format. The records are sorted first.
+
+    Parameters:
+        records:    The (#records, arity) integer array
+        blockSize:  The number of records in a block. Default: DEFAULT_BLOCK_SIZE
+
+    Returns:
+        bytes:      The content of a '.relz' file
+
+    Raises:
+        KbException:    The ids do not fit in 32 bits, which the compressed format is limited to
+    """
+    record_cnt, arity = records.shape
+    if 0 < records.size and 0x7FFFFFFF < records.max():
+        raise KbException("Ids beyond 32 bits are not supported by the compressed format: %d" % records.max())
+    records = sortRecords(records)
+    blocks = [encodeBlock(records[start:start + blockSize]) for start in range(0, record_cnt, blockSize)]
+    first_keys = np.array([records[start, 0] for start in range(0, record_cnt, blockSize)], dtype='<i4')
+    offsets = np.zeros(len(blocks) + 1, dtype='<u8')
+    np.cumsum([len(block) for block in blocks], out=offsets[1:])
+    offsets += _HEADER_SIZE + first_keys.nbytes + offsets.nbytes
+    header = struct.pack(_HEADER_FORMAT, _MAGIC, _VERSION, arity, record_cnt, blockSize, len(blocks))
+    return b''.join([header, first_keys.tobytes(), offsets.tobytes()] + blocks)
+
+class CompressedRelation:
+    """
+    Class for reading a compressed relation file. The file is memory-mapped: the header and the block index are read
+    when the file is opened, and only the bytes of the blocks that are decoded are read from the file.
+    """
+
+    def __init__(self, path: str, content: bytes = None) -> None:
+        """
+        Open a '.relz' file.
+
+        Parameters:
+            path:       The path of the file
+            content:    The content of the file. Default: None, read from 'path'
+
+        Raises:
+            KbException:    The file is not a compressed relation of a supported version
+        """
+        if content is None:
+            if os.path.getsize(path) < _HEADER_SIZE:
+                raise KbException("Not a compressed relation: %s" % path)
+            with open(path, 'rb') as ifd:
+                self._buffer = mmap.mmap(ifd.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            if len(content) < _HEADER_SIZE:
+                raise KbException("Not a compressed relation: %s" % path)
+            self._buffer = memoryview(content)
+        magic, version, self.arity, self.records, self.blockSize, block_cnt = \
+            struct.unpack_from(_HEADER_FORMAT, self._buffer, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise KbException("Not a compressed relation of version %d: %s" % (_VERSION, path))
+
+        # The index is copied out of the buffer, so that the memory map can be closed
+        self.firstKeys = np.frombuffer(self._buffer, dtype='<i4', count=block_cnt, offset=_HEADER_SIZE).copy()
+        self._offsets = np.frombuffer(
+            self._buffer, dtype='<u8', count=block_cnt + 1, offset=_HEADER_SIZE + self.firstKeys.nbytes
+        ).copy()
+
+    def close(self) -> None:
+        """
+        Close the memory map of the file, if the relation is read from a file.
+        """
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self) -> "CompressedRelation":
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
+
+    def totalBlocks(self) -> int:
+        return self.firstKeys.size
+
+    def readBlock(self, idx: int) -> np.ndarray:
+        """
+        Decode the 'idx'-th block.
+
+        Returns:
+            np.ndarray: The (#records, arity) int32 array of the records in the block
+        """
+        start = int(self._offsets[idx])
+        end = int(self._offsets[idx + 1])
+        records = min(self.blockSize, self.records - idx * self.blockSize)
+        return decodeBlock(self._buffer[start:end], self.arity, records)
+
+    def iterBlocks(self, start: int = 0, end: int = None) -> Iterator[np.ndarray]:
+        """
+        Decode the blocks in '[start, end)' one after another.
+        """
+        end = self.totalBlocks() if end is None else end
+        for idx in range(start, end):
+            yield self.readBlock(idx)
+
+    def read(self) -> np.ndarray:
+        """
+        Decode all records, in lexicographical order.
+        """
+        if 0 == self.totalBlocks():
+            return np.zeros((0, self.arity), dtype='<i4')
+        return np.concatenate(list(self.iterBlocks()))
+
+    def readSubjects(self, low: int, high: int) -> np.ndarray:
+        """
+        Decode the records of which the subjects (first arguments) are in '[low, high)'. Only the blocks that overlap
+        the range are decoded.
+
+        Returns:
+            np.ndarray: The (#records, arity) int32 array of the records, in lexicographical order
+        """
+        # The last block starting before 'low' may contain 'low', and blocks starting from 'high' cannot overlap
+        start = max(int(np.searchsorted(self.firstKeys, low, side='left')) - 1, 0)
+        end = int(np.searchsorted(self.firstKeys, high, side='left'))
+        if start >= end:
+            return np.zeros((0, self.arity), dtype='<i4')
+        records = np.concatenate(list(self.iterBlocks(start, end)))
+        return records[(records[:, 0] >= low) & (records[:, 0] < high)]
+
+def compressRelationFile(
+    kbPath: str, relName: str, arity: int, records: int, blockSize: int = DEFAULT_BLOCK_SIZE
+) -> str:
+    """
+    Write the compressed file of a '.rel' file in the same directory.
+
+    Returns:
+        str:    The path of the '.relz' file
+    """
+    rel_records = readRelFile(findRelFilePath(kbPath, relName, arity, records))
+    path = getCompressedRelFilePath(kbPath, relName, arity, records)
+    with open(path, 'wb') as ofd:
+        ofd.write(encodeRelation(rel_records, blockSize))
+    return path
+
+def decompressRelationFile(kbPath: str, relName: str, arity: int, records: int) -> str:
+    """
+    Write the '.rel' file of a compressed relation file in the same directory. The records are in sorted order.
+
+    Returns:
+        str:    The path of the '.rel' file
+    """
+    with CompressedRelation(getCompressedRelFilePath(kbPath, relName, arity, records)) as relation:
+        rel_records = relation.read()
+    return writeRelFile(kbPath, relName, rel_records)
+
+def benchmark(kbPath: str, blockSize: int = DEFAULT_BLOCK_SIZE) -> Tuple[int, int, int, float]:
+    """
+    Compress all relations of a KB in memory and decode them again.
+
+    Returns:
+        int:    The total size of the '.rel' files
+        int:    The total size of the compressed relations
+        int:    The total number of records
+        float:  The time of decoding in seconds
+    """
+    raw_size = 0
+    compressed_size = 0
+    total_records = 0
+    decode_time = 0.0
+    for rel_file_path in glob("%s/*.rel" % kbPath):
+        rel_name, _, record_cnt = parseRelFilePath(rel_file_path)
+        records = readRelFile(rel_file_path)
+        encoded = encodeRelation(records, blockSize)
+        raw_size += os.path.getsize(rel_file_path)
+        compressed_size += len(encoded)
+        total_records += record_cnt
+        start = time.perf_counter()
+        decoded = CompressedRelation(rel_file_path, encoded).read()
+        decode_time += time.perf_counter() - start
+        if not np.array_equal(decoded, sortRecords(records)):
+            raise KbException("Relation is not decoded losslessly: %s" % rel_name)
+    return raw_size, compressed_size, total_records, decode_time
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the compression ratio and the decoding throughput of KBs")
+    parser.add_argument('paths', nargs='+', help="paths of KBs in the numerated format")
+    parser.add_argument('--block', '-b', type=int, default=DEFAULT_BLOCK_SIZE, help="records per block")
+    args = parser.parse_args()
+    print("%-24s %12s %12s %8s %14s %10s" % ("KB", "raw (B)", "relz (B)", "ratio", "records/s", "MB/s"))
+
+    def printRow(name: str, rawSize: int, compressedSize: int, totalRecords: int, decodeTime: float) -> None:
+        # A KB without any '.rel' file has nothing compressed or decoded
+        decode_time = max(decodeTime, 1e-9)
+        print("%-24s %12d %12d %8.2f %14.0f %10.1f" % (
+            name[:24], rawSize, compressedSize, rawSize / max(compressedSize, 1), totalRecords / decode_time,
+            rawSize / decode_time / 1048576
+        ))
+
+    totals = [0, 0, 0, 0.0]
+    for kb_path in args.paths:
+        result = benchmark(kb_path, args.block)
+        totals = [total + value for total, value in zip(totals, result)]
+        printRow(os.path.basename(os.path.normpath(kb_path)), *result)
+    printRow("total", *totals)
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-python3 -m unittest test_numeratedkb
\ No newline at end of file
+python3 -m unittest test_numeratedkb test_kbstat test_kbreport test_kbcontainer test_relcodec test_kbrenumber test_kbverify test_kbquery test_kbsketch
@@ -0,0 +1,112 @@
+import unittest
+import uuid
+from kbcontainer import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+
+class KbContainerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kbName = str(uuid.uuid4())
+        kb = NumeratedKb(self.kbName)
+        kb.addNamedRecords2RelationByName("family", [
+            ("alice", "bob", "catherine"), ("diana", "erick", "frederick"), ("gabby", "harry", "isaac")
+        ])
+        kb.addNamedRecords2RelationByName("mother", [("alice", "catherine"), ("diana", "frederick")])
+        kb.addNamedRecords2RelationByName("person", [("alice",), ("bob",), ("émile",)])
+        kb.dump(MEM_DIR)
+        self.kbPath = os.path.join(MEM_DIR, self.kbName)
+        self.outDir = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.outDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.kbPath)
+        shutil.rmtree(self.outDir)
+        container_path = getContainerPath(self.kbName, MEM_DIR)
+        if os.path.exists(container_path):
+            os.remove(container_path)
+
+    def testOpen(self):
+        container_path = convertToContainer(self.kbPath)
+        self.assertEqual(getContainerPath(self.kbName, MEM_DIR), container_path)
+        num_map = NumerationMap(self.kbPath)
+        with KbContainer(container_path) as container:
+            self.assertEqual(self.kbName, container.name())
+            self.assertEqual(num_map.totalMappings(), container.totalMappings())
+            self.assertEqual(num_map.maxNumeration(), container.maxNumeration())
+            self.assertEqual(set([
+                ("family", num_map.name2Num("family"), 3, 3), ("mother", num_map.name2Num("mother"), 2, 2),
+                ("person", num_map.name2Num("person"), 1, 3)
+            ]), set(container.relations()))
+            for name in num_map:
+                self.assertEqual(num_map.name2Num(name), container.name2Num(name))
+                self.assertEqual(name, container.num2Name(num_map.name2Num(name)))
+            self.assertIsNone(container.num2Name(0))
+            self.assertIsNone(container.num2Name(container.maxNumeration() + 1))
+            self.assertIsNone(container.name2Num("zoe"))
+
+            family = container.relationArray("family")
+            self.assertEqual((3, 3), family.shape)
+            self.assertEqual(0, family.__array_interface__['data'][0] % 64)
+            named = set(tuple(container.num2Name(num) for num in record) for record in family.tolist())
+            self.assertEqual(set([
+                ("alice", "bob", "catherine"), ("diana", "erick", "frederick"), ("gabby", "harry", "isaac")
+            ]), named)
+            self.assertIsNone(container.relationArray("father"))
+            del family
+
+    def testRoundTrip(self):
+        container_path = convertToContainer(self.kbPath, os.path.join(self.outDir, "family.nkb"))
+        kb_path = convertFromContainer(container_path, self.outDir, 5)
+        self.assertEqual(os.path.join(self.outDir, "family"), kb_path)
+        self.assertTrue(os.path.isfile(getMapFilePath(kb_path, 3)))
+        self.assertFalse(os.path.isfile(getMapFilePath(kb_path, 4)))
+
+        original = NumeratedKb(self.kbName, MEM_DIR)
+        converted = NumeratedKb("family", self.outDir)
+        original_map = NumerationMap(self.kbPath)
+        converted_map = NumerationMap(kb_path)
+        self.assertEqual(dict((name, original_map.name2Num(name)) for name in original_map),
+                         dict((name, converted_map.name2Num(name)) for name in converted_map))
+        for rel_name, arity, records in (("family", 3, 3), ("mother", 2, 2), ("person", 1, 3)):
+            self.assertEqual(original.getRelationByName(rel_name).getRecordSet(),
+                             converted.getRelationByName(rel_name).getRecordSet())
+            with open(findRelFilePath(self.kbPath, rel_name, arity, records), 'rb') as ifd:
+                original_bytes = ifd.read()
+            with open(findRelFilePath(kb_path, rel_name, arity, records), 'rb') as ifd:
+                self.assertEqual(original_bytes, ifd.read())
+
+    def testUnmappedNumerations(self):
+        num_map = NumerationMap(self.kbPath)
+        erick = num_map.name2Num("erick")
+        num_map.unmapName("erick")
+        for fname in os.listdir(self.kbPath):
+            if fname.startswith("map"):
+                os.remove(os.path.join(self.kbPath, fname))
+        num_map.dump(self.kbPath)
+        with KbContainer(convertToContainer(self.kbPath)) as container:
+            self.assertIsNone(container.num2Name(erick))
+            self.assertEqual(num_map.totalMappings(), container.totalMappings())
+            self.assertEqual(num_map.totalMappings(), len(list(container.mappings())))
+
+        # Map files are shards of numeration ranges, as written by 'NumerationMap.dump'
+        kb_path = convertFromContainer(getContainerPath(self.kbName, MEM_DIR), self.outDir, erick)
+        with open(getMapFilePath(kb_path, 1), 'r') as ifd:
+            self.assertEqual(erick - 1, len(ifd.readlines()))
+        with open(getMapFilePath(kb_path, 2), 'r') as ifd:
+            self.assertEqual(num_map.name2Num("frederick"), int(ifd.readline().split('\t')[1], 16))
+        self.assertFalse(any(fname.endswith(".tmp") for fname in os.listdir(kb_path)))
+
+    def testNotContainer(self):
+        path = os.path.join(self.outDir, "bad.nkb")
+        with open(path, 'wb') as ofd:
+            ofd.write(b'\x00' * 128)
+        self.assertRaises(KbException, KbContainer, path)
+        with open(path, 'wb') as ofd:
+            ofd.write(b'NKB')
+        self.assertRaises(KbException, KbContainer, path)
+
+if __name__ == '__main__':
+    unittest.main()
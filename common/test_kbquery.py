@@ -0,0 +1,118 @@
+import unittest
+from kbquery import *
+from numeratedkb import *
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kb = NumeratedKb("kb")
+        self.kb.addNamedRecords2RelationByName("knows", [("e%d" % i, "e%d" % ((i * 7) % 30)) for i in range(30)] + [
+            ("e%d" % i, "e%d" % ((i + 1) % 30)) for i in range(30)
+        ])
+        self.kb.addNamedRecords2RelationByName("person", [("e%d" % i,) for i in range(0, 30, 3)])
+        self.kb.addNamedRecords2RelationByName("likes", [("e%d" % i, "e%d" % (i % 4), "e%d" % i) for i in range(20)])
+
+    def naive(self, atoms):
+        """
+        Evaluate a query by nested loops over the named records.
+        """
+        bindings = [dict()]
+        for atom in atoms:
+            records = self.kb.getRelationByName(atom.relation).sortedArray().tolist()
+            extended = []
+            for binding in bindings:
+                for record in records:
+                    candidate = dict(binding)
+                    for arg, num in zip(atom.args, record):
+                        if isVariable(arg):
+                            if candidate.setdefault(arg, num) != num:
+                                break
+                        elif self.kb.name2Num(arg) != num:
+                            break
+                    else:
+                        extended.append(candidate)
+            bindings = extended
+        return bindings
+
+    def assertQuery(self, text, planner=None):
+        planner = QueryPlanner(self.kb) if planner is None else planner
+        expected = self.naive(parseQuery(text))
+        for reorder in (True, False):
+            plan = planner.plan(text, reorder)
+            result = plan.execute()
+            self.assertEqual(
+                sorted(tuple(binding[var] for var in plan.variables) for binding in expected),
+                sorted(map(tuple, result.tolist())), "%s (reorder=%s)\n%s" % (text, reorder, plan.explain())
+            )
+
+    def testParse(self):
+        self.assertEqual(
+            [Atom("knows", ("?X", "?Y")), Atom("person", ("e3",))], parseQuery("knows(?X, ?Y), person(e3)")
+        )
+        self.assertRaises(KbException, parseQuery, "knows(?X, ?Y) person(?X)")
+        self.assertRaises(KbException, parseQuery, "")
+
+    def testProfile(self):
+        profile = QueryPlanner(self.kb).profile(self.kb.getRelationByName("likes"))
+        self.assertEqual(20, profile.records)
+        self.assertEqual(4, profile.distinct(1))
+        self.assertEqual(5, profile.maxDegree(1))
+        self.assertEqual(5, profile.frequency(1, self.kb.name2Num("e2")))
+        self.assertEqual(0, profile.frequency(1, self.kb.name2Num("e29")))
+
+    def testQueries(self):
+        planner = QueryPlanner(self.kb)
+        for text in [
+            "knows(?X, ?Y), knows(?Y, ?Z), person(?Z)",
+            "person(?X), person(?Y), knows(?X, ?Y)",
+            "knows(?X, ?Y), knows(?Y, ?X)",
+            "likes(?X, ?Y, ?X), knows(?Y, ?Z)",
+            "knows(?X, e7), likes(?X, ?Y, ?Z)",
+            "knows(?X, ?Y), likes(?Y, ?Z, ?W), knows(?Z, ?X)",
+            "person(?X), person(?Y)",
+            "knows(?X, unknown)",
+            "knows(?X, ?Y), likes(?W, ?X, ?Y)",
+        ]:
+            self.assertQuery(text, planner)
+
+        # Index nested loops on indexes of other columns
+        self.kb.createIndex("knows", 1)
+        self.kb.createIndex("likes", 1)
+        self.assertQuery("person(?Y), knows(?X, ?Y), likes(?Z, ?X, ?W)")
+        self.assertQuery("knows(?X, ?Y), knows(?Y, ?Z), person(?Z)")
+
+    def testPlan(self):
+        planner = QueryPlanner(self.kb)
+        plan = planner.plan("knows(?X, ?Y), knows(?Y, ?Z), person(?Z)")
+        self.assertEqual(Atom("person", ("?Z",)), plan.steps()[0].atom)
+        self.assertEqual(SCAN, plan.steps()[0].algorithm)
+        self.assertNotIn(CROSS_PRODUCT, [step.algorithm for step in plan.steps()])
+
+        plan = planner.plan("person(?X), person(?Y), knows(?X, ?Y)", False)
+        self.assertEqual(CROSS_PRODUCT, plan.steps()[1].algorithm)
+        plan = planner.plan("person(?X), person(?Y), knows(?X, ?Y)")
+        self.assertNotIn(CROSS_PRODUCT, [step.algorithm for step in plan.steps()])
+
+        plan = planner.plan("knows(e3, ?X)")
+        self.assertEqual(INDEX_SCAN, plan.steps()[0].algorithm)
+        self.assertIn("est. rows", plan.explain())
+        plan.execute()
+        self.assertIn(INDEX_SCAN, plan.explain())
+
+        # Composite keys on columns without index are merged
+        plan = planner.plan("knows(?X, ?Y), likes(?W, ?X, ?Y)", False)
+        self.assertEqual((MERGE_JOIN, ("?X", "?Y")), plan.steps()[1][1:3])
+
+        self.assertRaises(KbException, planner.plan, "unknown(?X)")
+        self.assertRaises(KbException, planner.plan, "knows(?X)")
+
+    def testProfileCache(self):
+        planner = QueryPlanner(self.kb)
+        relation = self.kb.getRelationByName("person")
+        profile = planner.profile(relation)
+        self.assertIs(profile, planner.profile(relation))
+        self.kb.addNamedRecord2RelationByName("person", ("e1",))
+        self.assertEqual(11, planner.profile(relation).records)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import uuid
+from kbrenumber import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+
+class RenumberTest(unittest.TestCase):
+
+    def setUp(self):
+        self.basePath = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.basePath)
+        kb = NumeratedKb("kb")
+        kb.createRelation("knows", 2)
+        kb.createRelation("likes", 2)
+        for i in range(200):
+            kb.mapName("e%d" % i)
+        hub = kb.mapName("hub")
+        kb.addNumeratedRecords2RelationByName("knows", [(hub, num) for num in range(3, 203)])
+        kb.addNumeratedRecords2RelationByName("likes", [(num, hub) for num in range(3, 103)])
+        kb.dump(self.basePath)
+        self.kbPath = os.path.join(self.basePath, "kb")
+
+    def tearDown(self):
+        shutil.rmtree(self.basePath)
+
+    def testJoinPairs(self):
+        kb = NumeratedKb("kb", self.basePath)
+        self.assertEqual([(1, 1), (1, 2), (2, 2)], joinPairs(kb, 8))
+        self.assertEqual([(1, 1)], joinPairs(kb, 1))
+
+    def testRenumber(self):
+        before, after = renumberKb(self.kbPath, repeats=1)
+        self.assertEqual(203, before.maxNumeration)
+        self.assertEqual(before.relBytes, after.relBytes)
+        self.assertEqual(before.mapBytes, after.mapBytes)
+        self.assertEqual(3, after.joins)
+        self.assertEqual(before.joinResults, after.joinResults)
+        self.assertEqual(100, before.joinResults)
+        self.assertGreaterEqual(before.relzBytes, after.relzBytes)
+        self.assertEqual(203, NumeratedKb("kb", self.basePath).name2Num("hub"))
+
+        renumberKb(self.kbPath, write=True, repeats=1)
+        kb = NumeratedKb("kb", self.basePath, check=True)
+        self.assertEqual(3, kb.name2Num("hub"))
+        self.assertEqual(300, kb.totalRecords())
+        self.assertTrue(kb.hasNamedRecordInRelationByName("likes", ("e0", "hub")))
+
+if __name__ == '__main__':
+    unittest.main()
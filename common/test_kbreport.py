@@ -0,0 +1,108 @@
+import unittest
+import uuid
+import importlib.util
+import json
+import os
+import shutil
+import numpy as np
+from kbreport import *
+
+MEM_DIR = "/dev/shm"
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeReport(self, path: str) -> None:
+        with openReport(path) as report:
+            overview = report.addSheet("Overview", ["KB", "#relations"])
+            relations = report.addSheet("Relations", ["relation", "#instances", "property"])
+            relations.append(["friend", np.int64(4), False])
+            relations.append(["mother, father", 2, True])
+            overview.append(["family", 2])
+
+    def testCsv(self):
+        path = os.path.join(self.dir, "report.csv")
+        self.writeReport(path)
+        self.assertFalse(os.path.exists(path))
+        with open(os.path.join(self.dir, "report_Overview.csv"), 'r') as ifd:
+            self.assertEqual("KB,#relations\nfamily,2\n", ifd.read())
+        with open(os.path.join(self.dir, "report_Relations.csv"), 'r') as ifd:
+            self.assertEqual(
+                'relation,#instances,property\nfriend,4,False\n"mother, father",2,True\n', ifd.read()
+            )
+
+    def testTsv(self):
+        path = os.path.join(self.dir, "report.tsv")
+        self.writeReport(path)
+        with open(os.path.join(self.dir, "report_Relations.tsv"), 'r') as ifd:
+            self.assertEqual(
+                "relation\t#instances\tproperty\nfriend\t4\tFalse\nmother, father\t2\tTrue\n", ifd.read()
+            )
+
+    def testJsonLines(self):
+        path = os.path.join(self.dir, "report.jsonl")
+        self.writeReport(path)
+        with open(path, 'r') as ifd:
+            rows = [json.loads(line) for line in ifd]
+        self.assertEqual([
+            {"sheet": "Relations", "relation": "friend", "#instances": 4, "property": False},
+            {"sheet": "Relations", "relation": "mother, father", "#instances": 2, "property": True},
+            {"sheet": "Overview", "KB": "family", "#relations": 2},
+        ], rows)
+
+    def testIncompleteSink(self):
+        class LineSink(ReportSink):
+            def addSheet(self, name, header):
+                return None
+
+        self.assertRaises(TypeError, LineSink)
+        self.assertRaises(TypeError, ReportSheet)
+
+    def testFlushedRows(self):
+        for ext in (".csv", ".jsonl"):
+            report = openReport(os.path.join(self.dir, "partial" + ext))
+            sheet = report.addSheet("Relations", ["relation", "#instances"])
+            sheet.append(["friend", 4])
+            sheet_path = report.sheetPath("Relations") if ".csv" == ext else os.path.join(self.dir, "partial" + ext)
+            with open(sheet_path, 'r') as ifd:
+                self.assertIn("friend", ifd.read())
+            report.close()
+
+    @unittest.skipIf(importlib.util.find_spec("openpyxl") is None, "openpyxl is not installed")
+    def testXlsx(self):
+        import openpyxl
+        path = os.path.join(self.dir, "report.xlsx")
+        self.writeReport(path)
+        workbook = openpyxl.load_workbook(path)
+        self.assertEqual(["Overview", "Relations"], workbook.sheetnames)
+        self.assertEqual([("KB", "#relations"), ("family", 2)], list(workbook["Overview"].iter_rows(values_only=True)))
+        self.assertEqual(
+            [("relation", "#instances", "property"), ("friend", 4, False), ("mother, father", 2, True)],
+            list(workbook["Relations"].iter_rows(values_only=True))
+        )
+
+    @unittest.skipIf(importlib.util.find_spec("xlwt") is None, "xlwt is not installed")
+    def testXlsRowLimit(self):
+        report = openReport(os.path.join(self.dir, "report.xls"))
+        sheet = report.addSheet("Relations", ["relation"])
+        for i in range(XLS_MAX_ROWS - 1):
+            sheet.append([i])
+        self.assertRaises(KbException, sheet.append, [XLS_MAX_ROWS])
+        report.close()
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, "report.xls")))
+
+    def testFormat(self):
+        self.assertRaises(KbException, openReport, os.path.join(self.dir, "report.txt"))
+        report = openReport(os.path.join(self.dir, "report"), ".TSV")
+        self.assertIsInstance(report, DelimitedSink)
+        self.assertEqual(os.path.join(self.dir, "report_Overview.tsv"), report.sheetPath("Overview"))
+        report.close()
+
+if __name__ == '__main__':
+    unittest.main()
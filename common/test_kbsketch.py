@@ -0,0 +1,88 @@
+import unittest
+import uuid
+from kbsketch import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+
+class SketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.basePath = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.basePath)
+        kb = NumeratedKb("kb")
+        kb.addNamedRecords2RelationByName("parent", [("e%d" % i, "e%d" % (i + 1)) for i in range(1000)])
+        kb.addNamedRecords2RelationByName("child", [("e%d" % (i + 1), "e%d" % i) for i in range(900)])
+        kb.addNamedRecords2RelationByName("mother", [("e%d" % i, "e%d" % (i + 1)) for i in range(0, 1000, 2)])
+        kb.addNamedRecords2RelationByName("likes", [("e%d" % i, "e%d" % (i * 7 % 1000)) for i in range(1000)])
+        kb.addNamedRecords2RelationByName("person", [("e%d" % i,) for i in range(1100)])
+        kb.dump(self.basePath)
+        self.kbPath = os.path.join(self.basePath, "kb")
+
+    def tearDown(self):
+        shutil.rmtree(self.basePath)
+
+    def testMinHash(self):
+        rng = np.random.default_rng(0)
+        values = rng.choice(1 << 40, size=4000, replace=False)
+        left = hashValues(values[:3000])
+        right = hashValues(values[1000:])
+        # Jaccard similarity 0.5
+        estimate = float(np.mean(minHash(left, 256) == minHash(right, 256)))
+        self.assertAlmostEqual(0.5, estimate, delta=0.1)
+        self.assertTrue((minHash(left) == minHash(left[::-1])).all())
+        self.assertTrue((minHash(np.zeros(0, dtype=np.uint64)) == np.iinfo(np.uint64).max).all())
+
+        records = np.array([[1, 2], [2, 1], [1, 3]])
+        keys = hashRecords(records)
+        self.assertEqual(3, len(set(keys.tolist())))
+        self.assertEqual(keys[1], hashRecords(records[:1, ::-1])[0])
+        self.assertNotEqual(hashRecords(np.array([[1, 2, 0]]))[0], keys[0])
+
+    def testLoad(self):
+        sketches = loadSketches(self.kbPath, 64)
+        self.assertEqual(["child", "likes", "mother", "parent", "person"], [sketch.name for sketch in sketches])
+        self.assertTrue(os.path.isfile(os.path.join(self.kbPath, SKETCH_FILE_NAME)))
+        parent = sketches[3]
+        self.assertEqual((2, 1000, [1000, 1000]), (parent.arity, parent.records, parent.columnSizes))
+        self.assertEqual(64, len(parent.recordSignature))
+        self.assertIsNone(sketches[4].inverseSignature)
+
+        # Cached sketches are equal to calculated ones, and changed relations are sketched again
+        cached = loadSketches(self.kbPath, 64)
+        self.assertTrue((parent.recordSignature == cached[3].recordSignature).all())
+        self.assertTrue((parent.inverseSignature == cached[3].inverseSignature).all())
+        self.assertTrue(all((a == b).all() for a, b in zip(parent.columnSignatures, cached[3].columnSignatures)))
+        kb = NumeratedKb("kb", self.basePath)
+        kb.addNamedRecord2RelationByName("person", ("e2000",))
+        kb.dump(self.basePath)
+        self.assertEqual(1101, loadSketches(self.kbPath, 64)[4].records)
+        self.assertEqual(128, len(loadSketches(self.kbPath)[0].recordSignature))
+
+    def testCandidates(self):
+        index = SketchIndex(loadSketches(self.kbPath))
+        pairs = index.candidates(0.8)
+        found = set((pair.left, pair.leftColumn, pair.right, pair.rightColumn, pair.permutation) for pair in pairs)
+        self.assertIn(("child", None, "parent", None, (1, 0)), found)
+        self.assertIn(("mother", None, "parent", None, None), found)
+        self.assertIn(("parent", None, "child", None, (1, 0)), found)
+        self.assertIn(("parent", 0, "person", 0), set(pair[:4] for pair in pairs))
+        self.assertNotIn(("mother", None, "likes", None, None), found)
+        self.assertNotIn(("parent", None, "mother", None, None), found)
+        self.assertFalse(any(pair.left == pair.right and pair.leftColumn == pair.rightColumn and (
+            pair.permutation is None
+        ) for pair in pairs))
+        self.assertFalse(any(pair.leftColumn is None and "person" in (pair.left, pair.right) for pair in pairs))
+        self.assertEqual(sorted(pairs, key=lambda pair: -pair.containment), pairs)
+
+        kb = NumeratedKb("kb", self.basePath)
+        for pair in pairs:
+            if pair.leftColumn is None:
+                self.assertGreater(exactContainment(kb, pair), 0.5)
+        exhaustive = exhaustivePairs(kb, 0.8)
+        self.assertTrue(set(exhaustive) <= set((pair.left, pair.right, pair.permutation) for pair in pairs))
+        self.assertEqual([], SketchIndex([]).candidates())
+
+if __name__ == '__main__':
+    unittest.main()
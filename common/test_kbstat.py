@@ -0,0 +1,518 @@
+import unittest
+import uuid
+import importlib.util
+from kbstat import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+KB_NAME = None
+KB_PATH = None
+
+def createTestKb() -> str:
+    """
+    Returns:
+        The name and the path for the KB
+    """
+    kb_name = str(uuid.uuid4())
+    kb = NumeratedKb(kb_name)
+    kb.addNamedRecords2RelationByName("friend", [
+        ("alice", "bob"), ("bob", "alice"), ("alice", "catherine"), ("diana", "diana")
+    ])
+    kb.addNamedRecords2RelationByName("mother", [("alice", "catherine"), ("diana", "erick")])
+    kb.addNamedRecords2RelationByName("child", [("catherine", "alice"), ("erick", "diana"), ("frederick", "diana")])
+    kb.addNamedRecords2RelationByName("family", [("alice", "bob", "catherine"), ("diana", "erick", "catherine")])
+    kb.addNamedRecords2RelationByName("person", [("alice",), ("bob",), ("catherine",)])
+    kb.addNamedRecords2RelationByName("type", [("alice", "human"), ("bob", "human"), ("rex", "dog")])
+    kb.addNamedRecords2RelationByName("born", [("alice", "1990-01-##"), ("bob", "91-12-31"), ("rex", "2020-02-30")])
+    kb.addNamedRecords2RelationByName("age", [("alice", "32"), ("bob", "1.5e1"), ("catherine", "7")])
+    kb.addNamedRecords2RelationByName("source", [("1234", "alice", "wiki"), ("5678", "bob", "wiki")])
+    kb.dump(MEM_DIR)
+    return (kb_name, os.path.join(MEM_DIR, kb_name))
+
+def setUpModule():
+    global KB_PATH
+    global KB_NAME
+    KB_NAME, KB_PATH = createTestKb()
+
+def tearDownModule():
+    global KB_PATH
+    shutil.rmtree(KB_PATH)
+
+class RelationStatisticsTest(unittest.TestCase):
+
+    global KB_PATH
+
+    def testCountDistinct(self):
+        self.assertEqual(0, countDistinct(np.array([], dtype='<i4')))
+        self.assertEqual(3, countDistinct(np.array([1, 2, 2, 3, 1])))
+        self.assertEqual(3, countDistinct(np.array([[1, 100000], [1, 7]])))
+
+    def testLoad(self):
+        records = loadRelationArray(KB_PATH, "friend", 2, 4)
+        self.assertEqual((4, 2), records.shape)
+        num_map = NumerationMap(KB_PATH)
+        named = set((num_map.num2Name(s), num_map.num2Name(o)) for s, o in records.tolist())
+        self.assertEqual(set([("alice", "bob"), ("bob", "alice"), ("alice", "catherine"), ("diana", "diana")]), named)
+
+    def testBinary(self):
+        stats = relationStatistics("friend", 1, loadRelationArray(KB_PATH, "friend", 2, 4))
+        self.assertEqual("friend", stats.name)
+        self.assertEqual(1, stats.numeration)
+        self.assertEqual(2, stats.arity)
+        self.assertEqual(4, stats.records)
+        self.assertEqual(4, stats.entities)
+        self.assertEqual(3, stats.subjects)
+        self.assertEqual(4, stats.objects)
+        self.assertAlmostEqual(0.75, stats.functionality)
+        self.assertEqual(3, stats.symmetricPairs)
+        self.assertAlmostEqual(0.75, stats.symmetricity)
+
+    def testTernary(self):
+        stats = relationStatistics("family", 0, loadRelationArray(KB_PATH, "family", 3, 2))
+        self.assertEqual(5, stats.entities)
+        self.assertEqual(2, stats.subjects)
+        self.assertEqual(1, stats.objects)
+        self.assertAlmostEqual(0.4, stats.functionality)
+        self.assertEqual(0, stats.symmetricPairs)
+
+    def testUnary(self):
+        stats = relationStatistics("person", 0, loadRelationArray(KB_PATH, "person", 1, 3))
+        self.assertEqual(3, stats.entities)
+        self.assertEqual(3, stats.subjects)
+        self.assertEqual(0, stats.objects)
+        self.assertAlmostEqual(1.0, stats.functionality)
+        self.assertEqual(0, stats.symmetricPairs)
+
+    def testEmpty(self):
+        stats = relationStatistics("empty", 0, np.empty((0, 2), dtype='<i4'))
+        self.assertEqual(0, stats.records)
+        self.assertEqual(0, stats.entities)
+        self.assertEqual(0.0, stats.functionality)
+
+class SymmetricPairTest(unittest.TestCase):
+
+    def testEncodePairs(self):
+        keys = encodePairs(np.array([1, 2, 0x7fffffff]), np.array([3, 0, 0x7fffffff]))
+        self.assertEqual([(1 << 32) | 3, 2 << 32, (0x7fffffff << 32) | 0x7fffffff], keys.tolist())
+        self.assertRaises(KbException, encodePairs, np.array([1]), np.array([(1 << 32) + 5]))
+
+    def testSymmetric(self):
+        records = np.array([[1, 2], [2, 1], [3, 3], [4, 5], [5, 6]])
+        self.assertEqual(3, countSymmetricPairs(records))
+        self.assertEqual(0, countSymmetricPairs(np.empty((0, 2), dtype='<i4')))
+
+    def testSymmetricMultiplicity(self):
+        # (1, 3) appears twice and (3, 1) once as (first, last) pairs
+        records = np.array([[1, 7, 3], [1, 8, 3], [3, 9, 1]])
+        self.assertEqual(4, countSymmetricPairs(records))
+
+    def testInverse(self):
+        mother = loadRelationArray(KB_PATH, "mother", 2, 2)
+        child = loadRelationArray(KB_PATH, "child", 2, 3)
+        self.assertEqual(2, countInversePairs(mother, child))
+        self.assertEqual(2, countInversePairs(child, mother))
+        self.assertEqual(0, countInversePairs(mother, mother))
+
+    def testWideNumerations(self):
+        self.assertEqual(0, countInversePairs(np.array([[1, (1 << 32) + 5]]), np.array([[5, 1]])))
+        self.assertEqual(1, countInversePairs(np.array([[1, (1 << 32) + 5]]), np.array([[(1 << 32) + 5, 1]])))
+        records = np.array([[1 << 40, 3], [3, 1 << 40], [3, 0]], dtype=np.int64)
+        self.assertEqual(2, countSymmetricPairs(records))
+
+class MapSummaryTest(unittest.TestCase):
+
+    global KB_PATH
+
+    def testLiteralNames(self):
+        self.assertTrue(isDate("1990-01-02"))
+        self.assertTrue(isDate("90-1-2"))
+        self.assertTrue(isDate("19##-##-##"))
+        self.assertFalse(isDate("1990-02-30"))
+        self.assertFalse(isDate("1990-01-02x"))
+        self.assertFalse(isDate("alice"))
+        self.assertTrue(isNumber("32"))
+        self.assertTrue(isNumber("-1.5e1"))
+        self.assertTrue(isNumber("\u00bd"))
+        self.assertFalse(isNumber("1990-01-02"))
+        self.assertFalse(isNumber("alice"))
+
+    def testSummary(self):
+        num_map = NumerationMap(KB_PATH)
+        summary = summarizeMap(KB_PATH, relNames=set(["friend", "type"]))
+        self.assertEqual(num_map.totalMappings(), summary.mappings)
+        self.assertEqual(num_map.totalMappings(), summary.maxNumeration)
+        literals = set(num_map.num2Name(num) for num in np.flatnonzero(summary.literals))
+        self.assertEqual(set(["1990-01-##", "91-12-31", "32", "1.5e1", "7", "1234", "5678"]), literals)
+        self.assertFalse(summary.indices.any())
+        self.assertEqual({"friend": num_map.name2Num("friend"), "type": num_map.name2Num("type")}, summary.relations)
+
+    def testBinaryMap(self):
+        num_map = NumerationMap(KB_PATH)
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        try:
+            num_map.dump(tmp_path, binary=True)
+            summary = summarizeMap(tmp_path, relNames=set(["friend", "type"]))
+            expected = summarizeMap(KB_PATH, relNames=set(["friend", "type"]))
+            self.assertEqual(expected.mappings, summary.mappings)
+            self.assertTrue(np.array_equal(expected.classes, summary.classes))
+            self.assertEqual(expected.relations, summary.relations)
+            nums = [num_map.name2Num("friend"), num_map.name2Num("32"), num_map.maxNumeration() + 1]
+            self.assertEqual(lookupNames(KB_PATH, nums), lookupNames(tmp_path, nums))
+            self.assertEqual({nums[0]: "friend", nums[1]: "32"}, lookupNames(tmp_path, nums))
+        finally:
+            shutil.rmtree(tmp_path)
+
+    def testIndices(self):
+        num_map = NumerationMap(KB_PATH)
+        summary = summarizeMap(KB_PATH, set(["32", "7", "1.5e1"]))
+        indices = set(num_map.num2Name(num) for num in np.flatnonzero(summary.indices))
+        self.assertEqual(set(["1234", "5678"]), indices)
+        self.assertFalse(summary.literals[num_map.name2Num("1234")])
+
+    def testClassifyName(self):
+        self.assertEqual(CLASS_ENTITY, classifyName("alice"))
+        self.assertEqual(CLASS_ENTITY, classifyName("1990-01-02x"))
+        self.assertEqual(CLASS_DATE, classifyName("19##-##-##"))
+        self.assertEqual(CLASS_INTEGER, classifyName("32"))
+        self.assertEqual(CLASS_FLOAT, classifyName("-1.5e1"))
+        self.assertEqual(CLASS_FLOAT, classifyName("\u00bd"))
+        self.assertEqual(CLASS_FLOAT, classifyName("nan"))
+        self.assertEqual(CLASS_INTEGER, classifyName("32", set(["32"])))
+        self.assertEqual(CLASS_INTEGER | CLASS_INDEX, classifyName("1234", set(["32"])))
+        self.assertEqual(CLASS_FLOAT | CLASS_INDEX, classifyName("1.5", set(["32"])))
+
+    def testClasses(self):
+        num_map = NumerationMap(KB_PATH)
+        summary = summarizeMap(KB_PATH, set(["32", "7", "1.5e1"]), set(["friend"]))
+        self.assertEqual(np.uint8, summary.classes.dtype)
+        self.assertEqual(summary.maxNumeration + 1, summary.classes.size)
+        self.assertEqual(CLASS_UNMAPPED, summary.classes[0])
+        self.assertEqual(CLASS_RELATION, summary.classes[num_map.name2Num("friend")])
+        self.assertEqual(CLASS_ENTITY, summary.classes[num_map.name2Num("alice")])
+        self.assertEqual(CLASS_DATE, summary.classes[num_map.name2Num("91-12-31")])
+        self.assertEqual(CLASS_FLOAT, summary.classes[num_map.name2Num("1.5e1")])
+        self.assertEqual(CLASS_INTEGER | CLASS_INDEX, summary.classes[num_map.name2Num("5678")])
+        self.assertEqual(2, summary.countClasses(CLASS_INDEX))
+        self.assertEqual(7, summary.countClasses(CLASS_LITERAL))
+        self.assertEqual(5, int(np.count_nonzero(summary.literals)))
+
+        markTypes(summary, loadRelationArray(KB_PATH, "type", 2, 3))
+        self.assertEqual(2, summary.countClasses(CLASS_TYPE))
+        types = set(num_map.num2Name(num) for num in np.flatnonzero(summary.classes & CLASS_TYPE))
+        self.assertEqual(set(["human", "dog"]), types)
+        self.assertTrue(summary.propertyMask()[num_map.name2Num("dog")])
+        self.assertTrue(summary.propertyMask()[num_map.name2Num("7")])
+        self.assertFalse(summary.propertyMask()[num_map.name2Num("1234")])
+        self.assertFalse(summary.propertyMask()[num_map.name2Num("alice")])
+
+    def testCachedSummary(self):
+        kb_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        shutil.copytree(KB_PATH, kb_path)
+        try:
+            integers = set(["32", "7", "1.5e1"])
+            summary = loadMapSummary(kb_path, integers, set(["friend"]), ("type", 2, 3))
+            self.assertTrue(os.path.isfile(os.path.join(kb_path, "classification.meta")))
+            self.assertEqual(2, summary.countClasses(CLASS_TYPE))
+            cached = loadMapSummary(kb_path, integers, set(["friend"]), ("type", 2, 3))
+            self.assertEqual(summary.mappings, cached.mappings)
+            self.assertEqual(summary.maxNumeration, cached.maxNumeration)
+            self.assertEqual(summary.relations, cached.relations)
+            self.assertTrue(np.array_equal(summary.classes, cached.classes))
+
+            # Other parameters are not served by the cache
+            self.assertEqual(0, loadMapSummary(kb_path, integers, set(["friend"])).countClasses(CLASS_TYPE))
+            self.assertEqual(0, loadMapSummary(kb_path, None, set(["friend"])).countClasses(CLASS_INDEX))
+
+            # A changed type relation is not served by the cache
+            type_path = getRelFilePath(kb_path, "type", 2, 3, 2)
+            with open(type_path, 'rb') as ifd:
+                content = ifd.read()
+            os.remove(type_path)
+            with open(getRelFilePath(kb_path, "type", 2, 2, 2), 'wb') as ofd:
+                ofd.write(content[:8])
+            self.assertGreater(3, loadMapSummary(kb_path, integers, set(), ("type", 2, 2)).countClasses(CLASS_TYPE))
+        finally:
+            shutil.rmtree(kb_path)
+
+    def testPropertyAndReified(self):
+        summary = summarizeMap(KB_PATH, set(["32", "7", "1.5e1"]))
+        born = relationStatistics(
+            "born", 0, loadRelationArray(KB_PATH, "born", 2, 3), summary.literals, summary.indices
+        )
+        self.assertAlmostEqual(2 / 3, born.propertyRatio)
+        self.assertTrue(born.isProperty())
+        self.assertFalse(born.isReified())
+        source = relationStatistics(
+            "source", 0, loadRelationArray(KB_PATH, "source", 3, 2, mmap=True), summary.literals, summary.indices
+        )
+        self.assertEqual(0.0, source.propertyRatio)
+        self.assertEqual(1.0, source.reifiedRatio)
+        self.assertTrue(source.isReified())
+
+def squareWorker(value: int) -> int:
+    return value * value
+
+class PartialTest(unittest.TestCase):
+
+    global KB_PATH
+
+    def testMapRelations(self):
+        self.assertEqual([0, 1, 4, 9], list(mapRelations(squareWorker, range(4))))
+        self.assertEqual([0, 1, 4, 9], list(mapRelations(squareWorker, range(4), workers=2)))
+
+    def testMapRelationsInBudget(self):
+        self.assertEqual(
+            [value * value for value in range(10)],
+            list(mapRelations(squareWorker, range(10), workers=3, memoryBudget=10, estimate=lambda value: value))
+        )
+
+    def testSchedule(self):
+        sizes = [50, 10, 100, 30, 5, 5, 40]
+        batches = scheduleRelations(sizes, 100, 3)
+        self.assertEqual([[2], [0, 6, 1], [3, 4, 5]], batches)
+        for batch in batches:
+            self.assertTrue(3 >= len(batch))
+            self.assertTrue(100 >= sum(sizes[idx] for idx in batch))
+        self.assertEqual([[0], [1], [2]], scheduleRelations([300, 200, 100], 100, 3))
+        self.assertEqual([[1, 0, 2]], scheduleRelations([1, 2, 1], 100, 3))
+        self.assertEqual(estimateWorkingSet(2, 100) * 2 - estimateWorkingSet(2, 0), estimateWorkingSet(2, 200))
+
+    def testKbPartial(self):
+        num_map = NumerationMap(KB_PATH)
+        kb_partial = KbPartial(num_map.maxNumeration())
+        for rel_name, arity, records in (("friend", 2, 4), ("mother", 2, 2), ("family", 3, 2)):
+            partial = relationPartial(rel_name, 0, loadRelationArray(KB_PATH, rel_name, arity, records))
+            kb_partial.add(partial)
+        self.assertEqual(3, kb_partial.relations)
+        self.assertEqual(8, kb_partial.records)
+        self.assertEqual(18, kb_partial.totalDegree())
+        self.assertEqual(18, kb_partial.degrees.total())
+        self.assertEqual(5, kb_partial.degrees.degrees[num_map.name2Num("alice")])
+        self.assertEqual(4, kb_partial.degrees.degrees[num_map.name2Num("diana")])
+        self.assertEqual(4, kb_partial.degrees.degrees[num_map.name2Num("catherine")])
+        self.assertAlmostEqual(3.0, kb_partial.averageDegree(6))
+
+    def testCountValues(self):
+        nums, counts = countValues(np.array([[3, 1], [1, 1]]))
+        self.assertEqual([1, 3], nums.tolist())
+        self.assertEqual([3, 1], counts.tolist())
+        nums, counts = countValues(np.array([100000, 7, 100000]))
+        self.assertEqual([7, 100000], nums.tolist())
+        self.assertEqual([1, 2], counts.tolist())
+        nums, counts = countValues(np.array([], dtype='<i4'))
+        self.assertEqual(0, nums.size)
+        self.assertEqual(0, counts.size)
+
+    def testEntityDegrees(self):
+        num_map = NumerationMap(KB_PATH)
+        degrees = EntityDegrees(num_map.maxNumeration())
+        self.assertEqual(np.uint32, degrees.degrees.dtype)
+        degrees.addRecords(loadRelationArray(KB_PATH, "friend", 2, 4))
+        degrees.addRecords(loadRelationArray(KB_PATH, "mother", 2, 2))
+        degrees.addRecords(loadRelationArray(KB_PATH, "family", 3, 2))
+        self.assertEqual(18, degrees.total())
+
+        # alice: 5, diana: 4, catherine: 4, bob: 3, erick: 2
+        mask = np.zeros(degrees.degrees.size, dtype=bool)
+        mask[[num_map.name2Num(name) for name in ("alice", "bob", "catherine", "diana", "erick", "rex")]] = True
+        distribution = degrees.distribution(mask)
+        self.assertEqual([0, 2, 3, 4, 5], distribution[0].tolist())
+        self.assertEqual([1, 1, 1, 2, 1], distribution[1].tolist())
+
+        catherine = num_map.name2Num("catherine")
+        diana = num_map.name2Num("diana")
+        self.assertEqual(
+            [(num_map.name2Num("alice"), 5), (min(catherine, diana), 4), (max(catherine, diana), 4)],
+            degrees.topHubs(3, mask)
+        )
+        self.assertEqual([(num_map.name2Num("alice"), 5)], degrees.topHubs(1))
+        self.assertEqual(6, len(degrees.topHubs(10, mask)))
+        self.assertEqual([], degrees.topHubs(0, mask))
+
+@unittest.skipIf(importlib.util.find_spec("openpyxl") is None, "openpyxl is not installed")
+class DumpKbStatisticsTest(unittest.TestCase):
+
+    global KB_PATH
+
+    def testDump(self):
+        import openpyxl
+        dumpKbStatistics(KB_PATH, integers=set(["32", "7", "1.5e1"]))
+        output_path = os.path.join(KB_PATH, "%s_statistics.xlsx" % KB_NAME)
+        workbook = openpyxl.load_workbook(output_path)
+        os.remove(output_path)
+        self.assertEqual(["Overview", "Relations", "Degrees", "Hubs"], workbook.sheetnames)
+
+        overview = list(workbook["Overview"].iter_rows(values_only=True))
+        num_map = NumerationMap(KB_PATH)
+        entities = num_map.totalMappings() - 9 - 2
+        self.assertEqual(("KB", "#relations", "#entities", "#classes", "avg. degr."), overview[0])
+        self.assertEqual((KB_NAME, 9, entities, 2, round(51 / entities, 2)), overview[1])
+
+        rows = list(workbook["Relations"].iter_rows(values_only=True))
+        self.assertEqual(10, len(rows))
+        self.assertEqual("type", rows[1][0])
+        relations = dict((row[0], row) for row in rows[1:])
+        self.assertEqual(("friend", num_map.name2Num("friend"), 4, 16.0, False, False, 4, 3, 4, 0.75, 0.75), relations["friend"])
+        self.assertTrue(relations["type"][4])
+        self.assertTrue(relations["age"][4])
+        self.assertTrue(relations["source"][5])
+        self.assertFalse(relations["person"][4])
+
+        degrees = list(workbook["Degrees"].iter_rows(values_only=True))
+        self.assertEqual(("degree", "#entities"), degrees[0])
+        self.assertEqual(entities, sum(row[1] for row in degrees[1:]))
+        self.assertEqual(51 - 2, sum(row[0] * row[1] for row in degrees[1:]))     # Index ids are not entities
+        hubs = list(workbook["Hubs"].iter_rows(values_only=True))
+        self.assertEqual(("entity", "id", "degree"), hubs[0])
+        self.assertEqual(("alice", num_map.name2Num("alice"), 11), hubs[1])
+        self.assertEqual(11, len(hubs))
+
+    def testParallelDump(self):
+        import openpyxl
+        sequential_path = os.path.join(KB_PATH, "sequential.xlsx")
+        parallel_path = os.path.join(KB_PATH, "parallel.xlsx")
+        dumpKbStatistics(KB_PATH, sequential_path, useCache=False)
+        dumpKbStatistics(KB_PATH, parallel_path, workers=3, useCache=False)
+        sequential = openpyxl.load_workbook(sequential_path)
+        parallel = openpyxl.load_workbook(parallel_path)
+        os.remove(sequential_path)
+        os.remove(parallel_path)
+        for sheet in ("Overview", "Relations"):
+            self.assertEqual(
+                list(sequential[sheet].iter_rows(values_only=True)), list(parallel[sheet].iter_rows(values_only=True))
+            )
+
+    def testCachedDump(self):
+        import openpyxl
+        kb_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        shutil.copytree(KB_PATH, kb_path)
+        try:
+            first_path = os.path.join(kb_path, "first.xlsx")
+            second_path = os.path.join(kb_path, "second.xlsx")
+            dumpKbStatistics(kb_path, first_path, workers=2)
+            self.assertTrue(os.path.isfile(os.path.join(kb_path, "kbstat.meta")))
+
+            # Change a relation, which is the only one calculated in the rerun
+            friend_path = getRelFilePath(kb_path, "friend", 2, 4, 2)
+            with open(friend_path, 'rb') as ifd:
+                content = ifd.read()
+            os.remove(friend_path)
+            with open(getRelFilePath(kb_path, "friend", 2, 3, 2), 'wb') as ofd:
+                ofd.write(content[:12])
+            dumpKbStatistics(kb_path, second_path)
+            first = openpyxl.load_workbook(first_path)
+            second = openpyxl.load_workbook(second_path)
+            self.assertEqual(
+                list(first["Overview"].iter_rows(values_only=True))[1][:4],
+                list(second["Overview"].iter_rows(values_only=True))[1][:4]
+            )
+            self.assertEqual(
+                round(49 / list(second["Overview"].iter_rows(values_only=True))[1][2], 2),
+                list(second["Overview"].iter_rows(values_only=True))[1][4]
+            )
+            first_rows = dict((row[0], row) for row in list(first["Relations"].iter_rows(values_only=True))[1:])
+            second_rows = dict((row[0], row) for row in list(second["Relations"].iter_rows(values_only=True))[1:])
+            self.assertEqual(3, second_rows["friend"][2])
+            # Degrees of cached relations are counted as well
+            degrees = list(second["Degrees"].iter_rows(values_only=True))[1:]
+            self.assertEqual(51 - 2, sum(row[0] * row[1] for row in degrees))
+            for rel_name in ("type", "child", "source", "person"):
+                self.assertEqual(first_rows[rel_name][4:], second_rows[rel_name][4:])
+
+            with open(os.path.join(kb_path, "kbstat.meta"), 'r') as ifd:
+                cached_files = set(json.load(ifd)["relations"])
+            self.assertIn(os.path.basename(getRelFilePath(kb_path, "friend", 2, 3, 2)), cached_files)
+            self.assertNotIn(os.path.basename(friend_path), cached_files)
+        finally:
+            shutil.rmtree(kb_path)
+
+    def testEmptyRelations(self):
+        kb_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        kb = NumeratedKb(os.path.basename(kb_path))
+        kb.mapName("empty")
+        kb.mapName("alice")
+        kb.dump(MEM_DIR)
+        writeRelFile(kb_path, "empty", np.zeros((0, 2), dtype=np.int32))
+        try:
+            dumpKbStatistics(kb_path, os.path.join(kb_path, "stats.csv"))
+            with open(os.path.join(kb_path, "stats_Relations.csv"), 'r') as ifd:
+                self.assertEqual("empty,1,0,0.0", ifd.readlines()[1][:13])
+        finally:
+            shutil.rmtree(kb_path)
+
+class StatisticsCacheTest(unittest.TestCase):
+
+    global KB_PATH
+
+    def setUp(self):
+        self.kbPath = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        shutil.copytree(KB_PATH, self.kbPath)
+        self.relFilePath = getRelFilePath(self.kbPath, "mother", 2, 2, 2)
+        self.stats = relationStatistics("mother", 3, loadRelationArray(self.kbPath, "mother", 2, 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.kbPath)
+
+    def testFingerprint(self):
+        fingerprint = fileFingerprint(self.relFilePath)
+        self.assertEqual(8, fingerprint[0])
+        self.assertEqual(fingerprint, fileFingerprint(self.relFilePath))
+        hashed = fileFingerprint(self.relFilePath, True)
+        self.assertEqual(8, hashed[0])
+        self.assertEqual(32, len(hashed[1]))
+        self.assertNotEqual(hashed, fileFingerprint(getRelFilePath(self.kbPath, "child", 2, 3, 2), True))
+
+    def testHitAndMiss(self):
+        cache = StatisticsCache(self.kbPath, "context")
+        self.assertIsNone(cache.get(self.relFilePath))
+        cache.put(self.relFilePath, self.stats)
+        cache.dump()
+
+        cache = StatisticsCache(self.kbPath, "context")
+        self.assertEqual(self.stats, cache.get(self.relFilePath))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(0, cache.misses)
+
+        # Another context drops all entries
+        self.assertIsNone(StatisticsCache(self.kbPath, "another context").get(self.relFilePath))
+        self.assertIsNone(StatisticsCache(self.kbPath, "context", True).get(self.relFilePath))
+
+    def testChangedFile(self):
+        for content_hash, value in ((False, 0), (True, 1)):
+            cache = StatisticsCache(self.kbPath, "context", content_hash)
+            cache.put(self.relFilePath, self.stats)
+            cache.dump()
+            modified_time = os.stat(self.relFilePath).st_mtime_ns
+            with open(self.relFilePath, 'r+b') as ofd:
+                ofd.write(struct.pack('<i', value))
+            # The modification time may not tick within the test
+            os.utime(self.relFilePath, ns=(modified_time + 1000, modified_time + 1000))
+            cache = StatisticsCache(self.kbPath, "context", content_hash)
+            self.assertIsNone(cache.get(self.relFilePath))
+            self.assertEqual(1, cache.misses)
+
+    def testUnusedEntries(self):
+        cache = StatisticsCache(self.kbPath, "context")
+        cache.put(self.relFilePath, self.stats)
+        cache.dump()
+        StatisticsCache(self.kbPath, "context").dump()
+        self.assertIsNone(StatisticsCache(self.kbPath, "context").get(self.relFilePath))
+
+    def testContextDigest(self):
+        digest = contextDigest(self.kbPath, False, "type")
+        self.assertEqual(digest, contextDigest(self.kbPath, False, "type"))
+        self.assertNotEqual(digest, contextDigest(self.kbPath, False, "isA"))
+        self.assertNotEqual(digest, contextDigest(self.kbPath, True, "type"))
+
+    def testMapRelationsWithCache(self):
+        cache = StatisticsCache(self.kbPath, "context")
+        cache.put(self.relFilePath, self.stats)
+        child_path = getRelFilePath(self.kbPath, "child", 2, 3, 2)
+        analyze = lambda relation: relationPartial(relation, 0, loadRelationArray(self.kbPath, relation, 2, 3))
+        partials = list(mapRelationsWithCache(cache, [self.relFilePath, child_path], analyze, ["mother", "child"]))
+        self.assertEqual(self.stats, partials[0].statistics)
+        self.assertIsNone(partials[0].degreeNums)
+        self.assertEqual("child", partials[1].statistics.name)
+        self.assertEqual(partials[1].statistics, cache.get(child_path))
@@ -0,0 +1,68 @@
+import unittest
+import uuid
+from kbverify import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+
+class VerifyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.basePath = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.basePath)
+        kb = NumeratedKb("kb")
+        kb.addNamedRecords2RelationByName("knows", [("e%d" % i, "e%d" % (i + 1)) for i in range(100)])
+        kb.addNamedRecords2RelationByName("person", [("e%d" % i,) for i in range(50)])
+        kb.dump(self.basePath)
+        self.kbPath = os.path.join(self.basePath, "kb")
+
+    def tearDown(self):
+        shutil.rmtree(self.basePath)
+
+    def testChecksums(self):
+        path = os.path.join(self.kbPath, "map1.tsv")
+        checksums = computeChecksums([path, path], 64, 2)
+        self.assertEqual((os.path.getsize(path) + 63) // 64, len(checksums[0]))
+        self.assertEqual(checksums[0], checksums[1])
+        with open(path, 'rb') as ifd:
+            content = ifd.read()
+        self.assertEqual(zlib.crc32(content[64:128]), checksums[0][1])
+
+        self.assertIsNone(readChecksums(self.kbPath))
+        written = updateChecksums(self.kbPath, 64)
+        self.assertEqual(written, readChecksums(self.kbPath))
+        self.assertEqual(set(["map1.tsv", "knows_2_100.u16.rel", "person_1_50.u16.rel"]), set(written["files"]))
+
+    def testVerify(self):
+        self.assertEqual([KbProblem(CHECKSUM_FILE_NAME, None, "no checksums")], verifyKb(self.kbPath))
+        updateChecksums(self.kbPath, 64)
+        self.assertEqual([], verifyKb(self.kbPath, 2))
+
+        # Corrupted blocks are located
+        rel_path = os.path.join(self.kbPath, "knows_2_100.u16.rel")
+        with open(rel_path, 'r+b') as ofd:
+            ofd.seek(130)
+            ofd.write(b'\xff')
+        self.assertEqual([KbProblem("knows_2_100.u16.rel", 2, "checksum mismatch")], verifyKb(self.kbPath))
+
+        # Truncated and missing files
+        os.truncate(rel_path, 10)
+        os.remove(os.path.join(self.kbPath, "person_1_50.u16.rel"))
+        self.assertEqual([
+            KbProblem("knows_2_100.u16.rel", None, "size 10, 2 x 100 x 2 expected"),
+            KbProblem("knows_2_100.u16.rel", None, "size 10, 400 recorded"),
+            KbProblem("person_1_50.u16.rel", None, "missing"),
+        ], verifyKb(self.kbPath))
+
+    def testDump(self):
+        updateChecksums(self.kbPath)
+        kb = NumeratedKb("kb", self.basePath)
+        kb.addNamedRecord2RelationByName("person", ("e99",))
+        kb.dump(self.basePath)
+        self.assertIn("person_1_51.u16.rel", readChecksums(self.kbPath)["files"])
+        self.assertNotIn("person_1_50.u16.rel", readChecksums(self.kbPath)["files"])
+        self.assertEqual([], verifyKb(self.kbPath))
+
+if __name__ == '__main__':
+    unittest.main()
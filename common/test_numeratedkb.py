@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import uuid
 from numeratedkb import *
 import shutil
@@ -129,6 +130,16 @@ class RelFilePathTest(unittest.TestCase):
         self.assertEqual("dir/relation_3_15.rel", rel_file_path)
         self.assertEqual((rel_name, arity, records), parseRelFilePath(rel_file_path))
 
+    def testWidth(self):
+        self.assertEqual("dir/relation_3_15.u16.rel", getRelFilePath("dir", "relation", 3, 15, 2))
+        self.assertEqual("dir/relation_3_15.u64.rel", getRelFilePath("dir", "relation", 3, 15, 8))
+        self.assertEqual(("relation", 3, 15), parseRelFilePath("dir/relation_3_15.u16.rel"))
+        self.assertEqual(("relation", 3, 15, 2), parseRelFilePath("dir/relation_3_15.u16.rel", True))
+        self.assertEqual(("relation", 3, 15, 4), parseRelFilePath("dir/relation_3_15.rel", True))
+        self.assertEqual(("relation", 3, 15, 8), parseRelFilePath("dir/relation_3_15.u64.rel", True))
+        self.assertEqual(("relation_3", 1, 15, 4), parseRelFilePath("dir/relation_3_1_15.rel", True))
+        self.assertEqual([2, 2, 4, 4, 8], [idWidth(i) for i in (1, 0xFFFF, 0x10000, 2 ** 31 - 1, 2 ** 31)])
+
 class MapFileTest(unittest.TestCase):
 
     def testAbsolutePath1(self):
@@ -171,6 +182,7 @@ class NumerationMapTest(unittest.TestCase):
         self.assertEqual(0, len(num_map._numMap))
         self.assertEqual(1, len(num_map._numArray))
         self.assertEqual(0, len(num_map._freeNums))
+        self.assertEqual(0, num_map.maxNumeration())
         
         self.assertEqual(None, num_map.unmapName('a'))
         self.assertEqual(None, num_map.unmapNumeration(0))
@@ -280,6 +292,7 @@ class NumerationMapTest(unittest.TestCase):
         self.assertEqual(14, len(num_map._numMap))
         self.assertEqual(18, len(num_map._numArray))
         self.assertEqual(3, len(num_map._freeNums))
+        self.assertEqual(17, num_map.maxNumeration())
 
     def testUnMappingNum(self):
         num_map = NumerationMap(KB_PATH)
@@ -320,6 +333,301 @@ class NumerationMapTest(unittest.TestCase):
         self.assertEqual(21, len(num_map._numArray))
         self.assertEqual(3, len(num_map._freeNums))
 
+    def testBatchTranslation(self):
+        num_map = NumerationMap(KB_PATH)
+        self.assertEqual(4, num_map.unmapName('alice'))
+        self.assertEqual(
+            [1, 4, 18, 4, 19, 1], num_map.names2Nums(['family', 'a', 'b', 'a', 'c', 'family']).tolist()
+        )
+        self.assertEqual(['a', 'b', 'c'], [num_map.num2Name(num) for num in (4, 18, 19)])
+        self.assertEqual(0, len(num_map._freeNums))
+        self.assertEqual([19, 0], num_map.names2Nums(['c', 'd'], create=False).tolist())
+        self.assertEqual(None, num_map.name2Num('d'))
+        self.assertEqual(0, len(num_map.names2Nums([])))
+
+        self.assertEqual(['family', None, 'c', None], num_map.nums2Names(np.array([1, 0, 19, 20])))
+        self.assertEqual([('family', 'a'), ('b', None)], num_map.nums2Names(np.array([[1, 4], [18, -1]])))
+
+        # Mapped in a block, as by 'mapName' one by one
+        num_map2 = NumerationMap(KB_PATH)
+        num_map2.unmapName('alice')
+        for name in ['family', 'a', 'b', 'a', 'c', 'family']:
+            num_map2.mapName(name)
+        self.assertEqual(sorted(num_map2), sorted(num_map))
+
+    def testMappedMask(self):
+        num_map = NumerationMap(KB_PATH)
+
+        def expected():
+            return [num_map.num2Name(num) is not None for num in range(num_map.maxNumeration() + 1)]
+
+        self.assertEqual(expected(), num_map.mappedMask().tolist())
+        num_map.unmapName('alice')
+        num_map.unmapNumeration(2)
+        self.assertEqual(expected(), num_map.mappedMask().tolist())
+        num_map.mapName('a')
+        num_map.names2Nums(['b'] + ['n%d' % i for i in range(100)])
+        self.assertEqual(expected(), num_map.mappedMask().tolist())
+        self.assertRaises(ValueError, num_map.mappedMask().__setitem__, 0, True)
+
+class BinaryMapTest(unittest.TestCase):
+
+    global KB_PATH
+    global TMP_PATHS
+
+    def createTmpDir(self) -> str:
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        TMP_PATHS.append(tmp_path)
+        return tmp_path
+
+    def testEncode(self):
+        names = [None, "family".encode(), None, "älice".encode(), "bob".encode()]
+        for hash_table in (True, False):
+            binary_map = BinaryMap(encodeBinaryMap(names, hash_table))
+            self.assertEqual(hash_table, binary_map.hasHashTable())
+            self.assertEqual(3, binary_map.totalMappings())
+            self.assertEqual(4, binary_map.maxNumeration())
+            self.assertEqual("family", binary_map.num2Name(1))
+            self.assertEqual(None, binary_map.num2Name(0))
+            self.assertEqual(None, binary_map.num2Name(2))
+            self.assertEqual(None, binary_map.num2Name(5))
+            self.assertEqual("älice", binary_map.num2Name(3))
+            self.assertEqual(3, binary_map.name2Num("älice"))
+            self.assertEqual(4, binary_map.name2Num("bob"))
+            self.assertEqual(None, binary_map.name2Num("carl"))
+            self.assertEqual([(1, "family"), (3, "älice"), (4, "bob")], list(binary_map.entries()))
+
+        binary_map = BinaryMap(b'\x00' * 3 + encodeBinaryMap(names), 3)
+        self.assertEqual(1, binary_map.name2Num("family"))
+        self.assertRaises(KbException, BinaryMap, b'NKB\x00' + encodeBinaryMap(names))
+        empty_map = BinaryMap(encodeBinaryMap([None]))
+        self.assertEqual(0, empty_map.totalMappings())
+        self.assertEqual(None, empty_map.name2Num("family"))
+
+    def testCollisions(self):
+        names = [None] + [("name%d" % i).encode() for i in range(1, 1000)]
+        binary_map = BinaryMap(encodeBinaryMap(names))
+        for num in range(1, 1000):
+            self.assertEqual(num, binary_map.name2Num("name%d" % num))
+            self.assertEqual("name%d" % num, binary_map.num2Name(num))
+        self.assertEqual(None, binary_map.name2Num("name1000"))
+
+    def testConvert(self):
+        num_map = NumerationMap(KB_PATH)
+        tmp_path = self.createTmpDir()
+        num_map.dump(tmp_path)
+        convertMapFormat(tmp_path)
+        self.assertEqual([BINARY_MAP_FILE_NAME], os.listdir(tmp_path))
+
+        binary_map = NumerationMap(tmp_path)
+        self.assertEqual(17, binary_map.totalMappings())
+        self.assertEqual(17, binary_map.maxNumeration())
+        self.assertEqual(set(num_map), set(binary_map))
+        for name in num_map:
+            self.assertEqual(num_map.name2Num(name), binary_map.name2Num(name))
+            self.assertEqual(name, binary_map.num2Name(binary_map.name2Num(name)))
+        self.assertEqual(sorted(num_map), sorted(name for name, _ in iterateMapEntries(tmp_path)))
+
+        convertMapFormat(tmp_path, binary=False)
+        self.assertEqual(["map1.tsv"], os.listdir(tmp_path))
+        text_map = NumerationMap(tmp_path)
+        self.assertEqual(num_map._numMap, text_map._numMap)
+
+    def testModify(self):
+        tmp_path = self.createTmpDir()
+        num_map = NumerationMap(KB_PATH)
+        num_map.unmapName("nataly")
+        num_map.unmapName("bob")
+        num_map.dump(tmp_path, binary=True, hashTable=False)
+
+        binary_map = NumerationMap(tmp_path)
+        self.assertEqual(17, binary_map.maxNumeration())
+        self.assertEqual(None, binary_map.name2Num("bob"))
+        self.assertEqual(4, binary_map.name2Num("alice"))
+        self.assertEqual([0, 5, 17], np.flatnonzero(~binary_map.mappedMask()).tolist())
+        self.assertEqual(5, binary_map.mapName("BOB"))
+        self.assertEqual([0, 17], np.flatnonzero(~binary_map.mappedMask()).tolist())
+        self.assertEqual(17, binary_map.mapName("NATALY"))
+        self.assertEqual(18, binary_map.mapName("olivia"))
+        self.assertEqual("BOB", binary_map.num2Name(5))
+        self.assertEqual(18, binary_map.totalMappings())
+
+        binary_map.dump(tmp_path, binary=True)
+        binary_map2 = NumerationMap(tmp_path)
+        self.assertEqual(18, binary_map2.maxNumeration())
+        self.assertEqual(18, binary_map2.name2Num("olivia"))
+        self.assertEqual("BOB", binary_map2.num2Name(5))
+
+        # Batch translation looks up the binary map in place until a name is added
+        self.assertEqual([18, 0], binary_map2.names2Nums(["olivia", "peter"], create=False).tolist())
+        self.assertEqual(["BOB", None], binary_map2.nums2Names(np.array([5, 30])))
+        self.assertIsNotNone(binary_map2._binaryMap)
+        self.assertEqual([19, 4], binary_map2.names2Nums(["peter", "alice"]).tolist())
+        self.assertIsNone(binary_map2._binaryMap)
+        self.assertEqual(["peter"], binary_map2.nums2Names(np.array([19])))
+
+    def testKb(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        tmp_path = self.createTmpDir()
+        kb.dump(tmp_path, binaryMap=True)
+        kb_path = os.path.join(tmp_path, KB_NAME)
+        self.assertFalse(any(fname.endswith(".tsv") for fname in os.listdir(kb_path)))
+
+        kb2 = NumeratedKb(KB_NAME, tmp_path, check=True)
+        self.assertEqual(17, kb2.totalMappings())
+        self.assertEqual(12, kb2.totalRecords())
+        self.assertTrue(kb2.hasNamedRecordInRelationByName("family", ("alice", "bob", "catherine")))
+        self.assertTrue(kb2.hasNamedRecordInRelationByNumeration(3, ("marvin", "nataly")))
+
+class JournalTest(unittest.TestCase):
+
+    global KB_NAME
+    global TMP_PATHS
+
+    def setUp(self):
+        self.basePath = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.basePath)
+        TMP_PATHS.append(self.basePath)
+        NumeratedKb(KB_NAME, MEM_DIR).dump(self.basePath)
+        self.kbPath = os.path.join(self.basePath, KB_NAME)
+
+    def edit(self, kb: NumeratedKb) -> None:
+        kb.addNamedRecord2RelationByName("mother", ("marvin", "olivia"))
+        kb.removeNumeratedRecordFromRelationByName("family", (4, 5, 6))
+        kb.deleteRelation(kb.name2Num("father"))
+        kb.unmapName("nataly")
+        kb.createRelation("sibling", 2)
+        kb.addNumeratedRecordArray("sibling", np.array([[4, 7], [7, 4], [4, 7]]))
+        kb.removeNumeratedRecordFromRelationByName("sibling", (7, 4))
+
+    def checkEdited(self, kb: NumeratedKb) -> None:
+        self.assertEqual(18, kb.totalMappings())
+        self.assertEqual(3, kb.totalRelations())
+        self.assertEqual(9, kb.totalRecords())
+        self.assertEqual(None, kb.name2Num("nataly"))
+        self.assertEqual(18, kb.name2Num("olivia"))
+        self.assertEqual(17, kb.name2Num("sibling"))
+        self.assertFalse(kb.hasRelationByName("father"))
+        self.assertTrue(kb.hasNamedRecordInRelationByName("mother", ("marvin", "olivia")))
+        self.assertFalse(kb.hasNumeratedRecordInRelationByName("family", (4, 5, 6)))
+        self.assertEqual(set([(4, 7)]), kb.getRelationByName("sibling").getRecordSet())
+
+    def testReplay(self):
+        kb = NumeratedKb(KB_NAME, self.basePath)
+        self.assertRaises(KbException, kb.commit)
+        self.assertRaises(KbException, NumeratedKb("empty").openJournal)
+        kb.openJournal()
+        self.edit(kb)
+        kb.commit()
+        self.assertEqual(set(["map1.tsv", "family_3_4.u16.rel", "mother_2_4.u16.rel", "father_2_4.u16.rel", JOURNAL_FILE_NAME]), set(os.listdir(self.kbPath)))
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath, check=True))
+
+        # Uncommitted changes are not persisted, and a torn entry is dropped
+        kb.addNumeratedRecord2RelationByName("sibling", (5, 8))
+        with open(getJournalFilePath(self.kbPath), 'ab') as ofd:
+            ofd.write(b'\x10\x00\x00\x00\x00')
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath))
+        kb2 = NumeratedKb(KB_NAME, self.basePath)
+        kb2.openJournal()
+        kb2.addNumeratedRecord2RelationByName("sibling", (5, 8))
+        kb2.commit()
+        self.assertEqual(10, NumeratedKb(KB_NAME, self.basePath).totalRecords())
+
+    def testCompact(self):
+        kb = NumeratedKb(KB_NAME, self.basePath)
+        kb.openJournal()
+        self.edit(kb)
+        kb.commit()
+        with open(getJournalFilePath(self.kbPath), 'rb') as ifd:
+            journal = ifd.read()
+        kb.compact()
+        self.assertEqual(set(["map1.tsv", "family_3_3.u16.rel", "mother_2_5.u16.rel", "sibling_2_1.u16.rel", JOURNAL_FILE_NAME]), set(os.listdir(self.kbPath)))
+        self.assertEqual(0, len(readJournal(getJournalFilePath(self.kbPath))[0]))
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath, check=True))
+
+        # The journal keeps logging after compaction
+        kb.unmapName("olivia")
+        kb.removeNamedRecordFromRelationByName("mother", ("marvin", "olivia"))
+        kb.commit()
+        self.assertEqual(17, NumeratedKb(KB_NAME, self.basePath).totalMappings())
+
+        # Replaying the journal again over compacted files, as after an interrupted compaction
+        with open(getJournalFilePath(self.kbPath), 'wb') as ofd:
+            ofd.write(journal)
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath, check=True))
+
+        # Creating a relation that is already in the files keeps its records
+        journal = KbJournal(getJournalFilePath(self.kbPath))
+        journal.logCreateRelation(kb.name2Num("mother"), 2)
+        journal.commit()
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath))
+
+    def testCompactBinaryMap(self):
+        NumeratedKb(KB_NAME, self.basePath).dump(self.basePath, binaryMap=True)
+        kb = NumeratedKb(KB_NAME, self.basePath)
+        kb.openJournal()
+        self.edit(kb)
+        kb.commit()
+        kb.compact()
+        self.assertIn(BINARY_MAP_FILE_NAME, os.listdir(self.kbPath))
+        self.assertFalse(any(fname.endswith(".tsv") for fname in os.listdir(self.kbPath)))
+        self.checkEdited(NumeratedKb(KB_NAME, self.basePath, check=True))
+
+    def testRenumberWithJournal(self):
+        kb = NumeratedKb("renumbered")
+        kb.mapName("unused")
+        kb.addNamedRecords2RelationByName("r", [("a", "b"), ("c", "d")])
+        kb.dump(self.basePath)
+        kb_path = os.path.join(self.basePath, "renumbered")
+        kb = NumeratedKb("renumbered", self.basePath)
+        kb.openJournal()
+        kb.addNamedRecord2RelationByName("r", ("c", "a"))
+        kb.commit()
+
+        # A crash after the renumbered files are written, before the journal is removed
+        journal_path = getJournalFilePath(kb_path)
+        remove = os.remove
+
+        def crashingRemove(path):
+            if journal_path == path and NumerationMap(kb_path).name2Num("unused") is None:
+                raise OSError("crash")
+            remove(path)
+
+        with unittest.mock.patch("os.remove", crashingRemove):
+            self.assertRaises(OSError, kb.tidyUp)
+        kb2 = NumeratedKb("renumbered", self.basePath, check=True)
+        self.assertEqual(None, kb2.name2Num("unused"))
+        self.assertEqual(1, kb2.totalRelations())
+        self.assertEqual(3, kb2.totalRecords())
+        self.assertEqual(
+            set([("a", "b"), ("c", "d"), ("c", "a")]), set(kb2.nums2Names(kb2.relationArray(kb2.name2Num("r"))))
+        )
+
+    def testReplayDeletedRelation(self):
+        kb = NumeratedKb(KB_NAME, self.basePath)
+        kb.openJournal()
+        kb.addNamedRecord2RelationByName("father", ("kyle", "lily"))
+        kb.removeNamedRecordFromRelationByName("father", ("kyle", "lily"))
+        kb.addNamedRecord2RelationByName("father", ("kyle", "lily"))
+        kb.deleteRelation(kb.name2Num("father"))
+        kb.createRelation("sibling", 2)
+        kb.addNamedRecord2RelationByName("sibling", ("alice", "bob"))
+        kb.removeNamedRecordFromRelationByName("sibling", ("alice", "bob"))
+        kb.commit()
+        with open(getJournalFilePath(self.kbPath), 'rb') as ifd:
+            journal = ifd.read()
+        kb.compact()
+        self.assertFalse(any(fname.startswith("father") for fname in os.listdir(self.kbPath)))
+
+        # Replaying the journal over compacted files, where the deleted and the empty relations have no files
+        with open(getJournalFilePath(self.kbPath), 'wb') as ofd:
+            ofd.write(journal)
+        kb2 = NumeratedKb(KB_NAME, self.basePath, check=True)
+        self.assertFalse(kb2.hasRelationByName("father"))
+        self.assertEqual(0, kb2.getRelationByName("sibling").totalRecords())
+        self.assertEqual(kb.totalRecords(), kb2.totalRecords())
+
 class KbRelationTest(unittest.TestCase):
     
     global KB_PATH
@@ -419,6 +727,43 @@ class KbRelationTest(unittest.TestCase):
 
         self.checkRecordSet(set([(4, 5, 6), (7, 8, 9), (0xa, 0xb, 0xc), (0xd, 0xe, 0xf), (4, 4, 4), (5, 5, 5)]), rel)
 
+        # Records from a generator
+        rel.addRecords((i, i, i) for i in (6, 7))
+        self.assertTrue(rel.hasRecord((7, 7, 7)))
+        self.assertEqual(8, rel.totalRecords())
+
+    def testSetAlgebra(self):
+        rng = np.random.default_rng(0)
+        for high in (10, 1 << 40):
+            left = set(map(tuple, rng.integers(1, high, size=(300, 3)).tolist()))
+            right = set(map(tuple, rng.integers(1, high, size=(200, 3)).tolist()))
+            right.update(list(left)[:50])
+            rel1 = KbRelation("r1", 1, 3)
+            rel1.addRecords(list(left))
+            rel2 = KbRelation("r2", 2, 3)
+            rel2.addRecords([(c, a, b) for a, b, c in right])
+            for permutation, other in (((1, 2, 0), right), (None, set((c, a, b) for a, b, c in right))):
+                self.assertEqual(left | other, rel1.union(rel2, permutation).getRecordSet())
+                self.assertEqual(left & other, rel1.intersect(rel2, permutation).getRecordSet())
+                self.assertEqual(left - other, rel1.difference(rel2, permutation).getRecordSet())
+                self.assertEqual(len(left | other), rel1.union(rel2, permutation, count=True))
+                self.assertEqual(len(left & other), rel1.intersect(rel2, permutation, count=True))
+                self.assertEqual(len(left - other), rel1.difference(rel2, permutation, count=True))
+
+        inverse = KbRelation("inverse", 3, 3)
+        inverse.addRecords([(c, b, a) for a, b, c in list(left)[:10]])
+        self.assertTrue(inverse.issubset(rel1, (2, 1, 0)))
+        self.assertFalse(inverse.issubset(rel1))
+        self.assertFalse(rel1.issubset(inverse, (2, 1, 0)))
+        self.assertTrue(KbRelation("empty", 4, 3).issubset(rel1))
+        self.assertEqual("both", rel1.intersect(inverse, (2, 1, 0), name="both").getName())
+        self.assertEqual(0, rel1.intersect(KbRelation("empty", 4, 3), count=True))
+
+        with self.assertRaises(KbException):
+            rel1.union(KbRelation("binary", 5, 2))
+        with self.assertRaises(KbException):
+            rel1.intersect(rel2, (0, 0, 1))
+
     def testRemoveRecord(self):
         rel = KbRelation("family", 0, 3, 4, KB_PATH)
         rel.removeRecord((4, 4, 4))
@@ -643,6 +988,121 @@ class NumeratedKbTest(unittest.TestCase):
         self.assertTrue(kb2.hasNumeratedRecordInRelationByNumeration(3, (11, 12)))
         self.assertTrue(kb2.hasNumeratedRecordInRelationByNumeration(3, (16, 17)))
 
+    def testIncrementalWrite(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        TMP_PATHS.append(tmp_path)
+        kb_path = os.path.join(tmp_path, KB_NAME)
+        kb.dump(tmp_path)
+        kb = NumeratedKb(KB_NAME, tmp_path)
+        self.assertEqual(set(["map1.tsv", "family_3_4.u16.rel", "mother_2_4.u16.rel", "father_2_4.u16.rel"]), set(os.listdir(kb_path)))
+
+        # Unchanged files are not rewritten
+        mtimes = dict((fname, os.stat(os.path.join(kb_path, fname)).st_mtime_ns) for fname in os.listdir(kb_path))
+        for fname in mtimes:
+            os.utime(os.path.join(kb_path, fname), ns=(1, 1))
+        kb.addNamedRecord2RelationByName("mother", ("marvin", "olivia"))
+        kb.addNumeratedRecord2RelationByName("family", (4, 5, 6))
+        kb.deleteRelation(kb.name2Num("father"))
+        kb.dump(tmp_path)
+        self.assertEqual(set(["map1.tsv", "family_3_4.u16.rel", "mother_2_5.u16.rel"]), set(os.listdir(kb_path)))
+        self.assertEqual(1, os.stat(os.path.join(kb_path, "family_3_4.u16.rel")).st_mtime_ns)
+        self.assertNotEqual(1, os.stat(os.path.join(kb_path, "map1.tsv")).st_mtime_ns)
+
+        kb2 = NumeratedKb(KB_NAME, tmp_path, check=True)
+        self.assertEqual(2, kb2.totalRelations())
+        self.assertEqual(9, kb2.totalRecords())
+        self.assertTrue(kb2.hasNamedRecordInRelationByName("mother", ("marvin", "olivia")))
+        self.assertEqual(18, kb2.name2Num("olivia"))
+
+        # A superseded file left by an interrupted dump is ignored
+        with open(getRelFilePath(kb_path, "family", 3, 1), 'wb') as ofd:
+            ofd.write(struct.pack("<iii", 4, 5, 6))
+        os.utime(os.path.join(kb_path, "family_3_1.rel"), ns=(0, 0))
+        self.assertEqual(9, NumeratedKb(KB_NAME, tmp_path).totalRecords())
+        os.remove(os.path.join(kb_path, "family_3_1.rel"))
+
+        # Only the map shards with changes are rewritten
+        kb2.dump(tmp_path)
+        kb2.mapName("paul")
+        kb2.getNumerationMap().dump(kb_path, maxEntries=5)
+        self.assertEqual(set(["map%d.tsv" % i for i in range(1, 5)]), set(fname for fname in os.listdir(kb_path) if fname.endswith(".tsv")))
+        for i in range(1, 5):
+            os.utime(os.path.join(kb_path, "map%d.tsv" % i), ns=(1, 1))
+        kb2.unmapName("bob")
+        kb2.getNumerationMap().dump(kb_path, maxEntries=5)
+        self.assertEqual([False, True, True, True], [
+            1 == os.stat(os.path.join(kb_path, "map%d.tsv" % i)).st_mtime_ns for i in range(1, 5)
+        ])
+        with open(os.path.join(kb_path, "map1.tsv"), 'r') as ifd:
+            self.assertEqual(["family\t1\n", "mother\t2\n", "father\t3\n", "alice\t4\n"], ifd.readlines())
+        self.assertEqual(None, NumerationMap(kb_path).name2Num("bob"))
+        self.assertEqual(19, NumerationMap(kb_path).name2Num("paul"))
+
+    def testTidyUp(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        kb.deleteRelation(kb.name2Num("father"))
+        kb.removeNamedRecordFromRelationByName("family", ("diana", "erick", "frederick"))
+        kb.removeNamedRecordFromRelationByName("mother", ("diana", "frederick"))
+        kb.createRelation("sibling", 2)
+        kb.mapName("unused")
+        translation = kb.tidyUp()
+
+        # family, mother, and 9 entities remain; 'father', 'diana', 'erick', 'frederick', 'marvin', 'nataly', 'unused'
+        # are removed
+        self.assertEqual([0, 1, 2, 0, 3, 4, 5, 0, 0, 0, 6, 7, 8, 9, 10, 11, 0, 0, 12, 0], translation.tolist())
+        self.assertEqual(12, kb.totalMappings())
+        self.assertEqual(12, kb.getNumerationMap().maxNumeration())
+        self.assertEqual(None, kb.name2Num("diana"))
+        self.assertEqual(12, kb.name2Num("sibling"))
+        self.assertEqual(3, kb.totalRelations())
+        self.assertEqual(6, kb.totalRecords())
+        self.assertTrue(kb.hasNamedRecordInRelationByName("family", ("alice", "bob", "catherine")))
+        self.assertTrue(kb.hasNumeratedRecordInRelationByNumeration(1, (3, 4, 5)))
+        self.assertTrue(kb.hasNamedRecordInRelationByName("mother", ("jena", "lily")))
+        self.assertEqual(12, kb.getRelationByName("sibling").getNumeration())
+        self.assertEqual([[3, 5], [6, 8], [9, 11]], sorted(kb.relationArray(2).tolist()))
+
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        TMP_PATHS.append(tmp_path)
+        kb.dump(tmp_path)
+        kb2 = NumeratedKb(KB_NAME, tmp_path, check=True)
+        self.assertEqual(12, kb2.totalMappings())
+        self.assertEqual(6, kb2.totalRecords())
+        self.assertTrue(kb2.hasNamedRecordInRelationByName("family", ("jena", "kyle", "lily")))
+
+        # Empty relations are not dumped, so only the name of 'sibling' is left to remove
+        self.assertEqual(list(range(12)) + [0], kb2.tidyUp().tolist())
+        self.assertEqual(list(range(12)), kb2.tidyUp().tolist())
+        kb2.getRelationByName("mother").addRecord((3, 100))
+        self.assertRaises(KbException, kb2.tidyUp)
+
+    def testRenumberByDegree(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        kb.addNamedRecord2RelationByName("father", ("kyle", "lily"))
+        translation = kb.renumberByDegree()
+
+        # 'father' has the most records; 'catherine', 'frederick', 'isaac', 'lily' occur three times; 'kyle' twice
+        self.assertEqual([0, 2, 3, 1, 8, 9, 4, 10, 11, 5, 12, 13, 6, 14, 15, 7, 16, 17], translation.tolist())
+        self.assertEqual(17, kb.totalMappings())
+        self.assertEqual(1, kb.name2Num("father"))
+        self.assertEqual(4, kb.name2Num("catherine"))
+        self.assertEqual(1, kb.getRelationByName("father").getNumeration())
+        self.assertTrue(kb.hasNamedRecordInRelationByName("father", ("kyle", "lily")))
+        self.assertTrue(kb.hasNamedRecordInRelationByName("family", ("alice", "bob", "catherine")))
+        self.assertTrue(kb.hasNumeratedRecordInRelationByNumeration(2, (8, 9, 4)))
+
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        TMP_PATHS.append(tmp_path)
+        kb.dump(tmp_path)
+        kb2 = NumeratedKb(KB_NAME, tmp_path, check=True)
+        self.assertEqual(13, kb2.totalRecords())
+        self.assertTrue(kb2.hasNamedRecordInRelationByName("mother", ("jena", "lily")))
+        self.assertEqual(list(range(18)), kb2.renumberByDegree().tolist())
+
     def testCreateRelation(self):
         kb = NumeratedKb(KB_NAME, MEM_DIR)
         relation = kb.createRelation("rel", 2)
@@ -699,6 +1159,167 @@ class NumeratedKbTest(unittest.TestCase):
         with self.assertRaises(KbException):
             relation = kb.loadRelation(MEM_DIR, "reflex2", 2, 3, True)
 
+    def testIdWidth(self):
+        tmp_path = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(tmp_path)
+        TMP_PATHS.append(tmp_path)
+        for width, records in ((2, [(1, 0xFFFF), (2, 3)]), (4, [(1, 0x10000)]), (8, [(1, 2 ** 40), (2 ** 33, 5)])):
+            relation = KbRelation("wide", 1, 2)
+            relation.addRecords(records)
+            path = relation.dump(tmp_path)
+            self.assertEqual(getRelFilePath(tmp_path, "wide", 2, len(records), width), path)
+            self.assertEqual(2 * len(records) * width, os.path.getsize(path))
+            self.assertEqual(path, findRelFilePath(tmp_path, "wide", 2, len(records)))
+            self.assertEqual(set(records), KbRelation("wide", 1, 2, len(records), tmp_path).getRecordSet())
+            values = readRelFile(path)
+            self.assertEqual(np.int64 if 8 == width else np.int32, values.dtype)
+            self.assertEqual(set(records), set(map(tuple, values.tolist())))
+            os.remove(path)
+
+        # Widths change with the ids when the KB is dumped again
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        kb.dump(tmp_path)
+        kb_path = os.path.join(tmp_path, KB_NAME)
+        self.assertTrue(os.path.isfile(getRelFilePath(kb_path, "mother", 2, 4, 2)))
+        kb.getRelationByName("mother").addRecord((4, 0x10000))
+        kb.dump(tmp_path)
+        self.assertFalse(os.path.isfile(getRelFilePath(kb_path, "mother", 2, 4, 2)))
+        self.assertTrue(os.path.isfile(getRelFilePath(kb_path, "mother", 2, 5, 4)))
+        kb2 = NumeratedKb(KB_NAME, tmp_path)
+        self.assertTrue(kb2.hasNumeratedRecordInRelationByName("mother", (4, 0x10000)))
+        self.assertEqual(np.int32, kb2.relationArray(kb2.name2Num("mother")).dtype)
+
+    def testMatch(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        kb.addNumeratedRecords2RelationByName("family", [(4, 8, 9), (4, 5, 7), (7, 5, 6)])
+        rows = lambda records: sorted(map(tuple, np.asarray(records).tolist()))
+        self.assertEqual([(4, 5, 6), (4, 5, 7), (4, 8, 9)], rows(kb.match("family", (4, None, None))))
+        self.assertEqual([(4, 5, 6), (4, 5, 7), (7, 5, 6)], rows(kb.match(1, (None, 5, None))))
+        self.assertEqual([(4, 5, 6), (7, 5, 6)], rows(kb.match("family", (None, 5, 6))))
+        self.assertEqual(
+            [(4, 5, 6), (4, 5, 7), (4, 8, 9), (7, 5, 6), (7, 8, 9)], rows(kb.match("family", (slice(None, 8), None, None)))
+        )
+        self.assertEqual([(7, 5, 6), (7, 8, 9)], rows(kb.match("family", (slice(5, 10), slice(5, None), slice(6, 10)))))
+        self.assertEqual([], rows(kb.match("family", (5, None, None))))
+        self.assertEqual(7, len(kb.match("family", (None, None, None))))
+        self.assertEqual((0, 3), kb.match("family", (100, None, None)).shape)
+
+        # Indexes give the same results and follow the changes
+        relation = kb.getRelationByName("family")
+        self.assertEqual(set([0]), relation.indexedColumns())
+        kb.createIndex("family", 1)
+        self.assertEqual(set([0, 1]), relation.indexedColumns())
+        self.assertEqual([(4, 5, 6), (4, 5, 7), (7, 5, 6)], rows(kb.match(1, (None, 5, None))))
+        self.assertEqual([(4, 5, 7)], rows(kb.match(1, (4, 5, 7))))
+        kb.removeNumeratedRecordFromRelationByName("family", (4, 5, 7))
+        kb.addNumeratedRecord2RelationByName("family", (0xd, 5, 6))
+        self.assertEqual([(4, 5, 6), (7, 5, 6), (0xd, 5, 6)], rows(kb.match(1, (None, 5, None))))
+        self.assertEqual([(4, 5, 6), (7, 5, 6), (0xd, 5, 6)], sorted(kb.iterMatch("family", (None, 5, None))))
+        relation.dropIndex(1)
+        self.assertEqual([(7, 5, 6), (0xd, 5, 6)], rows(kb.match(1, (slice(5, None), 5, None))))
+
+        with self.assertRaises(KbException):
+            kb.match("family", (4, None))
+        with self.assertRaises(KbException):
+            kb.iterMatch("family", (4, None))
+        with self.assertRaises(KbException):
+            kb.match("nobody", (4, None))
+        with self.assertRaises(KbException):
+            kb.createIndex("family", 3)
+
+        # Lazy iteration over several batches
+        relation = KbRelation("large", 1, 2)
+        relation.addRecords([(i % 3, i) for i in range(10000)])
+        relation.createIndex(1)
+        self.assertEqual([(i % 3, i) for i in range(1, 10000, 3)], list(relation.iterMatch((1, None))))
+        self.assertEqual(9000, sum(1 for _ in relation.iterMatch((None, slice(1000, None)))))
+
+    def testNamedRecords(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        kb.addNamedRecords2RelationByName("sibling", [("alice", "zoe"), ("zoe", "yann"), ("alice", "zoe")])
+        self.assertEqual(18, kb.name2Num("sibling"))
+        self.assertEqual(set([(4, 19), (19, 20)]), kb.getRelationByName("sibling").getRecordSet())
+        kb.addNamedRecords2RelationByNumeration(18, (record for record in [("yann", "xena")]))
+        self.assertEqual(
+            [True, True, False, False],
+            kb.hasNamedRecords("sibling", [("alice", "zoe"), ("yann", "xena"), ("zoe", "alice"), ("zoe", "nobody")]).tolist()
+        )
+        self.assertEqual(None, kb.name2Num("nobody"))
+        self.assertEqual([False], kb.hasNamedRecords("nothing", [("alice", "zoe")]).tolist())
+        self.assertEqual([("alice", "zoe")], kb.nums2Names(kb.match("sibling", (4, None))))
+        self.assertEqual([4, 0], kb.names2Nums(["alice", "nobody"], False).tolist())
+
+        # No name is mapped if the arity of a record does not match
+        with self.assertRaises(KbException):
+            kb.addNamedRecords2RelationByName("sibling", [("alice", "wendy"), ("wendy",)])
+        self.assertEqual(None, kb.name2Num("wendy"))
+        with self.assertRaises(KbException):
+            kb.hasNamedRecords("sibling", [("alice",)])
+
+        # Nor is a new relation created
+        with self.assertRaises(KbException):
+            kb.addNamedRecords2RelationByName("cousin", [("alice", "wendy"), ("wendy",)])
+        self.assertFalse(kb.hasRelationByName("cousin"))
+        self.assertEqual(None, kb.name2Num("cousin"))
+        kb.addNamedRecords2RelationByName("cousin", (record for record in [("alice", "wendy")]))
+        self.assertTrue(kb.hasNamedRecordInRelationByName("cousin", ("alice", "wendy")))
+
+    def testRecordArray(self):
+        kb = NumeratedKb(KB_NAME, MEM_DIR)
+        family = kb.getRelationByName("family")
+        self.assertEqual(
+            [True, False, True, False],
+            kb.hasNumeratedRecordArray("family", np.array([[4, 5, 6], [4, 5, 8], [7, 8, 9], [0, 0, 0]])).tolist()
+        )
+        self.assertEqual([False, False], kb.hasNumeratedRecordArray("nobody", np.array([[4, 5], [6, 7]])).tolist())
+        self.assertEqual(2, kb.addNumeratedRecordArray(family.getNumeration(), np.array([
+            [4, 5, 6], [9, 8, 7], [7, 8, 9], [9, 8, 7], [9, 9, 9]
+        ])))
+        self.assertEqual(6, family.totalRecords())
+        self.assertTrue(kb.hasNumeratedRecordInRelationByName("family", (9, 8, 7)))
+        self.assertEqual([True, True], kb.hasNumeratedRecordArray("family", np.array([[9, 8, 7], [9, 9, 9]])).tolist())
+        self.assertEqual(0, kb.addNumeratedRecordArray("family", np.zeros((0, 3), dtype=np.int32)))
+
+        # New relations are created by name
+        self.assertEqual(2, kb.addNumeratedRecordArray("sibling", np.array([[4, 7], [7, 4], [4, 7]])))
+        self.assertEqual(set([(4, 7), (7, 4)]), kb.getRelationByName("sibling").getRecordSet())
+
+        # Nothing is added if a numeration is not mapped
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray("family", np.array([[4, 5, 6], [4, 5, 1000]]))
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray("brother", np.array([[4, 0]]))
+        self.assertEqual(6, family.totalRecords())
+        self.assertFalse(kb.hasRelationByName("brother"))
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray("family", np.array([[4, 5]]))
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray(1000, np.array([[4, 5]]))
+        with self.assertRaises(KbException):
+            kb.hasNumeratedRecordArray("family", np.array([4, 5, 6]))
+
+        # The check follows the changes of the map between batches
+        free_num = kb.unmapName("marvin")
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray("family", np.array([[4, 5, free_num]]))
+        new_num = kb.mapName("olivia")
+        self.assertEqual(free_num, new_num)
+        self.assertEqual(1, kb.addNumeratedRecordArray("family", np.array([[4, 5, new_num]])))
+        kb.unmapName("olivia")
+        with self.assertRaises(KbException):
+            kb.addNumeratedRecordArray("family", np.array([[4, new_num, 5]]))
+
+        # Keys too wide for the mixed radix are coded by rank
+        relation = KbRelation("wide", 1, 4)
+        relation.addArray(np.array([[1 << 40, 1, 2, 3], [5, 1 << 40, 2, 3]], dtype=np.int64))
+        self.assertEqual(
+            [False, True, True],
+            relation.hasRecords(np.array([[1 << 40, 1, 2, 4], [1 << 40, 1, 2, 3], [5, 1 << 40, 2, 3]])).tolist()
+        )
+        keys = encodeRecordKeys([np.array([[1 << 40, 0], [2, 1 << 40], [2, 3]])] * 2)
+        self.assertEqual([2, 1, 0], np.argsort(keys[0]).tolist())
+        self.assertEqual(keys[0].tolist(), keys[1].tolist())
+
     def testDeleteRelation(self):
         kb = NumeratedKb(KB_NAME, MEM_DIR)
 
@@ -0,0 +1,90 @@
+import unittest
+import uuid
+from relcodec import *
+from numeratedkb import *
+import shutil
+
+MEM_DIR = "/dev/shm"
+
+class VarintTest(unittest.TestCase):
+
+    def testRoundTrip(self):
+        values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 32 - 1, 2 ** 63], dtype=np.uint64)
+        encoded = encodeVarints(values)
+        self.assertEqual([0, 1, 0x7f, 0x80, 0x01], encoded[:5].tolist())
+        self.assertEqual(1 + 1 + 1 + 2 + 2 + 2 + 3 + 5 + 10, encoded.size)
+        self.assertEqual(values.tolist(), decodeVarints(encoded).tolist())
+
+    def testEmpty(self):
+        self.assertEqual(0, encodeVarints(np.zeros(0, dtype=np.uint64)).size)
+        self.assertEqual(0, decodeVarints(np.zeros(0, dtype=np.uint8)).size)
+
+    def testTruncated(self):
+        self.assertRaises(KbException, decodeVarints, np.array([0x01, 0x80], dtype=np.uint8))
+
+class CompressedRelationTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.records = np.unique(rng.integers(1, 5000, size=(1000, 3), dtype=np.int64), axis=0).astype('<i4')
+        rng.shuffle(self.records)
+        self.dir = os.path.join(MEM_DIR, str(uuid.uuid4()))
+        os.mkdir(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRoundTrip(self):
+        content = encodeRelation(self.records, 64)
+        self.assertGreater(self.records.nbytes, len(content))
+        relation = CompressedRelation("memory", content)
+        self.assertEqual(3, relation.arity)
+        self.assertEqual(self.records.shape[0], relation.records)
+        self.assertEqual((self.records.shape[0] + 63) // 64, relation.totalBlocks())
+        decoded = relation.read()
+        self.assertEqual(np.dtype('<i4'), decoded.dtype)
+        self.assertTrue(np.array_equal(sortRecords(self.records), decoded))
+        self.assertTrue(np.array_equal(decoded[64:128], relation.readBlock(1)))
+        self.assertEqual(relation.totalBlocks(), len(list(relation.iterBlocks())))
+
+    def testSubjectRange(self):
+        relation = CompressedRelation("memory", encodeRelation(self.records, 32))
+        expected = sortRecords(self.records)
+        for low, high in ((1, 5000), (1000, 1001), (2500, 2600), (0, 1), (4999, 6000), (3000, 2000)):
+            subjects = expected[:, 0]
+            self.assertTrue(np.array_equal(
+                expected[(subjects >= low) & (subjects < high)], relation.readSubjects(low, high)
+            ), (low, high))
+
+    def testEmptyAndUnary(self):
+        relation = CompressedRelation("memory", encodeRelation(np.zeros((0, 2), dtype='<i4')))
+        self.assertEqual(0, relation.totalBlocks())
+        self.assertEqual((0, 2), relation.read().shape)
+        self.assertEqual((0, 2), relation.readSubjects(0, 10).shape)
+        unary = np.array([[7], [3], [2 ** 31 - 1]], dtype='<i4')
+        self.assertEqual([[3], [7], [2 ** 31 - 1]], CompressedRelation("memory", encodeRelation(unary)).read().tolist())
+
+    def testFiles(self):
+        kb = NumeratedKb("family")
+        kb.addNamedRecords2RelationByName("mother", [("alice", "catherine"), ("diana", "frederick"), ("gabby", "isaac")])
+        kb.dump(self.dir)
+        kb_path = os.path.join(self.dir, "family")
+        path = compressRelationFile(kb_path, "mother", 2, 3)
+        self.assertEqual(getCompressedRelFilePath(kb_path, "mother", 2, 3), path)
+        self.assertEqual(("mother", 2, 3), parseCompressedRelFilePath(path))
+        with CompressedRelation(path) as relation:
+            self.assertEqual(1, len(relation.readSubjects(kb.name2Num("diana"), kb.name2Num("diana") + 1)))
+        original = KbRelation("mother", 0, 2, 3, kb_path).getRecordSet()
+        os.remove(findRelFilePath(kb_path, "mother", 2, 3))
+        decompressRelationFile(kb_path, "mother", 2, 3)
+        self.assertEqual(original, KbRelation("mother", 0, 2, 3, kb_path).getRecordSet())
+        raw_size, compressed_size, records, _ = benchmark(kb_path)
+        self.assertEqual(12, raw_size)
+        self.assertEqual(3, records)
+
+    def testNotCompressed(self):
+        self.assertRaises(KbException, CompressedRelation, "memory", b"RELZ")
+        self.assertRaises(KbException, CompressedRelation, "memory", b"\x00" * 64)
+
+if __name__ == '__main__':
+    unittest.main()